@@ -0,0 +1,413 @@
+# app/benchmark.py
+"""
+Reproducible benchmarks of the replay and persistence hot paths.
+
+Usage:
+    python -m app.benchmark run --out before.json
+    python -m app.benchmark run --out after.json --database-url postgresql://...
+    python -m app.benchmark compare before.json after.json
+
+Hands come from app/handgen.py with a fixed seed, sorted into corpora of one
+shape each: fold-outs, multi-street showdowns, all-in showdowns with side
+pots, and mixed hands at every table size from 2 to 6 players. Every corpus
+is replayed with compute_payoffs_using_pokerkit and with compute_payoffs
+(the settlement fast path); POST /hands and GET /hands are then driven
+through the whole ASGI app in process, against an in-memory repository and,
+with --database-url, against PostgreSQL (in a throwaway schema). The read.*
+benchmarks time the Python side of a GET /hands page: decoding JSONB rows
+and encoding them again against passing through the JSON PostgreSQL built.
+
+Each benchmark reports throughput and latency percentiles. Results are JSON
+keyed by benchmark name, and ``compare`` exits with status 1 when any
+benchmark's throughput dropped, or its p99 latency grew, by more than
+--threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+
+from . import fastjson
+from .fastjson import hand_record, hand_record_json
+from .handgen import GeneratedHand, generate_hand
+from .models_entity import HandEntity
+from .poker_service import compute_payoffs, compute_payoffs_using_pokerkit
+from .repository import HandRepository
+
+RESULTS_VERSION = 1
+# hands posted before the timed POST /hands run (a hand posted twice would
+# be answered from the idempotency cache)
+WARMUP_HANDS = 10
+
+
+# --- corpora ----------------------------------------------------------------
+
+
+def _all_in(g: GeneratedHand) -> bool:
+    # somebody lost the whole stack, so somebody was all-in
+    return any(p["winnings"] == -p["stack"] for p in g.payload["players"])
+
+
+def _side_pots(g: GeneratedHand) -> bool:
+    stacks = {p["stack"] for p in g.payload["players"]}
+    return g.showdown and _all_in(g) and len(g.payload["players"]) >= 3 and len(stacks) > 1
+
+
+# name -> (generate_hand keyword arguments, predicate the hands must satisfy)
+CORPORA: dict[str, tuple[dict, Callable[[GeneratedHand], bool]]] = {
+    "foldout": ({"fold_p": 0.6}, lambda g: not g.showdown),
+    "showdown": (
+        {"fold_p": 0.1, "raise_p": 0.3, "all_in_p": 0.0, "short_stack_p": 0.0},
+        lambda g: g.showdown and len(g.payload["communityCards"]) == 5 and not _all_in(g),
+    ),
+    "side_pots": (
+        {"fold_p": 0.1, "raise_p": 0.4, "all_in_p": 0.5, "short_stack_p": 0.5},
+        _side_pots,
+    ),
+    **{f"players_{n}": ({"num_players": n}, lambda g: True) for n in range(2, 7)},
+}
+
+
+def build_corpus(name: str, size: int, seed: int = 1) -> list[GeneratedHand]:
+    """The first ``size`` generated hands of the corpus's shape; the same for a given seed."""
+    kwargs, keep = CORPORA[name]
+    rng = random.Random(f"{seed}:{name}")
+    hands = []
+    while len(hands) < size:
+        g = generate_hand(rng, **kwargs)
+        if keep(g):
+            hands.append(g)
+    return hands
+
+
+# --- measuring --------------------------------------------------------------
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(latencies: list[float], wall: float, unit: str = "hands") -> dict:
+    """Throughput and latency percentiles (in milliseconds) of timed calls."""
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "unit": unit,
+        "per_sec": len(ordered) / wall,
+        "p50_ms": _percentile(ordered, 0.50) * 1e3,
+        "p95_ms": _percentile(ordered, 0.95) * 1e3,
+        "p99_ms": _percentile(ordered, 0.99) * 1e3,
+        "max_ms": ordered[-1] * 1e3,
+    }
+
+
+def measure(fn: Callable, items: Iterable, warmup: int = 10, unit: str = "hands") -> dict:
+    """Calls ``fn`` on every item once, timing each call, after ``warmup`` untimed calls."""
+    items = list(items)
+    for item in items[:warmup]:
+        fn(item)
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started, unit)
+
+
+def bench_replay(corpora: dict[str, list[GeneratedHand]]) -> dict:
+    results = {}
+    for name, hands in corpora.items():
+        payloads = [g.payload for g in hands]
+        results[f"replay.pokerkit.{name}"] = measure(compute_payoffs_using_pokerkit, payloads)
+        results[f"replay.fast.{name}"] = measure(compute_payoffs, payloads)
+    return results
+
+
+class MemoryHandRepository(HandRepository):
+    """The repository methods POST and GET /hands use, kept in a dict."""
+
+    def __init__(self):
+        self._hands: dict[str, HandEntity] = {}
+        self._newest_last: list[HandEntity] = []
+
+    def save(self, hand: HandEntity) -> HandEntity:
+        hand.created_at = datetime.now(timezone.utc)
+        self._hands[str(hand.id)] = hand
+        self._newest_last.append(hand)
+        return hand
+
+    def find_existing(self, hand_ids) -> dict[str, HandEntity]:
+        return {key: self._hands[key] for key in hand_ids if key in self._hands}
+
+    def get(self, hand_id: str) -> HandEntity | None:
+        return self._hands.get(hand_id)
+
+    def list_page(self, limit, after=None, filters=None) -> list[HandEntity]:
+        ordered = self._newest_last[::-1]
+        if after is not None:
+            ordered = [h for h in ordered if (h.created_at, h.id) < after]
+        return ordered[:limit]
+
+    def list_page_json(self, limit, after=None, filters=None) -> list[tuple[str, datetime, bytes]]:
+        return [(h.id, h.created_at, hand_record_json(h)) for h in self.list_page(limit, after)]
+
+    def get_json(self, hand_id: str) -> bytes | None:
+        h = self.get(hand_id)
+        return hand_record_json(h) if h is not None else None
+
+
+def _wire_rows(hands: list[GeneratedHand]) -> list[tuple[str, bytes, bytes, bytes]]:
+    """
+    Per hand, its id and what PostgreSQL sends for the payload and payoffs JSONB
+    columns and for the json_build_object record of app/repository.py, in
+    the spacing PostgreSQL writes them.
+    """
+    rows = []
+    created_at = datetime.now(timezone.utc).isoformat()
+    for g in hands:
+        payload, payoffs = json.dumps(g.payload), json.dumps(g.payoffs)
+        record = (
+            f'{{"id" : "{g.payload["id"]}", "payload" : {payload}, '
+            f'"payoffs" : {payoffs}, "created_at" : "{created_at}"}}'
+        )
+        rows.append((g.payload["id"], payload.encode(), payoffs.encode(), record.encode()))
+    return rows
+
+
+def bench_read(hands: list[GeneratedHand], page_size: int = 100) -> dict:
+    """
+    The Python side of a GET /hands page, from the rows psycopg2 receives
+    to the response body:
+
+    - read.decode: JSONB decoded into dicts (as psycopg2 does), rebuilt into
+      records and encoded again as JSONResponse does;
+    - read.fastjson: the same, encoded with app/fastjson.py instead;
+    - read.passthrough: the records built by PostgreSQL, joined unchanged.
+    """
+    from fastapi.responses import JSONResponse
+
+    created_at = datetime.now(timezone.utc)
+    wire = _wire_rows(hands)
+    pages = [wire[i : i + page_size] for i in range(0, len(wire) - page_size + 1, page_size)]
+
+    def records(page):
+        return [
+            hand_record(
+                HandEntity(
+                    id=hand_id,
+                    payload_json=json.loads(payload.decode()),
+                    payoffs_json=json.loads(payoffs.decode()),
+                    created_at=created_at,
+                )
+            )
+            for hand_id, payload, payoffs, _ in page
+        ]
+
+    return {
+        "read.decode.page": measure(lambda page: JSONResponse(records(page)).body, pages, unit="pages"),
+        "read.fastjson.page": measure(lambda page: fastjson.dumps(records(page)), pages, unit="pages"),
+        "read.passthrough.page": measure(
+            lambda page: fastjson.json_array(record for *_, record in page), pages, unit="pages"
+        ),
+    }
+
+
+def bench_http(repository: HandRepository, hands: list[GeneratedHand], label: str, pages: int) -> dict:
+    """
+    POSTs every hand to /hands (the first WARMUP_HANDS untimed), then GETs
+    the first page of /hands ``pages`` times, through the ASGI app.
+    """
+    from fastapi.testclient import TestClient
+    from .main import app, get_repository, hand_cache, result_cache
+
+    hand_cache.clear()
+    result_cache.clear()
+    previous = app.dependency_overrides.get(get_repository)
+    app.dependency_overrides[get_repository] = lambda: repository
+    client = TestClient(app)
+
+    def post(payload):
+        response = client.post("/hands", json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"POST /hands answered {response.status_code}: {response.text}")
+
+    def get(_):
+        response = client.get("/hands", params={"limit": 100})
+        if response.status_code != 200:
+            raise RuntimeError(f"GET /hands answered {response.status_code}: {response.text}")
+
+    try:
+        for g in hands[:WARMUP_HANDS]:
+            post(g.payload)
+        results = {
+            f"http.{label}.post_hands": measure(
+                post, [g.payload for g in hands[WARMUP_HANDS:]], warmup=0
+            ),
+            f"http.{label}.get_hands": measure(get, range(pages), unit="pages"),
+        }
+    finally:
+        if previous is None:
+            del app.dependency_overrides[get_repository]
+        else:
+            app.dependency_overrides[get_repository] = previous
+    return results
+
+
+def bench_postgres(db_url: str, hands: list[GeneratedHand], pages: int) -> dict:
+    from .db import ConnectionPool
+    from .migrate import create_scratch_schema, drop_schema
+
+    schema, dsn = create_scratch_schema(db_url, prefix="bench")
+    pool = ConnectionPool(dsn, minconn=1, maxconn=2)
+    try:
+        return bench_http(HandRepository(pool=pool), hands, "postgres", pages)
+    finally:
+        pool.close()
+        drop_schema(db_url, schema)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    size: int = 200,
+    seed: int = 1,
+    http_hands: int = 500,
+    pages: int = 200,
+    db_url: str | None = None,
+    corpora: list[str] | None = None,
+    read_rows: int = 10000,
+) -> dict:
+    """Runs every benchmark and returns the results document."""
+    names = corpora or list(CORPORA)
+    built = {name: build_corpus(name, size, seed) for name in names}
+    rng = random.Random(f"{seed}:http")
+    mixed = [generate_hand(rng) for _ in range(WARMUP_HANDS + http_hands)]
+
+    results = bench_replay(built)
+    results.update(bench_read((mixed * (read_rows // len(mixed) + 1))[:read_rows]))
+    results.update(bench_http(MemoryHandRepository(), mixed, "memory", pages))
+    if db_url:
+        results.update(bench_postgres(db_url, mixed, pages))
+    return {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "corpus_size": size,
+            "http_hands": http_hands,
+            "pages": pages,
+            "read_rows": read_rows,
+        },
+        "results": results,
+    }
+
+
+def compare(base: dict, new: dict, threshold: float = 0.1) -> tuple[list[str], list[str]]:
+    """
+    Lines describing each benchmark both documents have, and the names of
+    those that regressed: throughput down, or p99 latency up, by more than
+    ``threshold`` (a fraction).
+    """
+    lines, regressions = [], []
+    for name in sorted(base["results"].keys() & new["results"].keys()):
+        old, cur = base["results"][name], new["results"][name]
+        speed = cur["per_sec"] / old["per_sec"] - 1
+        tail = cur["p99_ms"] / old["p99_ms"] - 1 if old["p99_ms"] else 0.0
+        regressed = speed < -threshold or tail > threshold
+        if regressed:
+            regressions.append(name)
+        lines.append(
+            f"{'REGRESSED ' if regressed else ''}{name}: "
+            f"{old['per_sec']:,.0f} -> {cur['per_sec']:,.0f} {cur['unit']}/s ({speed:+.1%}), "
+            f"p99 {old['p99_ms']:.2f} -> {cur['p99_ms']:.2f} ms ({tail:+.1%})"
+        )
+    return lines, regressions
+
+
+def _print_results(document: dict):
+    for name, r in document["results"].items():
+        print(
+            f"{name:34} {r['per_sec']:>10,.0f} {r['unit']}/s  "
+            f"p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  max {r['max_ms']:7.2f} ms"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--out", help="write the results JSON here")
+    run_parser.add_argument("--size", type=int, default=200, help="hands per corpus")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--http-hands", type=int, default=500, help="hands posted per repository")
+    run_parser.add_argument("--pages", type=int, default=200, help="GET /hands pages per repository")
+    run_parser.add_argument("--read-rows", type=int, default=10000,
+                            help="rows serialized by the read.* benchmarks")
+    run_parser.add_argument("--corpus", action="append", choices=list(CORPORA),
+                            help="only these corpora (repeatable)")
+    run_parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                            help="also benchmark against this PostgreSQL (throwaway schema)")
+    compare_parser = sub.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="allowed slowdown, as a fraction")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        lines, regressions = compare(base, new, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+        return 0
+
+    # per-hand log lines would dominate the timings
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("app").setLevel(logging.WARNING)
+    document = run(
+        size=args.size,
+        seed=args.seed,
+        http_hands=args.http_hands,
+        pages=args.pages,
+        db_url=args.database_url,
+        corpora=args.corpus,
+        read_rows=args.read_rows,
+    )
+    _print_results(document)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,515 @@
+# app/bulk.py
+"""
+Bulk export and import of the hands table through COPY, for moving hand
+history between environments without paging the HTTP API.
+
+Usage:
+    python -m app.bulk export hands.ndjson.gz
+    python -m app.bulk export hands.pkhc --format columnar
+    python -m app.bulk import hands.pkhc --verify
+
+Rows stream through COPY ... TO STDOUT / FROM STDIN one at a time, so memory
+stays bounded by one columnar chunk (and, with --verify, a few batches per
+worker) however large the table or file is.
+
+Formats:
+    ndjson    one {"id", "created_at", "content_hash", "payload", "payoffs"}
+              object per line, gzip-compressed when the path ends in .gz
+    columnar  b"PKHC" + version, then chunks of up to --chunk-rows hands:
+              the row count and, for each of the five columns in that
+              order, its values one per line ("\\N" for NULL),
+              zlib-compressed separately
+
+Import goes through a staging table, so hands whose id is already stored
+are skipped rather than failing the whole COPY, and then records the
+player statistics of the new hands (app/player_stats.py). --verify replays
+every hand with compute_payoffs_using_pokerkit on a process pool and
+compares the result with the stored payoffs; import leaves out the hands
+that disagree.
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import zlib
+import struct
+import time
+import logging
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, NamedTuple
+
+from .codec import encode_hand
+from .idempotency import payload_hash
+from .poker_service import compute_payoffs_using_pokerkit
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_MAGIC = b"PKHC"
+COLUMNAR_VERSION = 1
+_CHUNK_HEADER = struct.Struct("<I")
+_NULL = b"\\N"
+
+# COPY in CSV mode with control characters as delimiter and quote: JSON
+# escapes every control character, so no value ever needs quoting or escaping
+_COPY_OPTIONS = "(FORMAT csv, DELIMITER E'\\x02', QUOTE E'\\x01')"
+_DELIMITER = "\x02"
+
+# formatted with psycopg2.sql and the table to export
+_EXPORT_SQL = (
+    "COPY (SELECT id, to_json(created_at) #>> '{{}}', content_hash, payload, payoffs "
+    f"FROM {{table}}) TO STDOUT WITH {_COPY_OPTIONS}"
+)
+
+
+class HandRow(NamedTuple):
+    id: str
+    created_at: str | None  # ISO 8601
+    content_hash: str | None
+    payload: str  # JSON text
+    payoffs: str | None  # JSON text
+
+
+class _Progress:
+    """Logs rows done and rows/sec every ``interval`` seconds."""
+
+    def __init__(self, verb: str, interval: float = 5.0, unit: str = "rows"):
+        self.verb = verb
+        self.interval = interval
+        self.unit = unit
+        self.rows = 0
+        self.started = self._last = time.perf_counter()
+
+    def tick(self, rows: int = 1):
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            logger.info("%s %d %s (%.0f %s/s)", self.verb, self.rows, self.unit, self.rate(), self.unit)
+
+    def rate(self) -> float:
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+
+# --- file formats -----------------------------------------------------------
+
+
+def _ndjson_line(row: HandRow) -> bytes:
+    # payload and payoffs are JSON already and are passed through unparsed
+    return (
+        f'{{"id":{json.dumps(row.id)},"created_at":{json.dumps(row.created_at)},'
+        f'"content_hash":{json.dumps(row.content_hash)},'
+        f'"payload":{row.payload},"payoffs":{row.payoffs or "null"}}}\n'
+    ).encode()
+
+
+def _compact(value) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _read_ndjson(f) -> Iterator[HandRow]:
+    for line in f:
+        if not line.strip():
+            continue
+        obj = json.loads(line)
+        payoffs = obj.get("payoffs")
+        yield HandRow(
+            id=obj["id"],
+            created_at=obj.get("created_at"),
+            content_hash=obj.get("content_hash"),
+            payload=_compact(obj["payload"]),
+            payoffs=_compact(payoffs) if payoffs is not None else None,
+        )
+
+
+class ColumnarWriter:
+    """Writes HandRows to a binary file object in the columnar format."""
+
+    def __init__(self, f, chunk_rows: int = 10000):
+        self._f = f
+        self.chunk_rows = chunk_rows
+        self._columns = [[] for _ in HandRow._fields]
+        f.write(COLUMNAR_MAGIC + struct.pack("<H", COLUMNAR_VERSION))
+
+    def write(self, row: HandRow):
+        for column, value in zip(self._columns, row):
+            column.append(_NULL if value is None else value.encode())
+        if len(self._columns[0]) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._columns[0]:
+            return
+        self._f.write(_CHUNK_HEADER.pack(len(self._columns[0])))
+        for column in self._columns:
+            data = zlib.compress(b"\n".join(column))
+            self._f.write(_CHUNK_HEADER.pack(len(data)) + data)
+            column.clear()
+
+    def close(self):
+        self.flush()
+
+
+def _read_exactly(f, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("truncated columnar file")
+    return data
+
+
+def read_columnar(f) -> Iterator[HandRow]:
+    """
+    Yields the rows of a columnar file, one chunk in memory at a time.
+
+    Raises:
+        ValueError: If the file is not a columnar export or is truncated.
+    """
+    header = f.read(len(COLUMNAR_MAGIC) + 2)
+    if header[:4] != COLUMNAR_MAGIC:
+        raise ValueError("not a columnar hands file")
+    (version,) = struct.unpack("<H", header[4:])
+    if version != COLUMNAR_VERSION:
+        raise ValueError(f"unsupported columnar version {version}")
+    while True:
+        head = f.read(_CHUNK_HEADER.size)
+        if not head:
+            return
+        if len(head) != _CHUNK_HEADER.size:
+            raise ValueError("truncated columnar file")
+        (count,) = _CHUNK_HEADER.unpack(head)
+        columns = []
+        for _ in HandRow._fields:
+            (size,) = _CHUNK_HEADER.unpack(_read_exactly(f, _CHUNK_HEADER.size))
+            values = zlib.decompress(_read_exactly(f, size)).split(b"\n")
+            if len(values) != count:
+                raise ValueError("corrupt columnar chunk")
+            columns.append([None if v == _NULL else v.decode() for v in values])
+        for values in zip(*columns):
+            yield HandRow(*values)
+
+
+def _open_output(path: str, fmt: str):
+    if fmt == "ndjson" and path.endswith(".gz"):
+        return gzip.open(path, "wb", compresslevel=6)
+    return open(path, "wb")
+
+
+def read_hands(path: str) -> Iterator[HandRow]:
+    """Yields the rows of an export file of either format (detected from its first bytes)."""
+    with open(path, "rb") as raw:
+        magic = raw.read(4)
+        raw.seek(0)
+        if magic == COLUMNAR_MAGIC:
+            yield from read_columnar(raw)
+        elif magic[:2] == b"\x1f\x8b":
+            with gzip.open(raw, "rb") as f:
+                yield from _read_ndjson(f)
+        else:
+            yield from _read_ndjson(raw)
+
+
+# --- verification -----------------------------------------------------------
+
+
+def _verify_batch(batch: list[HandRow]) -> list[bool]:
+    results = []
+    for row in batch:
+        try:
+            ok = row.payoffs is not None and compute_payoffs_using_pokerkit(
+                json.loads(row.payload)
+            ) == json.loads(row.payoffs)
+        except Exception:
+            ok = False
+        results.append(ok)
+    return results
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def map_batches(fn, items: Iterable, workers: int, batch_size: int = 64) -> Iterator[tuple]:
+    """
+    Yields (item, result) in input order, ``fn`` taking a list of items and
+    returning one result per item. Batches run on a pool of ``workers``
+    processes (``fn`` must be a module-level function); at most two batches
+    per worker are in flight, so the input is consumed only as fast as the
+    pool keeps up. ``workers=0`` runs them inline.
+    """
+    batches = _batched(items, batch_size)
+    if workers <= 0:
+        for batch in batches:
+            yield from zip(batch, fn(batch))
+        return
+
+    from .replay import _init_worker
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    ) as pool:
+        pending = deque()
+        for batch in batches:
+            future = pool.submit(fn, batch)
+            pending.append((batch, future))
+            if len(pending) >= 2 * workers:
+                done, future = pending.popleft()
+                yield from zip(done, future.result())
+        while pending:
+            done, future = pending.popleft()
+            yield from zip(done, future.result())
+
+
+def verified(
+    rows: Iterable[HandRow], workers: int, batch_size: int = 64
+) -> Iterator[tuple[HandRow, bool]]:
+    """Yields (row, payoffs match pokerkit) in input order; see map_batches."""
+    return map_batches(_verify_batch, rows, workers, batch_size)
+
+
+def verify_file(path: str, workers: int) -> tuple[int, int]:
+    """Replays every hand of an export file; returns (hands, mismatches)."""
+    progress = _Progress("verified")
+    mismatches = 0
+    for row, ok in verified(read_hands(path), workers):
+        if not ok:
+            mismatches += 1
+            logger.warning("hand %s: stored payoffs differ from pokerkit", row.id)
+        progress.tick()
+    return progress.rows, mismatches
+
+
+# --- export -----------------------------------------------------------------
+
+
+class _CopySink(io.RawIOBase):
+    """File object COPY TO STDOUT writes into; hands every complete line to ``on_row``."""
+
+    def __init__(self, on_row):
+        self._on_row = on_row
+        self._partial = b""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            fields = [f.decode() or None for f in line.split(b"\x02")]
+            self._on_row(HandRow(*fields))
+        return len(data)
+
+
+def export_hands(
+    conn, path: str, fmt: str = "ndjson", chunk_rows: int = 10000, table: str = "hands"
+) -> int:
+    """
+    Streams the hands table (or ``table``, e.g. a detached partition, see
+    app/partitions.py) into ``path``; returns the number of hands written.
+    """
+    from psycopg2 import sql
+
+    progress = _Progress("exported")
+    with _open_output(path, fmt) as out:
+        if fmt == "columnar":
+            writer = ColumnarWriter(out, chunk_rows)
+            write = writer.write
+        else:
+            writer = None
+
+            def write(row):
+                out.write(_ndjson_line(row))
+
+        def on_row(row: HandRow):
+            write(row)
+            progress.tick()
+
+        with conn:
+            with conn.cursor() as cur:
+                query = sql.SQL(_EXPORT_SQL).format(table=sql.Identifier(table))
+                cur.copy_expert(query.as_string(conn), _CopySink(on_row))
+        if writer is not None:
+            writer.close()
+    logger.info("exported %d rows (%.0f rows/s)", progress.rows, progress.rate())
+    return progress.rows
+
+
+# --- import -----------------------------------------------------------------
+
+
+class _CopySource(io.RawIOBase):
+    """File object COPY FROM STDIN reads from, filled lazily from an iterator of lines."""
+
+    def __init__(self, lines: Iterator[bytes]):
+        self._lines = lines
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        return next(self._lines, b"")
+
+
+def _copy_line(row: HandRow) -> bytes:
+    payload = json.loads(row.payload)
+    payoffs = json.loads(row.payoffs) if row.payoffs is not None else None
+    fields = [
+        row.id,
+        row.payload,
+        row.payoffs or "",
+        row.content_hash or payload_hash(payload),
+        "\\x" + encode_hand(payload, payoffs).hex(),
+        row.created_at or "",
+    ]
+    return (_DELIMITER.join(fields) + "\n").encode()
+
+
+def copy_hands(cur, lines: Iterator[bytes]) -> int:
+    """
+    COPYs rows (see _copy_line) into a staging table, then inserts those
+    whose id is not stored yet; returns how many were inserted. Runs in the
+    caller's transaction.
+    """
+    cur.execute(
+        """
+        CREATE TEMP TABLE hands_import (
+          id UUID, payload JSONB, payoffs JSONB, content_hash TEXT,
+          payload_bin BYTEA, created_at TIMESTAMPTZ
+        ) ON COMMIT DROP
+        """
+    )
+    cur.copy_expert(
+        "COPY hands_import (id, payload, payoffs, content_hash, payload_bin, created_at) "
+        f"FROM STDIN WITH {_COPY_OPTIONS}",
+        _CopySource(lines),
+    )
+    # an archived month being restored has no partition any more
+    cur.execute("SELECT create_hands_partitions(0, (SELECT min(created_at) FROM hands_import))")
+    cur.execute(
+        """
+        INSERT INTO hands (id, payload, payoffs, content_hash, payload_bin, created_at)
+        SELECT id, payload, payoffs, content_hash, payload_bin, COALESCE(created_at, NOW())
+        FROM hands_import
+        ON CONFLICT DO NOTHING
+        """
+    )
+    return cur.rowcount
+
+
+def import_hands(conn, path: str, verify_workers: int | None = None) -> dict:
+    """
+    Streams an export file into the hands table in one transaction.
+
+    Returns:
+        Counts of rows read, hands inserted, hands already stored and,
+        with ``verify_workers``, hands left out because their payoffs differ.
+    """
+    progress = _Progress("imported")
+    rejected = 0
+
+    def rows() -> Iterator[HandRow]:
+        nonlocal rejected
+        source = read_hands(path)
+        if verify_workers is None:
+            yield from source
+            return
+        for row, ok in verified(source, verify_workers):
+            if ok:
+                yield row
+            else:
+                rejected += 1
+                logger.warning("hand %s: stored payoffs differ from pokerkit, skipped", row.id)
+
+    def lines() -> Iterator[bytes]:
+        for row in rows():
+            yield _copy_line(row)
+            progress.tick()
+
+    with conn:
+        with conn.cursor() as cur:
+            inserted = copy_hands(cur, lines())
+    logger.info("imported %d rows (%.0f rows/s)", progress.rows, progress.rate())
+    return {
+        "read": progress.rows + rejected,
+        "inserted": inserted,
+        "existing": progress.rows - inserted,
+        "rejected": rejected,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bulk")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path")
+    parser.add_argument(
+        "--format", choices=["ndjson", "columnar"], help="export format (default: from the path)"
+    )
+    parser.add_argument("--chunk-rows", type=int, default=10000, help="hands per columnar chunk")
+    parser.add_argument("--verify", action="store_true", help="replay every hand with pokerkit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--no-stats", action="store_true", help="skip recording player statistics after import"
+    )
+    args = parser.parse_args(argv)
+
+    import psycopg2
+    from .logs import configure_logging
+    from .repository import DB_URL, HandRepository
+
+    configure_logging()
+    if not DB_URL:
+        print("DATABASE_URL not provided (set environment variable).", file=sys.stderr)
+        return 1
+
+    conn = psycopg2.connect(DB_URL)
+    try:
+        if args.command == "export":
+            fmt = args.format or ("columnar" if args.path.endswith(".pkhc") else "ndjson")
+            count = export_hands(conn, args.path, fmt, args.chunk_rows)
+            print(f"Exported {count} hand(s) to {args.path}")
+            if args.verify:
+                hands, mismatches = verify_file(args.path, args.workers)
+                print(f"Verified {hands} hand(s): {mismatches} mismatch(es)")
+                return 1 if mismatches else 0
+        else:
+            result = import_hands(conn, args.path, args.workers if args.verify else None)
+            print(
+                f"Read {result['read']} hand(s): {result['inserted']} inserted, "
+                f"{result['existing']} already stored, {result['rejected']} rejected"
+            )
+            if not args.no_stats:
+                hands, rows = HandRepository(db_url=DB_URL).backfill_player_stats()
+                print(f"Recorded {rows} player row(s) for {hands} hand(s)")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
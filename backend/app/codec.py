@@ -0,0 +1,406 @@
+# app/codec.py
+"""
+Compact, versioned binary encoding of a hand (media type
+application/x-poker-hand).
+
+Every field of HandIn survives a round trip unchanged, plus the payoffs
+when they are given. Keys of the payload that HandIn does not know are
+dropped.
+
+    version    1 byte (1)
+    cards      varint count, then every card of the hand as a 6-bit
+               rank * 4 + suit, packed big-endian, in the order the
+               fields below use them
+    id         uuid-or-string
+    players    varint count, then per player: id (uuid-or-string),
+               name (string), stack (signed), cards (card string),
+               winnings (signed)
+    dealer, smallBlind, bigBlind
+               player refs, by name
+    actions    varint count, then per action an opcode byte: c, x, f,
+               b + varint amount, r + varint amount, F/T/R + card string,
+               or a raw string for anything else
+    community  0 when communityCards lists the board actions' cards one
+               by one, else 1 + varint count + card strings
+    finalPot   signed
+    payoffs    varint 0 for none, else count + 1 and per entry a player
+               ref (by id) and a signed amount
+
+varints are unsigned LEB128 and signed values are zigzag varints. A
+uuid-or-string is varint 0 + 16 bytes when the string is a canonical UUID,
+else varint length + 1 + UTF-8. A card string is varint 2n + 0 followed by
+n cards from the card section when it is canonical ("AsKd"), else
+2 * length + 1 + UTF-8 ("As Kd"). A player ref is the varint index of the
+player, or the player count followed by a string when no player matches.
+
+Usage:
+    python -m app.codec bench   # size and speed against the JSON form
+"""
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+from .evaluator import format_card
+
+CONTENT_TYPE = "application/x-poker-hand"
+VERSION = 1
+
+_CARD_CODES = {format_card(c): c for c in range(52)}
+_CARD_NAMES = [format_card(c) for c in range(52)]
+_AMOUNT_RE = re.compile(r"[br](?:0|[1-9][0-9]*)$")
+# the form str(uuid.UUID(...)) produces, the only one stored as 16 bytes
+_UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+_OP_CALL, _OP_CHECK, _OP_FOLD, _OP_BET, _OP_RAISE, _OP_RAW = range(6)
+_OP_BOARD = {"F": 6, "T": 7, "R": 8}
+_BOARD_OP = {op: street for street, op in _OP_BOARD.items()}
+_SIMPLE_OPS = {"c": _OP_CALL, "x": _OP_CHECK, "f": _OP_FOLD}
+_SIMPLE_ACTIONS = {op: action for action, op in _SIMPLE_OPS.items()}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class _Writer:
+    def __init__(self):
+        self.buf = bytearray()
+        self.cards = []
+
+    def varint(self, value: int):
+        if value < 0x80:
+            self.buf.append(value)
+            return
+        while value > 0x7F:
+            self.buf.append(value & 0x7F | 0x80)
+            value >>= 7
+        self.buf.append(value)
+
+    def signed(self, value: int):
+        value = int(value)
+        self.varint(value << 1 if value >= 0 else (-value << 1) - 1)
+
+    def string(self, value: str):
+        raw = value.encode()
+        self.varint(len(raw))
+        self.buf += raw
+
+    def uuid_or_string(self, value: str):
+        if isinstance(value, str) and _UUID_RE.match(value):
+            self.buf.append(0)
+            self.buf += bytes.fromhex(value.replace("-", ""))
+        else:
+            raw = str(value).encode()
+            self.varint(len(raw) + 1)
+            self.buf += raw
+
+    def card_string(self, value: str):
+        codes = [_CARD_CODES.get(value[i : i + 2]) for i in range(0, len(value), 2)]
+        if len(value) % 2 == 0 and None not in codes:
+            self.varint(len(codes) << 1)
+            self.cards += codes
+        else:
+            raw = value.encode()
+            self.varint(len(raw) << 1 | 1)
+            self.buf += raw
+
+    def player_ref(self, value: str, index: dict, players: int):
+        found = index.get(value)
+        if found is None:
+            self.varint(players)
+            self.string(value)
+        else:
+            self.varint(found)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+        self.cards = iter(())
+
+    def byte(self) -> int:
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def take(self, size: int) -> bytes:
+        if self.pos + size > len(self.data):
+            raise ValueError("truncated hand encoding")
+        value = self.data[self.pos : self.pos + size]
+        self.pos += size
+        return value
+
+    def varint(self) -> int:
+        b = self.data[self.pos]
+        if b < 0x80:
+            self.pos += 1
+            return b
+        value = shift = 0
+        while True:
+            b = self.data[self.pos]
+            self.pos += 1
+            value |= (b & 0x7F) << shift
+            if b < 0x80:
+                return value
+            shift += 7
+
+    def signed(self) -> int:
+        value = self.varint()
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    def string(self) -> str:
+        return self.take(self.varint()).decode()
+
+    def uuid_or_string(self) -> str:
+        size = self.varint()
+        if size == 0:
+            h = self.take(16).hex()
+            return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+        return self.take(size - 1).decode()
+
+    def card_string(self) -> str:
+        value = self.varint()
+        if value & 1:
+            return self.take(value >> 1).decode()
+        return "".join([_CARD_NAMES[next(self.cards)] for _ in range(value >> 1)])
+
+    def player_ref(self, names: list[str]) -> str:
+        found = self.varint()
+        return names[found] if found < len(names) else self.string()
+
+
+def _pack_cards(cards: list[int]) -> bytes:
+    size = (6 * len(cards) + 7) // 8
+    packed = 0
+    for card in cards:
+        packed = packed << 6 | card
+    return (packed << (8 * size - 6 * len(cards))).to_bytes(size, "big")
+
+
+def _unpack_cards(data: bytes, count: int) -> list[int]:
+    packed = int.from_bytes(data, "big") >> (8 * len(data) - 6 * count)
+    return [(packed >> (6 * (count - 1 - i))) & 0x3F for i in range(count)]
+
+
+def _board_cards(actions: list[str]) -> list[str]:
+    cards = []
+    for action in actions:
+        if action[:2] in ("F[", "T[", "R[") and action.endswith("]"):
+            inner = action[2:-1]
+            cards += [inner[i : i + 2] for i in range(0, len(inner), 2)]
+    return cards
+
+
+def encode_hand(payload: dict, payoffs: dict | None = None) -> bytes:
+    """Encodes a HandIn-shaped payload and optionally its payoffs."""
+    w = _Writer()
+    w.uuid_or_string(payload["id"])
+
+    players = payload["players"]
+    w.varint(len(players))
+    for p in players:
+        w.uuid_or_string(p["id"])
+        w.string(p["name"])
+        w.signed(p["stack"])
+        w.card_string(p["cards"])
+        w.signed(p["winnings"])
+
+    by_name = {}
+    by_id = {}
+    for i, p in enumerate(players):
+        by_name.setdefault(p["name"], i)
+        by_id.setdefault(p["id"], i)
+    for key in ("dealer", "smallBlind", "bigBlind"):
+        w.player_ref(payload[key], by_name, len(players))
+
+    actions = payload["actions"]
+    w.varint(len(actions))
+    for action in actions:
+        op = _SIMPLE_OPS.get(action)
+        if op is not None:
+            w.buf.append(op)
+        elif _AMOUNT_RE.match(action):
+            w.buf.append(_OP_BET if action[0] == "b" else _OP_RAISE)
+            w.varint(int(action[1:]))
+        elif action[:2] in ("F[", "T[", "R[") and action.endswith("]"):
+            w.buf.append(_OP_BOARD[action[0]])
+            w.card_string(action[2:-1])
+        else:
+            w.buf.append(_OP_RAW)
+            w.string(action)
+
+    community = payload.get("communityCards", [])
+    if community == _board_cards(actions):
+        w.buf.append(0)
+    else:
+        w.buf.append(1)
+        w.varint(len(community))
+        for card in community:
+            w.card_string(card)
+
+    w.signed(payload["finalPot"])
+
+    if payoffs is None:
+        w.varint(0)
+    else:
+        w.varint(len(payoffs) + 1)
+        for player_id, amount in payoffs.items():
+            w.player_ref(player_id, by_id, len(players))
+            w.signed(amount)
+
+    header = _Writer()
+    header.buf.append(VERSION)
+    header.varint(len(w.cards))
+    return bytes(header.buf) + _pack_cards(w.cards) + bytes(w.buf)
+
+
+def decode_hand(data: bytes) -> tuple[dict, dict | None]:
+    """
+    Inverse of encode_hand; returns (payload, payoffs).
+
+    Raises:
+        ValueError: On an unknown version or malformed data.
+    """
+    try:
+        return _decode(_Reader(bytes(data)))
+    except (IndexError, StopIteration, UnicodeDecodeError):
+        raise ValueError("malformed hand encoding")
+
+
+def _decode(r: _Reader) -> tuple[dict, dict | None]:
+    version = r.byte()
+    if version != VERSION:
+        raise ValueError(f"unsupported hand encoding version {version}")
+    count = r.varint()
+    r.cards = iter(_unpack_cards(r.take((6 * count + 7) // 8), count))
+
+    hand_id = r.uuid_or_string()
+    players = []
+    for _ in range(r.varint()):
+        players.append(
+            {
+                "id": r.uuid_or_string(),
+                "name": r.string(),
+                "stack": r.signed(),
+                "cards": r.card_string(),
+                "winnings": r.signed(),
+            }
+        )
+    names = [p["name"] for p in players]
+    dealer, small_blind, big_blind = (r.player_ref(names) for _ in range(3))
+
+    actions = []
+    for _ in range(r.varint()):
+        op = r.byte()
+        if op in _SIMPLE_ACTIONS:
+            actions.append(_SIMPLE_ACTIONS[op])
+        elif op == _OP_BET or op == _OP_RAISE:
+            actions.append(("b" if op == _OP_BET else "r") + str(r.varint()))
+        elif op in _BOARD_OP:
+            actions.append(f"{_BOARD_OP[op]}[{r.card_string()}]")
+        elif op == _OP_RAW:
+            actions.append(r.string())
+        else:
+            raise ValueError(f"unknown action opcode {op}")
+
+    if r.byte() == 0:
+        community = _board_cards(actions)
+    else:
+        community = [r.card_string() for _ in range(r.varint())]
+
+    payload = {
+        "id": hand_id,
+        "dealer": dealer,
+        "smallBlind": small_blind,
+        "bigBlind": big_blind,
+        "players": players,
+        "actions": actions,
+        "communityCards": community,
+        "finalPot": r.signed(),
+    }
+
+    payoffs = None
+    count = r.varint()
+    if count:
+        ids = [p["id"] for p in players]
+        payoffs = {}
+        for _ in range(count - 1):
+            key = r.player_ref(ids)
+            payoffs[key] = r.signed()
+    if r.pos != len(r.data):
+        raise ValueError("trailing bytes after hand encoding")
+    return payload, payoffs
+
+
+def encode_frame(created_at: datetime, data: bytes) -> bytes:
+    """One stored hand of a GET /hands binary listing: created_at (µs), length, encoding."""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    w = _Writer()
+    w.signed((created_at - _EPOCH) // timedelta(microseconds=1))
+    w.varint(len(data))
+    return bytes(w.buf) + data
+
+
+def iter_frames(data: bytes) -> Iterator[tuple[datetime, bytes]]:
+    """Splits a binary listing back into (created_at, encoded hand) pairs."""
+    r = _Reader(bytes(data))
+    while r.pos < len(r.data):
+        created_at = _EPOCH + timedelta(microseconds=r.signed())
+        yield created_at, r.take(r.varint())
+
+
+def bench(count: int = 2000, seed: int = 11) -> dict:
+    """Encoded size and encode/decode time of generated hands, against compact JSON."""
+    import json
+    import random
+    import time
+    from .handgen import generate_hand
+
+    rng = random.Random(seed)
+    hands = [generate_hand(rng) for _ in range(count)]
+    pairs = [(h.payload, h.payoffs) for h in hands]
+
+    def timed(fn, items):
+        started = time.perf_counter()
+        out = [fn(item) for item in items]
+        return out, (time.perf_counter() - started) / len(items)
+
+    as_json, json_encode = timed(
+        lambda pair: json.dumps({"payload": pair[0], "payoffs": pair[1]}, separators=(",", ":")),
+        pairs,
+    )
+    _, json_decode = timed(json.loads, as_json)
+    as_binary, binary_encode = timed(lambda pair: encode_hand(*pair), pairs)
+    _, binary_decode = timed(decode_hand, as_binary)
+
+    json_size = sum(len(s.encode()) for s in as_json) / count
+    binary_size = sum(len(b) for b in as_binary) / count
+    return {
+        "json_bytes": json_size,
+        "binary_bytes": binary_size,
+        "size_ratio": binary_size / json_size,
+        "json_encode_us": json_encode * 1e6,
+        "binary_encode_us": binary_encode * 1e6,
+        "json_decode_us": json_decode * 1e6,
+        "binary_decode_us": binary_decode * 1e6,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    command = (argv if argv is not None else sys.argv[1:] or ["bench"])[0]
+    if command != "bench":
+        print(f"unknown command {command!r}; expected bench", file=sys.stderr)
+        return 2
+    result = bench()
+    print(
+        f"size: json {result['json_bytes']:.0f} B, binary {result['binary_bytes']:.0f} B "
+        f"({result['size_ratio']:.2f}x)\n"
+        f"encode: json {result['json_encode_us']:.1f} us, binary {result['binary_encode_us']:.1f} us\n"
+        f"decode: json {result['json_decode_us']:.1f} us, binary {result['binary_decode_us']:.1f} us"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from .migrate import create_scratch_schema, drop_schema
+
+# tests that need a real PostgreSQL run against TEST_DATABASE_URL, each in a
+# throwaway schema, and are skipped without it
+TEST_DB_URL = os.getenv("TEST_DATABASE_URL")
+
+needs_database = pytest.mark.skipif(not TEST_DB_URL, reason="TEST_DATABASE_URL not set")
+
+
+@pytest.fixture(scope="module")
+def scratch_schema():
+    """Returns a function creating a migrated schema and the DSN that uses it."""
+    created = []
+
+    def create() -> str:
+        schema, dsn = create_scratch_schema(TEST_DB_URL, prefix="test")
+        created.append(schema)
+        return dsn
+
+    yield create
+
+    for schema in created:
+        drop_schema(TEST_DB_URL, schema)
@@ -1,5 +1,13 @@
 import psycopg2
 import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
 
 
 def get_connection():
@@ -10,3 +18,177 @@ def get_connection():
         host=os.getenv("POSTGRES_HOST", "localhost"),
         port="5432",
     )
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no pooled connection becomes free within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe, process-wide pool of psycopg2 connections.
+
+    At most ``maxconn`` connections exist at once; ``minconn`` are opened up
+    front and kept around. Checkout blocks for at most ``timeout`` seconds and
+    then raises PoolTimeoutError. Connections idle for longer than
+    ``health_check_after`` seconds are pinged with ``SELECT 1`` before being
+    handed out, and broken ones are replaced transparently.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        minconn: int = 1,
+        maxconn: int = 10,
+        timeout: float = 5.0,
+        health_check_after: float = 30.0,
+        connect=psycopg2.connect,
+    ):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("pool size must satisfy 0 <= minconn <= maxconn, maxconn >= 1")
+        self._dsn = dsn
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._idle = deque()  # (connection, returned_at)
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connects": 0,
+            "discarded": 0,
+            "wait_seconds_total": 0.0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append((self._new_conn(), time.monotonic()))
+
+    @classmethod
+    def from_env(cls, dsn: str) -> "ConnectionPool":
+        return cls(
+            dsn,
+            minconn=int(os.getenv("DB_POOL_MIN", "1")),
+            maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+            health_check_after=float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30")),
+        )
+
+    def _new_conn(self):
+        conn = self._connect(self._dsn)
+        with self._lock:
+            self._stats["connects"] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolTimeoutError(
+                f"no database connection available within {self.timeout}s "
+                f"(pool max size {self.maxconn})"
+            )
+
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = self._new_conn()
+                    break
+                conn, returned_at = item
+                if self._is_healthy(conn, time.monotonic() - returned_at):
+                    break
+                logger.warning("Discarding broken pooled database connection")
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds_total"] += time.monotonic() - started
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        if not conn.closed and not discard:
+            # never hand out a connection that is still inside a transaction
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        with self._lock:
+            self._in_use -= 1
+            keep = not (discard or conn.closed or self._closed)
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+        if not keep:
+            self._discard(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "checkout_timeout": self.timeout,
+                **self._stats,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
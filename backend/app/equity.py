@@ -0,0 +1,200 @@
+# app/equity.py
+"""
+All-in equity: each player's share of the pot if the remaining board were
+dealt out now, with nobody folding.
+
+When few cards are missing (from the flop on) every possible run-out is
+enumerated and the result is exact; otherwise run-outs are sampled. Either
+way all run-outs are evaluated at once with NumPy on the lookup-table
+evaluator.
+"""
+import os
+import logging
+from dataclasses import dataclass
+from itertools import combinations
+from math import comb
+
+import numpy as np
+
+from .evaluator import evaluate_batch, format_card, parse_cards
+from .poker_service import apply_action, new_pokerkit_state, seat_players
+from .preflop import load_tables as load_preflop_tables
+
+logger = logging.getLogger(__name__)
+
+EQUITY_SAMPLES = int(os.getenv("EQUITY_SAMPLES", "20000"))
+EQUITY_MAX_SAMPLES = int(os.getenv("EQUITY_MAX_SAMPLES", "1000000"))
+# enumerate exactly when there are at most this many run-outs
+EQUITY_EXACT_LIMIT = int(os.getenv("EQUITY_EXACT_LIMIT", "200000"))
+
+STREETS = {"F": "flop", "T": "turn", "R": "river"}
+
+
+@dataclass
+class EquityResult:
+    equity: list[float]  # expected share of the pot, sums to 1
+    win: list[float]  # chance of winning outright
+    tie: list[float]  # chance of splitting
+    method: str  # "exact", "monte_carlo" or "table"
+    samples: int  # run-outs evaluated
+
+
+def parse_hole_cards(cards: str) -> list[int]:
+    """Parses a player's ``cards`` string the way the replay deals it ("AsKd", "As Kd")."""
+    hole = parse_cards(cards)
+    if len(hole) != 2:
+        raise ValueError(f"expected two hole cards, got {cards!r}")
+    return hole
+
+
+def sample_runouts(deck, missing: int, samples: int, rng):
+    """``samples`` uniform draws of ``missing`` distinct cards from ``deck``."""
+    # partial Fisher-Yates on every row at once: only the first ``missing``
+    # positions are shuffled into place
+    decks = np.tile(deck.astype(np.int8), (samples, 1))
+    rows = np.arange(samples)
+    for k in range(missing):
+        j = rng.integers(k, len(deck), size=samples)
+        picked = decks[rows, j]
+        decks[rows, j] = decks[:, k]
+        decks[:, k] = picked
+    return decks[:, :missing].astype(np.int64)
+
+
+def calculate_equity(
+    holes: list[list[int]],
+    board: list[int],
+    samples: int | None = None,
+    exact_limit: int | None = None,
+    seed: int | None = None,
+) -> EquityResult:
+    """
+    Computes all-in equity for two or more players.
+
+    Args:
+        holes: Two encoded hole cards per player.
+        board: The encoded community cards dealt so far (0, 3, 4 or 5).
+        samples: Monte Carlo run-outs when enumeration is too large. Left
+            unset, heads-up preflop equity comes from the precomputed table.
+        exact_limit: Largest number of run-outs enumerated exactly.
+        seed: Seed for the Monte Carlo sampler.
+
+    Raises:
+        ValueError: On duplicate cards or a board of the wrong size.
+    """
+    if len(holes) < 2:
+        raise ValueError("equity needs at least two players")
+    if len(board) not in (0, 3, 4, 5):
+        raise ValueError(f"board must have 0, 3, 4 or 5 cards, got {len(board)}")
+    dealt = [c for hole in holes for c in hole] + list(board)
+    if len(set(dealt)) != len(dealt):
+        raise ValueError("the same card is dealt twice")
+
+    if not board and len(holes) == 2 and samples is None:
+        tables = load_preflop_tables()
+        found = tables.heads_up(*holes) if tables is not None else None
+        if found is not None:
+            equity, tie = found
+            return EquityResult(
+                equity=[equity, 1.0 - equity],
+                win=[equity - tie / 2, 1.0 - equity - tie / 2],
+                tie=[tie, tie],
+                method="table",
+                samples=tables.samples,
+            )
+
+    samples = samples or EQUITY_SAMPLES
+    exact_limit = EQUITY_EXACT_LIMIT if exact_limit is None else exact_limit
+
+    deck = np.array(sorted(set(range(52)) - set(dealt)), dtype=np.int64)
+    missing = 5 - len(board)
+    runout_count = comb(len(deck), missing)
+    if runout_count <= exact_limit:
+        method = "exact"
+        runouts = np.array(list(combinations(deck.tolist(), missing)), dtype=np.int64)
+        runouts = runouts.reshape(runout_count, missing)
+    else:
+        method = "monte_carlo"
+        runouts = sample_runouts(deck, missing, samples, np.random.default_rng(seed))
+    count = len(runouts)
+
+    common = np.hstack([np.broadcast_to(np.array(board, dtype=np.int64), (count, len(board))), runouts])
+    scores = np.empty((len(holes), count), dtype=np.uint16)
+    for player, hole in enumerate(holes):
+        cards = np.hstack([np.broadcast_to(np.array(hole, dtype=np.int64), (count, 2)), common])
+        scores[player] = evaluate_batch(cards)
+
+    winners = scores == scores.max(axis=0)
+    shares = winners.sum(axis=0)
+    tied = shares > 1
+    return EquityResult(
+        equity=(winners / shares).mean(axis=1).tolist(),
+        win=(winners & ~tied).mean(axis=1).tolist(),
+        tie=(winners & tied).mean(axis=1).tolist(),
+        method=method,
+        samples=count,
+    )
+
+
+def hand_streets(payload: dict) -> list[dict]:
+    """
+    Follows a stored hand through pokerkit and returns, for preflop and each
+    dealt street, the board and which payload players were still in.
+
+    Raises:
+        ValueError: If the hand cannot be replayed.
+    """
+    seats = seat_players(payload)
+    state = new_pokerkit_state([seat["stack"] for seat in seats])
+    for seat in seats:
+        state.deal_hole(seat["cards"])
+
+    def snapshot(name, board):
+        live = {seats[i]["id"] for i, status in enumerate(state.statuses) if status}
+        return {"street": name, "board": list(board), "live": live}
+
+    streets = [snapshot("preflop", [])]
+    board = []
+    for i, action in enumerate(payload["actions"]):
+        try:
+            apply_action(state, action, i)
+        except Exception as e:
+            raise ValueError(f"pokerkit error at action {i} ('{action}'): {e}")
+        if action.startswith(("F[", "T[", "R[")):
+            board += [format_card(c) for c in parse_cards(action[2:-1])]
+            streets.append(snapshot(STREETS[action[0]], board))
+    return streets
+
+
+def hand_equity(payload: dict, samples: int | None = None, seed: int | None = None) -> list[dict]:
+    """All-in equity of every player at each street of a hand."""
+    players = payload["players"]
+    holes = [parse_hole_cards(p["cards"]) for p in players]
+    result = []
+    for street in hand_streets(payload):
+        live = [i for i, p in enumerate(players) if p["id"] in street["live"]]
+        board = parse_cards("".join(street["board"]))
+        entry = {"street": street["street"], "board": street["board"]}
+        if len(live) >= 2:
+            equity = calculate_equity([holes[i] for i in live], board, samples, seed=seed)
+            entry.update(method=equity.method, samples=equity.samples)
+            by_player = {i: j for j, i in enumerate(live)}
+        else:
+            # everyone else folded: the remaining player holds the whole pot
+            equity = EquityResult([1.0], [1.0], [0.0], "settled", 0)
+            entry.update(method="settled", samples=0)
+            by_player = {live[0]: 0} if live else {}
+        entry["players"] = [
+            {
+                "id": p["id"],
+                "name": p["name"],
+                "cards": p["cards"],
+                "folded": i not in by_player,
+                "equity": equity.equity[by_player[i]] if i in by_player else 0.0,
+                "win": equity.win[by_player[i]] if i in by_player else 0.0,
+                "tie": equity.tie[by_player[i]] if i in by_player else 0.0,
+            }
+            for i, p in enumerate(players)
+        ]
+        result.append(entry)
+    return result
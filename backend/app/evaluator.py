@@ -0,0 +1,485 @@
+# app/evaluator.py
+"""
+Lookup-table 7-card hand evaluator.
+
+Cards are small integers, ``rank * 4 + suit`` with ranks "23456789TJQKA" and
+suits "cdhs". A hand's strength is one of the 7462 distinct five-card hand
+classes, numbered 1 (7-5-4-3-2 high) to 7462 (royal flush) so that a higher
+number is a better hand and equal numbers tie.
+
+Evaluation is two table lookups. Every rank gets a key chosen so that the sum
+of any seven rank keys (at most four per rank) is unique; that sum indexes
+RANK_TABLE, which holds the best non-flush hand. Every suit gets a small key
+whose sum over seven cards tells whether one suit has five or more cards; if
+so the bitmask of that suit's ranks indexes FLUSH_TABLE.
+
+The tables are built once (about a second), written to EVALUATOR_TABLE_PATH
+and memory-mapped from there afterwards, so every server and replay worker
+process shares the same read-only pages.
+
+Usage:
+    python -m app.evaluator build   # (re)write the table file
+    python -m app.evaluator verify  # compare against pokerkit on every hand class
+    python -m app.evaluator bench   # evaluations per second vs pokerkit
+"""
+import os
+import sys
+import mmap
+import struct
+import logging
+import tempfile
+import threading
+from array import array
+from itertools import combinations
+from typing import Iterable, Sequence
+
+logger = logging.getLogger(__name__)
+
+RANKS = "23456789TJQKA"
+SUITS = "cdhs"
+
+TABLE_PATH = os.getenv(
+    "EVALUATOR_TABLE_PATH",
+    os.path.join(tempfile.gettempdir(), "poker-hand-ranks-v1.bin"),
+)
+
+# sums of any 7 of these (each used at most 4 times) are all distinct;
+# checked again whenever the tables are built
+_RANK_KEYS = (0, 1, 5, 22, 98, 453, 2031, 8698, 22854, 83661, 262349, 636345, 1479181)
+_SUIT_KEYS = (0, 1, 29, 37)
+_SUIT_BITS = 9  # suit key sums of 7 cards stay below 2**9
+
+_CARD_KEYS = tuple(
+    (_RANK_KEYS[c >> 2] << _SUIT_BITS) | _SUIT_KEYS[c & 3] for c in range(52)
+)
+_RANK_BITS = tuple(1 << (c >> 2) for c in range(52))
+
+_MAGIC = b"PKHR"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHII")  # magic, version, byte order, rank / flush sizes
+# largest key: four aces and three kings
+_RANK_TABLE_SIZE = 4 * _RANK_KEYS[12] + 3 * _RANK_KEYS[11] + 1
+_FLUSH_TABLE_SIZE = 1 << 13
+
+HAND_CLASSES = 7462
+CATEGORY_NAMES = (
+    "High card",
+    "One pair",
+    "Two pair",
+    "Three of a kind",
+    "Straight",
+    "Flush",
+    "Full house",
+    "Four of a kind",
+    "Straight flush",
+)
+
+
+def parse_card(card: str) -> int:
+    """Encodes a card like "As" or "Td" ("10d" also accepted)."""
+    rank, suit = card[:-1], card[-1]
+    if rank == "10":
+        rank = "T"
+    if len(rank) != 1 or rank not in RANKS or suit not in SUITS:
+        raise ValueError(f"invalid card: {card!r}")
+    return RANKS.index(rank) * 4 + SUITS.index(suit)
+
+
+def parse_cards(cards: str) -> list[int]:
+    """Encodes a run of cards like "AsKd", "As Kd" or "F[2c3d4h]"-style contents."""
+    cards = cards.replace(" ", "").replace("10", "T")
+    if len(cards) % 2:
+        raise ValueError(f"invalid cards: {cards!r}")
+    return [parse_card(cards[i : i + 2]) for i in range(0, len(cards), 2)]
+
+
+def format_card(card: int) -> str:
+    return RANKS[card >> 2] + SUITS[card & 3]
+
+
+def category(hand_class: int) -> str:
+    """Returns the category name ("Full house", ...) of a hand class."""
+    return CATEGORY_NAMES[_class_category()[hand_class]]
+
+
+# --- table construction ----------------------------------------------------
+
+_STRAIGHTS = [(0b11111 << low, low + 4) for low in range(8, -1, -1)] + [(0b1000000001111, 3)]
+
+
+def _straight_high(mask: int) -> int | None:
+    for bits, high in _STRAIGHTS:
+        if mask & bits == bits:
+            return high
+    return None
+
+
+def _top(mask: int, count: int) -> tuple:
+    ranks = [r for r in range(12, -1, -1) if mask >> r & 1]
+    return tuple(ranks[:count])
+
+
+def _best_of_ranks(counts: Sequence[int]) -> tuple:
+    """Best non-flush five-card hand from per-rank counts, as a comparable tuple."""
+    mask = 0
+    for r, c in enumerate(counts):
+        if c:
+            mask |= 1 << r
+    by_count = sorted(((c, r) for r, c in enumerate(counts) if c), reverse=True)
+    quads = [r for c, r in by_count if c == 4]
+    trips = [r for c, r in by_count if c == 3]
+    pairs = [r for c, r in by_count if c == 2]
+
+    if quads:
+        q = quads[0]
+        return (7, q, _top(mask & ~(1 << q), 1)[0])
+    if trips and (len(trips) > 1 or pairs):
+        t = trips[0]
+        p = max(trips[1:] + pairs)
+        return (6, t, p)
+    high = _straight_high(mask)
+    if high is not None:
+        return (4, high)
+    if trips:
+        t = trips[0]
+        return (3, t) + _top(mask & ~(1 << t), 2)
+    if len(pairs) >= 2:
+        p1, p2 = pairs[:2]
+        return (2, p1, p2) + _top(mask & ~(1 << p1) & ~(1 << p2), 1)
+    if pairs:
+        p = pairs[0]
+        return (1, p) + _top(mask & ~(1 << p), 3)
+    return (0,) + _top(mask, 5)
+
+
+def _best_of_flush(mask: int) -> tuple:
+    """Best hand from the ranks of five to seven suited cards."""
+    high = _straight_high(mask)
+    if high is not None:
+        return (8, high)
+    return (5,) + _top(mask, 5)
+
+
+def _rank_multisets(size: int) -> Iterable[tuple[int, ...]]:
+    """Per-rank counts (at most 4 each) of every multiset of ``size`` ranks."""
+    counts = [0] * 13
+
+    def rec(rank, left):
+        if rank == 13:
+            if left == 0:
+                yield tuple(counts)
+            return
+        for c in range(min(4, left) + 1):
+            counts[rank] = c
+            yield from rec(rank + 1, left - c)
+        counts[rank] = 0
+
+    return rec(0, size)
+
+
+def _hand_class_ids() -> dict:
+    """Maps every five-card hand tuple to its class, 1 (worst) .. 7462 (best)."""
+    values = {_best_of_ranks(counts) for counts in _rank_multisets(5)}
+    values.update(
+        _best_of_flush(sum(1 << r for r in ranks)) for ranks in combinations(range(13), 5)
+    )
+    assert len(values) == HAND_CLASSES
+    return {value: i for i, value in enumerate(sorted(values), start=1)}
+
+
+def _flush_suit_table() -> list[int]:
+    """Suit key sum of seven cards -> suit with five or more cards, or -1."""
+    table = [-2] * (1 << _SUIT_BITS)
+    for a in range(8):
+        for b in range(8 - a):
+            for c in range(8 - a - b):
+                d = 7 - a - b - c
+                counts = (a, b, c, d)
+                key = sum(n * k for n, k in zip(counts, _SUIT_KEYS))
+                suit = next((s for s in range(4) if counts[s] >= 5), -1)
+                if table[key] not in (-2, suit):
+                    raise AssertionError("suit keys do not identify the flush suit")
+                table[key] = suit
+    return table
+
+
+_FLUSH_SUIT = tuple(_flush_suit_table())
+
+
+def build_tables() -> tuple[array, array]:
+    """Computes RANK_TABLE and FLUSH_TABLE (unsigned 16-bit hand classes)."""
+    class_ids = _hand_class_ids()
+
+    rank_table = array("H", bytes(2 * _RANK_TABLE_SIZE))
+    for counts in _rank_multisets(7):
+        key = sum(c * k for c, k in zip(counts, _RANK_KEYS))
+        if rank_table[key]:
+            raise AssertionError("rank keys collide")
+        rank_table[key] = class_ids[_best_of_ranks(counts)]
+
+    flush_table = array("H", bytes(2 * _FLUSH_TABLE_SIZE))
+    for mask in range(_FLUSH_TABLE_SIZE):
+        if 5 <= mask.bit_count() <= 7:
+            flush_table[mask] = class_ids[_best_of_flush(mask)]
+    return rank_table, flush_table
+
+
+def write_tables(path: str = TABLE_PATH) -> None:
+    """Builds the tables and writes them to ``path`` atomically."""
+    rank_table, flush_table = build_tables()
+    byte_order = 1 if sys.byteorder == "little" else 2
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".poker-hand-ranks-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(
+                _HEADER.pack(_MAGIC, _VERSION, byte_order, len(rank_table), len(flush_table))
+            )
+            rank_table.tofile(f)
+            flush_table.tofile(f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# --- loading ---------------------------------------------------------------
+
+_lock = threading.Lock()
+_tables = None  # (rank_table, flush_table, mmap)
+
+
+def _map_tables(path: str):
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(mm) < _HEADER.size:
+            raise ValueError(f"{path} is not a usable hand rank table")
+        magic, version, byte_order, rank_size, flush_size = _HEADER.unpack_from(mm)
+        expected_order = 1 if sys.byteorder == "little" else 2
+        if (
+            magic != _MAGIC
+            or version != _VERSION
+            or byte_order != expected_order
+            or rank_size != _RANK_TABLE_SIZE
+            or flush_size != _FLUSH_TABLE_SIZE
+            or len(mm) != _HEADER.size + 2 * (rank_size + flush_size)
+        ):
+            raise ValueError(f"{path} is not a usable hand rank table")
+        view = memoryview(mm)
+        start = _HEADER.size
+        rank_table = view[start : start + 2 * rank_size].cast("H")
+        flush_table = view[start + 2 * rank_size :].cast("H")
+    except Exception:
+        mm.close()
+        raise
+    return rank_table, flush_table, mm
+
+
+def load_tables(path: str | None = None) -> None:
+    """
+    Memory-maps the lookup tables, building the file first if it is missing
+    or stale. Safe to call repeatedly; only the first call does any work.
+    """
+    global _tables
+    if _tables is not None:
+        return
+    path = path or TABLE_PATH
+    with _lock:
+        if _tables is not None:
+            return
+        try:
+            _tables = _map_tables(path)
+        except (OSError, ValueError):
+            logger.info("Building hand rank tables at %s", path)
+            write_tables(path)
+            _tables = _map_tables(path)
+
+
+def evaluate(cards: Sequence[int]) -> int:
+    """
+    Returns the hand class (1..7462, higher is better) of exactly seven
+    distinct encoded cards.
+    """
+    if _tables is None:
+        load_tables()
+    rank_table, flush_table, _ = _tables
+
+    key = 0
+    for c in cards:
+        key += _CARD_KEYS[c]
+    best = rank_table[key >> _SUIT_BITS]
+
+    flush_suit = _FLUSH_SUIT[key & ((1 << _SUIT_BITS) - 1)]
+    if flush_suit >= 0:
+        mask = 0
+        for c in cards:
+            if c & 3 == flush_suit:
+                mask |= _RANK_BITS[c]
+        best = max(best, flush_table[mask])
+    return best
+
+
+_np_tables = None
+
+
+def _numpy_tables():
+    global _np_tables
+    if _np_tables is None:
+        import numpy as np
+
+        if _tables is None:
+            load_tables()
+        rank_table, flush_table, _ = _tables
+        _np_tables = (
+            np.array(_CARD_KEYS, dtype=np.int64),
+            np.array(_RANK_BITS, dtype=np.int32),
+            np.array(_FLUSH_SUIT, dtype=np.int8),
+            np.frombuffer(rank_table, dtype=np.uint16),
+            np.frombuffer(flush_table, dtype=np.uint16),
+        )
+    return _np_tables
+
+
+def evaluate_batch(cards):
+    """
+    Vectorized evaluate: ``cards`` is an integer NumPy array of shape
+    (hands, 7); returns the hand class of every row.
+    """
+    import numpy as np
+
+    card_keys, rank_bits, flush_suits, rank_table, flush_table = _numpy_tables()
+    keys = card_keys[cards].sum(axis=1)
+    best = rank_table[keys >> _SUIT_BITS]
+
+    suit = flush_suits[keys & ((1 << _SUIT_BITS) - 1)]
+    rows = np.flatnonzero(suit >= 0)
+    if rows.size:
+        sub = cards[rows]
+        suited = (sub & 3) == suit[rows, None]
+        # ranks within one suit are distinct, so the sum is the bitwise or
+        mask = (rank_bits[sub] * suited).sum(axis=1)
+        best[rows] = np.maximum(best[rows], flush_table[mask])
+    return best
+
+
+_categories = None
+
+
+def _class_category() -> list[int]:
+    global _categories
+    if _categories is None:
+        by_class = [0] * (HAND_CLASSES + 1)
+        for value, hand_class in _hand_class_ids().items():
+            by_class[hand_class] = value[0]
+        _categories = by_class
+    return _categories
+
+
+# --- verification and benchmark ---------------------------------------------
+
+
+def representative_hands() -> Iterable[list[int]]:
+    """
+    One seven-card hand for every distinct (rank multiset, flush) combination.
+
+    The evaluator's result depends only on the ranks of the seven cards and,
+    when five or more share a suit, on that suit's ranks, so agreeing with a
+    reference evaluator on these hands means agreeing on all 133,784,560.
+    """
+    for counts in _rank_multisets(7):
+        ranks = [r for r, c in enumerate(counts) for _ in range(c)]
+        # consecutive copies of a rank get distinct suits, no suit reaches five
+        yield [r * 4 + i % 4 for i, r in enumerate(ranks)]
+    for size in (5, 6, 7):
+        for suited in combinations(range(13), size):
+            # suited ranks in hearts, the rest off-suit on the lowest free ranks
+            cards = [r * 4 + 2 for r in suited]
+            cards += [r * 4 for r in range(7 - size)]
+            yield cards
+
+
+def verify(progress: bool = False) -> int:
+    """
+    Checks that the evaluator orders every hand class exactly like pokerkit's
+    StandardHighHand. Returns the number of hands compared.
+    """
+    from pokerkit import StandardHighHand
+
+    load_tables()
+    hands = []
+    for i, cards in enumerate(representative_hands()):
+        text = "".join(format_card(c) for c in cards)
+        hands.append((evaluate(cards), StandardHighHand.from_game(text[:4], text[4:]), text))
+        if progress and i % 10000 == 0:
+            print(f"  {i} hands evaluated", file=sys.stderr)
+
+    hands.sort(key=lambda item: item[0])
+    for (ours_a, theirs_a, text_a), (ours_b, theirs_b, text_b) in zip(hands, hands[1:]):
+        if (ours_a == ours_b) != (theirs_a == theirs_b) or (
+            ours_a < ours_b and not theirs_a < theirs_b
+        ):
+            raise AssertionError(
+                f"evaluator disagrees with pokerkit: {text_a} ({ours_a}, {theirs_a}) "
+                f"vs {text_b} ({ours_b}, {theirs_b})"
+            )
+    return len(hands)
+
+
+def bench(count: int = 20000, seed: int = 7) -> dict:
+    """Evaluations per second of this evaluator and of pokerkit on random hands."""
+    import random
+    import time
+    from pokerkit import StandardHighHand
+
+    load_tables()
+    rng = random.Random(seed)
+    hands = [rng.sample(range(52), 7) for _ in range(count)]
+    texts = ["".join(format_card(c) for c in cards) for cards in hands]
+
+    started = time.perf_counter()
+    for cards in hands:
+        evaluate(cards)
+    ours = count / (time.perf_counter() - started)
+
+    sample = texts[: max(1, count // 20)]
+    started = time.perf_counter()
+    for text in sample:
+        StandardHighHand.from_game(text[:4], text[4:])
+    theirs = len(sample) / (time.perf_counter() - started)
+
+    return {"evaluator_per_sec": ours, "pokerkit_per_sec": theirs, "speedup": ours / theirs}
+
+
+def main(argv: list[str] | None = None) -> int:
+    import time
+
+    command = (argv if argv is not None else sys.argv[1:] or ["build"])[0]
+    if command == "build":
+        started = time.perf_counter()
+        write_tables()
+        print(f"Wrote {TABLE_PATH} in {time.perf_counter() - started:.2f}s")
+    elif command == "verify":
+        started = time.perf_counter()
+        compared = verify(progress=True)
+        print(
+            f"Evaluator agrees with pokerkit on all {compared} representative hands "
+            f"({time.perf_counter() - started:.1f}s)"
+        )
+    elif command == "bench":
+        result = bench()
+        print(
+            f"evaluator: {result['evaluator_per_sec']:,.0f} hands/s, "
+            f"pokerkit: {result['pokerkit_per_sec']:,.0f} hands/s, "
+            f"speedup {result['speedup']:.0f}x"
+        )
+    else:
+        print(f"unknown command {command!r}; expected build, verify or bench", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
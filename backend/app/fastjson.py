@@ -0,0 +1,42 @@
+# app/fastjson.py
+"""
+JSON output of hand records for the paths that still hold Python objects.
+
+GET /hands, GET /hands/{id} and the ndjson stream send records that
+PostgreSQL has already assembled as JSON text (app/repository.py), so the
+JSONB payload and payoffs are neither decoded into dicts nor encoded again.
+A hand that was just saved (and is put in the response cache) or that
+comes from an in-memory repository is written here instead: one shared C
+encoder, compact, without the circular-reference check and without
+escaping non-ASCII, which is what json.dumps rebuilds on every call that
+passes options.
+"""
+import json
+
+from .models_entity import HandEntity
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(",", ":"))
+
+
+def dumps(value) -> bytes:
+    """Compact UTF-8 JSON of plain dicts, lists, strings and numbers."""
+    return _ENCODER.encode(value).encode()
+
+
+def hand_record(h: HandEntity) -> dict:
+    """The API record of a stored hand (the shape of HandStored)."""
+    return {
+        "id": str(h.id),
+        "payload": h.payload_json,
+        "payoffs": h.payoffs_json,
+        "created_at": h.created_at.isoformat(),
+    }
+
+
+def hand_record_json(h: HandEntity) -> bytes:
+    return dumps(hand_record(h))
+
+
+def json_array(records) -> bytes:
+    """A JSON array of records that are JSON already."""
+    return b"[" + b",".join(records) + b"]"
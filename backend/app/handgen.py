@@ -0,0 +1,213 @@
+# app/handgen.py
+"""
+Deterministic generator of legal synthetic hands in the payload format that
+POST /hands accepts. Every action is chosen among the moves pokerkit allows
+at that point, so generated hands always replay cleanly. Each seat plays by
+an ActionPolicy (how often it folds, bets or raises, goes all-in, and how
+big its raises are). Used by the tests, the benchmarks and the load
+generator (app/loadgen.py).
+
+Usage:
+    python -m app.handgen --count 10000 --out hands.ndjson
+    python -m app.handgen --count 10000 --policy tight --policy aggressive --players 6
+"""
+import sys
+import json
+import random
+import uuid
+import argparse
+from dataclasses import dataclass
+from typing import Iterator
+
+from .poker_service import new_pokerkit_state
+
+RANKS = "23456789TJQKA"
+SUITS = "cdhs"
+DECK = [r + s for r in RANKS for s in SUITS]
+
+
+@dataclass(frozen=True)
+class ActionPolicy:
+    """
+    How one seat plays. Whenever it may bet or raise it does so with
+    probability ``raise_p`` (all-in with ``all_in_p``, otherwise to between
+    the minimum and ``raise_multiple`` times the minimum); otherwise, when
+    facing a bet, it folds with probability ``fold_p``, and checks or calls
+    the rest of the time.
+    """
+
+    fold_p: float = 0.3
+    raise_p: float = 0.2
+    all_in_p: float = 0.1
+    raise_multiple: int = 3
+
+
+POLICIES = {
+    "random": ActionPolicy(),
+    "tight": ActionPolicy(fold_p=0.6, raise_p=0.1, all_in_p=0.02),
+    "loose": ActionPolicy(fold_p=0.1, raise_p=0.15, all_in_p=0.05),
+    "aggressive": ActionPolicy(fold_p=0.2, raise_p=0.5, all_in_p=0.15, raise_multiple=4),
+    "station": ActionPolicy(fold_p=0.05, raise_p=0.02, all_in_p=0.0),
+}
+
+
+@dataclass
+class GeneratedHand:
+    payload: dict
+    payoffs: dict
+    showdown: bool  # two or more players were still in at the end
+
+
+def _random_stacks(rng: random.Random, n: int, short_stack_p: float) -> list[int]:
+    stacks = []
+    for _ in range(n):
+        if rng.random() < short_stack_p:
+            stacks.append(rng.randrange(30, 400, 10))
+        else:
+            stacks.append(rng.randrange(800, 5000, 20))
+    return stacks
+
+
+def generate_hand(
+    rng: random.Random,
+    num_players: int | None = None,
+    fold_p: float = 0.3,
+    raise_p: float = 0.2,
+    all_in_p: float = 0.1,
+    short_stack_p: float = 0.15,
+    policies: list[ActionPolicy] | None = None,
+) -> GeneratedHand:
+    """
+    Plays one random hand through pokerkit.
+
+    Args:
+        rng: Source of randomness; the same seed gives the same hand.
+        num_players: 2 to 6, random when None.
+        fold_p: Chance a player facing a bet folds.
+        raise_p: Chance a player bets or raises when allowed.
+        all_in_p: Chance such a bet or raise is all-in.
+        short_stack_p: Chance a player starts with a short stack.
+        policies: Policy per seat, in pokerkit order (small blind first) and
+            repeated when shorter than the table; replaces the three
+            probabilities above.
+    """
+    n = num_players or rng.randint(2, 6)
+    if not policies:
+        policies = [ActionPolicy(fold_p=fold_p, raise_p=raise_p, all_in_p=all_in_p)]
+    stacks = _random_stacks(rng, n, short_stack_p)
+    deck = DECK[:]
+    rng.shuffle(deck)
+    holes = [deck.pop() + deck.pop() for _ in range(n)]
+    ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(n)]
+    names = [f"Player {i + 1}" for i in range(n)]
+
+    state = new_pokerkit_state(stacks)
+    for cards in holes:
+        state.deal_hole(cards)
+
+    actions = []
+    board = []
+    folds = 0
+    final_pot = 0
+    while state.status:
+        final_pot = max(final_pot, state.total_pot_amount)
+        if state.can_burn_card():
+            state.burn_card("??")
+            count = 3 if not state.board_cards else 1
+            dealt = [deck.pop() for _ in range(count)]
+            board.extend(dealt)
+            cards = "".join(dealt)
+            state.deal_board(cards)
+            street = {3: "F", 4: "T", 5: "R"}[len(state.board_cards)]
+            actions.append(f"{street}[{cards}]")
+        elif state.actor_index is not None:
+            policy = policies[state.actor_index % len(policies)]
+            facing = state.checking_or_calling_amount
+            if state.can_complete_bet_or_raise_to() and rng.random() < policy.raise_p:
+                low = state.min_completion_betting_or_raising_to_amount
+                high = state.max_completion_betting_or_raising_to_amount
+                if rng.random() < policy.all_in_p:
+                    amount = high
+                else:
+                    amount = min(high, rng.randint(low, policy.raise_multiple * low))
+                prefix = "b" if max(state.bets) == 0 else "r"
+                state.complete_bet_or_raise_to(amount)
+                actions.append(f"{prefix}{amount}")
+            elif facing and state.can_fold() and rng.random() < policy.fold_p:
+                state.fold()
+                folds += 1
+                actions.append("f")
+            else:
+                state.check_or_call()
+                actions.append("c" if facing else "x")
+        else:
+            raise RuntimeError("generated hand got stuck")
+
+    payoffs = {ids[i]: payoff for i, payoff in enumerate(state.payoffs)}
+
+    # payload lists players in table order starting anywhere, like the frontend
+    offset = rng.randrange(n)
+    order = [(offset + i) % n for i in range(n)]
+    payload = {
+        "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        "dealer": names[n - 1],
+        "smallBlind": names[0],
+        "bigBlind": names[1],
+        "players": [
+            {
+                "id": ids[i],
+                "name": names[i],
+                "stack": stacks[i],
+                "cards": holes[i],
+                "winnings": payoffs[ids[i]],
+            }
+            for i in order
+        ],
+        "actions": actions,
+        "communityCards": board,
+        "finalPot": final_pot,
+    }
+    return GeneratedHand(payload=payload, payoffs=payoffs, showdown=n - folds >= 2)
+
+
+def generate_hands(
+    seed: int = 1,
+    count: int | None = None,
+    num_players: int | None = None,
+    policies: list[ActionPolicy] | None = None,
+) -> Iterator[GeneratedHand]:
+    """Yields ``count`` hands (endlessly when None), the same ones for a given seed."""
+    rng = random.Random(seed)
+    produced = 0
+    while count is None or produced < count:
+        yield generate_hand(rng, num_players=num_players, policies=policies)
+        produced += 1
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.handgen")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--players", type=int, choices=range(2, 7), help="random 2-6 when omitted")
+    parser.add_argument(
+        "--policy",
+        action="append",
+        choices=list(POLICIES),
+        help="seat policy, repeatable: seats take them in turn from the small blind",
+    )
+    parser.add_argument("--out", help="ndjson file to write (stdout when omitted)")
+    args = parser.parse_args(argv)
+
+    policies = [POLICIES[name] for name in args.policy or ["random"]]
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        for g in generate_hands(args.seed, args.count, args.players, policies):
+            out.write(json.dumps(g.payload, separators=(",", ":")) + "\n")
+    finally:
+        if args.out:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,520 @@
+# app/histories.py
+"""
+Import of third-party hand histories: the PokerStars-style text logs that
+players download from their poker client.
+
+Usage:
+    python -m app.histories HH20250102.txt
+    python -m app.histories archive/*.txt.gz --workers 8 --chunk-hands 10000
+
+Each hand of a file is translated into the payload format of POST /hands
+(seats, blinds, hole cards, c/x/f, bN/rN, F[...]/T[...]/R[...]) and
+replayed with compute_payoffs_using_pokerkit, both on a process pool. A hand
+is kept only when pokerkit agrees with the amounts the log says each player
+put in and collected. Kept hands are inserted through COPY (app/bulk.py), one
+transaction per --chunk-hands hands. After every chunk the byte offset
+reached is saved in a checkpoint file next to the input (FILE.checkpoint),
+and a new run starts from there, so an interrupted import of a
+multi-gigabyte archive resumes where it stopped. Memory stays bounded
+whatever the file size: the file is read one hand at a time, and only a few
+batches per worker are in flight.
+
+Translation:
+    - Amounts are rescaled so that the big blind is 40, since every hand
+      replays at 20/40 (app/poker_service.py). Hands whose small blind is
+      not half the big blind, or whose amounts do not rescale to whole chips,
+      are skipped.
+    - Ids are derived from the hand number and the screen names (uuid5), so
+      a hand imported twice is stored once and a player keeps one id.
+    - Hole cards the log does not show (folded or mucked hands) are filled
+      in with cards nobody else holds. They never change the payoffs of a
+      hand that passes verification.
+    - Rake is not modeled: payoffs and winnings are pokerkit's, so the
+      winners' share of the rake is added back to their results.
+    - created_at is the time of the import, not the time the hand was
+      played: hands are partitioned and archived by created_at
+      (app/partitions.py), and a file of old hands would otherwise create
+      partitions for months long past that the next maintenance run archives
+      straight away. The time from the header is kept in the payload as
+      playedAt (UTC, ISO 8601); it is in the stored JSON and in exports, but
+      not in reads through the binary encoding, which drops keys HandIn does
+      not know (app/codec.py).
+    - Hands with antes, straddles, dead blinds, run-it-twice boards, more
+      than 6 seated players or games other than no-limit hold'em are
+      skipped and counted by reason.
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import uuid
+import logging
+import argparse
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from fractions import Fraction
+from typing import Iterator, NamedTuple
+from zoneinfo import ZoneInfo
+
+from .bulk import HandRow, _Progress, _compact, _copy_line, copy_hands, map_batches
+from .handgen import DECK
+from .idempotency import payload_hash
+from .parsing import HandParseError
+from .poker_service import BIG_BLIND_AMOUNT, SMALL_BLIND_AMOUNT, compute_payoffs_using_pokerkit
+
+logger = logging.getLogger(__name__)
+
+# uuid5 namespace of the hand and player ids of imported histories
+HISTORY_NAMESPACE = uuid.UUID("6f1d8c9e-2b7a-5c43-9e0f-3a5b7d9c1e24")
+# a block longer than this is no hand; it is cut and then skipped as malformed
+MAX_HAND_LINES = 2000
+
+_HEADER = re.compile(r"^PokerStars (?:Zoom |Home Game )?Hand #(\d+):")
+_BUTTON = re.compile(r"Seat #(\d+) is the button")
+_SEAT = re.compile(r"^Seat (\d+): (.+) \((\S+) in chips[^)]*\)(.*)$")
+_STREET = re.compile(r"^\*\*\* (.+?) \*\*\*(.*)$")
+_CARDS = re.compile(r"\[([^\]]*)\]")
+_HOLE = re.compile(r"\[([2-9TJQKA][cdhs]) ([2-9TJQKA][cdhs])\]")
+_DEALT = re.compile(r"^Dealt to (.+?) \[([2-9TJQKA][cdhs]) ([2-9TJQKA][cdhs])\]$")
+_UNCALLED = re.compile(r"^Uncalled bet \((\S+)\) returned to (.+)$")
+_COLLECTED = re.compile(r"^(.+) collected (\S+) from (?:side |main )?pot")
+_RAISE = re.compile(r"^raises \S+ to (\S+)")
+_SUMMARY_CARDS = re.compile(r"(?:showed|mucked) \[([2-9TJQKA][cdhs]) ([2-9TJQKA][cdhs])\]")
+_TIME = re.compile(r"(\d{4}/\d{2}/\d{2} \d{1,2}:\d{2}:\d{2}) ([A-Z]{2,4})\b")
+# time zones of the header timestamps; PokerStars always writes ET as well
+_ZONES = {"ET": "America/New_York", "UTC": "UTC", "GMT": "UTC"}
+_BOARD_STREETS = {"FLOP": ("F", 3), "TURN": ("T", 1), "RIVER": ("R", 1)}
+
+
+class UnsupportedHand(ValueError):
+    """Raised for a hand history that is not imported; ``reason`` is the label it is counted under."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class HandText(NamedTuple):
+    end: int  # byte offset just past the hand, where a resumed read starts
+    text: str
+
+
+class Translated(NamedTuple):
+    payload: dict
+    nets: dict  # player id -> chips collected minus chips put in, rescaled
+    collectors: frozenset  # ids of the players who collected chips
+    rake: int
+
+
+def read_hand_texts(f, offset: int = 0) -> Iterator[HandText]:
+    """
+    Splits a binary file object, positioned at ``offset``, into the text of
+    each hand; anything before the first hand header is skipped.
+    """
+    lines: list[str] = []
+    position = offset
+    for raw in f:
+        line = raw.decode("utf-8", "replace").lstrip("\ufeff").rstrip()
+        if _HEADER.match(line):
+            if lines:
+                yield HandText(position, "\n".join(lines))
+            lines = [line]
+        elif lines and line and len(lines) < MAX_HAND_LINES:
+            lines.append(line)
+        position += len(raw)
+    if lines:
+        yield HandText(position, "\n".join(lines))
+
+
+def _amount(token: str) -> Decimal:
+    try:
+        return Decimal(re.sub(r"[^\d.]", "", token))
+    except InvalidOperation:
+        raise UnsupportedHand("malformed", f"invalid amount {token!r}")
+
+
+def _played_at(header: str) -> str | None:
+    for stamp, zone in _TIME.findall(header):
+        if zone in _ZONES:
+            local = datetime.strptime(stamp, "%Y/%m/%d %H:%M:%S").replace(tzinfo=ZoneInfo(_ZONES[zone]))
+            return local.astimezone(timezone.utc).isoformat()
+    return None
+
+
+def _player_id(name: str) -> str:
+    return str(uuid.uuid5(HISTORY_NAMESPACE, f"player:{name}"))
+
+
+def translate(text: str) -> Translated:
+    """
+    Translates the text of one PokerStars hand into a HandIn payload (with
+    winnings left at 0) and the results the log reports.
+
+    Raises:
+        UnsupportedHand: If the hand cannot be replayed at 20/40 as logged.
+    """
+    lines = text.splitlines()
+    header = _HEADER.match(lines[0]) if lines else None
+    if header is None:
+        raise UnsupportedHand("malformed", "no hand header")
+    if "Hold'em No Limit" not in lines[0]:
+        raise UnsupportedHand("game", "not a no-limit hold'em hand")
+
+    button = None
+    seats: dict[int, tuple[str, Decimal]] = {}  # seat -> (name, stack), dealt in only
+    names: list[str] = []  # longest first, to find the actor of a line
+    blinds: dict[str, tuple[str, Decimal]] = {}  # "small"/"big" -> (name, amount)
+    holes: dict[str, tuple[str, str]] = {}
+    street_bets: dict[str, Decimal] = {}
+    invested: dict[str, Decimal] = {}
+    collected: dict[str, Decimal] = {}
+    actions: list[tuple[str, Decimal | None]] = []  # token, bet-to amount to rescale
+    board: list[str] = []
+    section = "setup"
+
+    def actor(line: str) -> tuple[str, str] | None:
+        for name in names:
+            if line.startswith(name) and line[len(name) : len(name) + 2] == ": ":
+                return name, line[len(name) + 2 :]
+        return None
+
+    def put_in(name: str, total: Decimal):
+        invested[name] = invested.get(name, Decimal(0)) + total - street_bets.get(name, Decimal(0))
+        street_bets[name] = total
+
+    for line in lines[1:]:
+        street = _STREET.match(line)
+        if street:
+            marker = street[1]
+            if marker in _BOARD_STREETS:
+                prefix, count = _BOARD_STREETS[marker]
+                cards = _CARDS.findall(street[2])
+                dealt = cards[-1].split() if cards else []
+                if len(dealt) != count:
+                    raise UnsupportedHand("malformed", f"{marker} must deal {count} card(s)")
+                board += dealt
+                actions.append((f"{prefix}[{''.join(dealt)}]", None))
+                street_bets = {}
+                section = "street"
+            elif marker == "HOLE CARDS":
+                section = "street"
+            elif marker in ("SHOW DOWN", "SUMMARY"):
+                section = marker.lower()
+            else:  # FIRST FLOP, SECOND RIVER, ...
+                raise UnsupportedHand("run_twice", f"unsupported board: {marker}")
+            continue
+
+        if section == "summary":
+            seat = re.match(r"^Seat (\d+): ", line)
+            shown = _SUMMARY_CARDS.search(line)
+            if seat and shown and int(seat[1]) in seats:
+                holes[seats[int(seat[1])][0]] = (shown[1], shown[2])
+            continue
+
+        if section == "setup":
+            found = _BUTTON.search(line)
+            if found:
+                button = int(found[1])
+                continue
+            seat = _SEAT.match(line)
+            if seat:
+                if "sitting out" not in seat[4] and "out of hand" not in seat[4]:
+                    seats[int(seat[1])] = (seat[2], _amount(seat[3]))
+                    names = sorted((n for n, _ in seats.values()), key=len, reverse=True)
+                continue
+
+        acted = actor(line)
+        if acted is not None:
+            name, rest = acted
+            if rest.startswith("posts small blind ") or rest.startswith("posts big blind "):
+                kind = "small" if rest.startswith("posts small") else "big"
+                if section != "setup" or kind in blinds:
+                    raise UnsupportedHand("blinds", f"{name} posts a second {kind} blind")
+                amount = _amount(rest.rsplit(" ", 1)[1])
+                blinds[kind] = (name, amount)
+                put_in(name, amount)
+            elif rest.startswith("posts the ante"):
+                raise UnsupportedHand("ante", "hand with antes")
+            elif rest.startswith("posts"):
+                raise UnsupportedHand("blinds", f"unsupported post: {rest}")
+            elif rest.startswith("folds"):
+                actions.append(("f", None))
+            elif rest == "checks":
+                actions.append(("x", None))
+            elif rest.startswith("calls "):
+                put_in(name, street_bets.get(name, Decimal(0)) + _amount(rest.split()[1]))
+                actions.append(("c", None))
+            elif rest.startswith("bets "):
+                put_in(name, street_bets.get(name, Decimal(0)) + _amount(rest.split()[1]))
+                actions.append(("b", street_bets[name]))
+            elif rest.startswith("raises "):
+                raised = _RAISE.match(rest)
+                if raised is None:
+                    raise UnsupportedHand("malformed", f"invalid raise: {rest}")
+                put_in(name, _amount(raised[1]))
+                actions.append(("r", street_bets[name]))
+            elif rest.startswith("shows "):
+                shown = _HOLE.search(rest)
+                if shown:
+                    holes[name] = (shown[1], shown[2])
+            continue
+
+        dealt = _DEALT.match(line)
+        if dealt and dealt[1] in names:
+            holes[dealt[1]] = (dealt[2], dealt[3])
+            continue
+        uncalled = _UNCALLED.match(line)
+        if uncalled and uncalled[2] in names:
+            name = uncalled[2]
+            put_in(name, street_bets.get(name, Decimal(0)) - _amount(uncalled[1]))
+            continue
+        won = _COLLECTED.match(line)
+        if won and won[1] in names:
+            collected[won[1]] = collected.get(won[1], Decimal(0)) + _amount(won[2])
+
+    if section != "summary":
+        raise UnsupportedHand("malformed", "hand ends before its summary")
+    if "small" not in blinds or "big" not in blinds:
+        raise UnsupportedHand("blinds", "missing blind")
+
+    # every amount in chips of a 20/40 game
+    factor = Fraction(BIG_BLIND_AMOUNT) / Fraction(blinds["big"][1])
+
+    def chips(amount: Decimal) -> int:
+        value = Fraction(amount) * factor
+        if value.denominator != 1:
+            raise UnsupportedHand("scale", f"{amount} is no whole number of chips at {factor} per unit")
+        return int(value)
+
+    if chips(blinds["small"][1]) != SMALL_BLIND_AMOUNT:
+        raise UnsupportedHand("blinds", "the small blind is not half the big blind")
+
+    table = [seats[n] for n in sorted(seats)]  # (name, stack) in seat order
+    if not 2 <= len(table) <= 6:
+        raise UnsupportedHand("players", f"{len(table)} players dealt in")
+    order = [name for name, _ in table]
+    small, big = blinds["small"][0], blinds["big"][0]
+    if small not in order or big not in order:
+        raise UnsupportedHand("blinds", "a blind was posted by a player who is not dealt in")
+    start = order.index(small)
+    rotated = order[start:] + order[:start]
+    dealer = seats[button][0] if button in seats else rotated[-1]
+    if len(order) == 2:
+        if dealer != small:
+            raise UnsupportedHand("seating", "the heads-up small blind is not on the button")
+        # pokerkit's first heads-up seat posts the big blind, and the payload's
+        # smallBlind names the first seat (see app/handgen.py)
+        first, second = big, small
+    else:
+        if rotated[1] != big:
+            raise UnsupportedHand("seating", "the big blind does not follow the small blind")
+        first, second = small, big
+
+    used = set(board) | {card for cards in holes.values() for card in cards}
+    spare = (card for card in DECK if card not in used)
+    ids = {name: _player_id(name) for name in order}
+    players = []
+    for name, stack in table:
+        cards = holes.get(name) or (next(spare), next(spare))
+        players.append(
+            {"id": ids[name], "name": name, "stack": chips(stack), "cards": "".join(cards), "winnings": 0}
+        )
+
+    pot = sum(invested.values(), Decimal(0))
+    rake = pot - sum(collected.values(), Decimal(0))
+    if rake < 0:
+        raise UnsupportedHand("malformed", "more chips collected than put in")
+    payload = {
+        "id": str(uuid.uuid5(HISTORY_NAMESPACE, f"hand:{header[1]}")),
+        "dealer": dealer,
+        "smallBlind": first,
+        "bigBlind": second,
+        "players": players,
+        "actions": [token if amount is None else f"{token}{chips(amount)}" for token, amount in actions],
+        "communityCards": board,
+        "finalPot": chips(pot),
+    }
+    played_at = _played_at(lines[0])
+    if played_at is not None:
+        payload["playedAt"] = played_at
+    nets = {
+        ids[name]: chips(collected.get(name, Decimal(0)) - invested.get(name, Decimal(0)))
+        for name in order
+    }
+    return Translated(
+        payload=payload,
+        nets=nets,
+        collectors=frozenset(ids[name] for name in collected if collected[name] > 0),
+        rake=chips(rake),
+    )
+
+
+def verified_row(hand: Translated) -> HandRow:
+    """
+    Replays a translated hand with pokerkit and returns it as a row to insert.
+
+    Raises:
+        UnsupportedHand: If pokerkit's payoffs differ from the logged results
+            by more than the rake taken from the winners.
+    """
+    payoffs = compute_payoffs_using_pokerkit(hand.payload)
+    extra = {pid: payoffs.get(pid, 0) - net for pid, net in hand.nets.items()}
+    if sum(extra.values()) != hand.rake or any(
+        value < 0 or (value > 0 and pid not in hand.collectors) for pid, value in extra.items()
+    ):
+        raise UnsupportedHand("payoffs", f"pokerkit payoffs {payoffs} differ from the log {hand.nets}")
+    payload = {
+        **hand.payload,
+        "players": [{**p, "winnings": payoffs[p["id"]]} for p in hand.payload["players"]],
+    }
+    return HandRow(
+        id=payload["id"],
+        created_at=None,  # stored at import time (see the module docstring)
+        content_hash=payload_hash(payload),
+        payload=_compact(payload),
+        payoffs=_compact(payoffs),
+    )
+
+
+def _import_batch(batch: list[HandText]) -> list[tuple[HandRow | None, str | None]]:
+    """(row, None) for each hand kept, (None, reason) for each hand skipped."""
+    results = []
+    for item in batch:
+        try:
+            results.append((verified_row(translate(item.text)), None))
+        except UnsupportedHand as e:
+            logger.debug("hand skipped (%s): %s", e.reason, e)
+            results.append((None, e.reason))
+        except HandParseError as e:
+            logger.debug("hand skipped (invalid): %s", e)
+            results.append((None, "invalid"))
+        except Exception as e:
+            logger.debug("hand skipped (replay): %s", e)
+            results.append((None, "replay"))
+    return results
+
+
+def _load_checkpoint(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_checkpoint(path: str, state: dict):
+    partial = path + ".tmp"
+    with open(partial, "w") as f:
+        json.dump(state, f)
+    os.replace(partial, path)
+
+
+def _open_source(path: str):
+    raw = open(path, "rb")
+    if raw.read(2) == b"\x1f\x8b":
+        raw.seek(0)
+        return gzip.open(raw, "rb")
+    raw.seek(0)
+    return raw
+
+
+def import_file(
+    conn,
+    path: str,
+    workers: int,
+    chunk_hands: int = 5000,
+    checkpoint: str | None = None,
+    batch_size: int = 64,
+) -> dict:
+    """
+    Imports the hands of a PokerStars hand history file (plain or gzip),
+    resuming from its checkpoint (``path`` + ".checkpoint" by default).
+
+    Returns:
+        The checkpoint state: the byte offset reached, hands read, kept and
+        inserted, and hands skipped by reason; plus this run's hands/s.
+    """
+    checkpoint = checkpoint or path + ".checkpoint"
+    state = {"offset": 0, "hands": 0, "kept": 0, "inserted": 0, "skipped": {}}
+    state.update(_load_checkpoint(checkpoint))
+    if state["offset"]:
+        logger.info("resuming %s at byte %d after %d hands", path, state["offset"], state["hands"])
+    progress = _Progress("imported", unit="hands")
+    exhausted = False
+
+    with _open_source(path) as f:
+        f.seek(state["offset"])
+        results = map_batches(_import_batch, read_hand_texts(f, state["offset"]), workers, batch_size)
+
+        def chunk() -> Iterator[bytes]:
+            nonlocal exhausted
+            kept = 0
+            for item, (row, reason) in results:
+                state["offset"] = item.end
+                state["hands"] += 1
+                progress.tick()
+                if row is None:
+                    state["skipped"][reason] = state["skipped"].get(reason, 0) + 1
+                    continue
+                state["kept"] += 1
+                yield _copy_line(row)
+                kept += 1
+                if kept >= chunk_hands:
+                    return
+            exhausted = True
+
+        while not exhausted:
+            with conn:
+                with conn.cursor() as cur:
+                    state["inserted"] += copy_hands(cur, chunk())
+            _save_checkpoint(checkpoint, state)
+
+    logger.info("imported %d hands (%.0f hands/s)", progress.rows, progress.rate())
+    return {**state, "rate": progress.rate()}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.histories")
+    parser.add_argument("paths", nargs="+", help="PokerStars hand history files (.txt or .gz)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-hands", type=int, default=5000, help="hands inserted per transaction")
+    parser.add_argument("--batch-size", type=int, default=64, help="hands per worker task")
+    parser.add_argument("--restart", action="store_true", help="ignore saved checkpoints")
+    parser.add_argument(
+        "--no-stats", action="store_true", help="skip recording player statistics after import"
+    )
+    args = parser.parse_args(argv)
+
+    import psycopg2
+    from .logs import configure_logging
+    from .repository import DB_URL, HandRepository
+
+    configure_logging()
+    if not DB_URL:
+        print("DATABASE_URL not provided (set environment variable).", file=sys.stderr)
+        return 1
+
+    conn = psycopg2.connect(DB_URL)
+    try:
+        for path in args.paths:
+            if args.restart and os.path.exists(path + ".checkpoint"):
+                os.remove(path + ".checkpoint")
+            result = import_file(conn, path, args.workers, args.chunk_hands, batch_size=args.batch_size)
+            skipped = ", ".join(f"{n} {reason}" for reason, n in sorted(result["skipped"].items()))
+            print(
+                f"{path}: read {result['hands']} hand(s): {result['inserted']} inserted, "
+                f"{result['kept'] - result['inserted']} already stored, "
+                f"{sum(result['skipped'].values())} skipped{f' ({skipped})' if skipped else ''}; "
+                f"{result['rate']:,.0f} hands/s"
+            )
+        if not args.no_stats:
+            hands, rows = HandRepository(db_url=DB_URL).backfill_player_stats()
+            print(f"Recorded {rows} player row(s) for {hands} hand(s)")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+# app/idempotency.py
+"""
+Content hashes of hand payloads, used to recognise client retries.
+
+Two payloads are the same submission when they are equal as JSON values once
+the hand id is normalised: key order, whitespace and the spelling of the UUID
+do not matter.
+"""
+import json
+import uuid
+import hashlib
+
+
+def canonical_payload(payload: dict) -> bytes:
+    """Serializes a payload deterministically (sorted keys, no whitespace)."""
+    canonical = dict(payload)
+    try:
+        canonical["id"] = str(uuid.UUID(str(payload.get("id"))))
+    except ValueError:
+        pass
+    return json.dumps(
+        canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def payload_hash(payload: dict) -> str:
+    """Hex SHA-256 of the canonical payload."""
+    return hashlib.sha256(canonical_payload(payload)).hexdigest()
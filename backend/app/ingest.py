@@ -0,0 +1,224 @@
+# app/ingest.py
+"""
+Write-behind ingestion: POST /hands can hand a validated hand to an
+in-process queue and answer 202 straight away. Background tasks on the
+event loop take hands off the queue in micro-batches, replay them through
+the ReplayService and store each batch with one multi-row INSERT.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Callable
+
+from .cache import TTLCache
+from .idempotency import payload_hash
+from .models_entity import HandEntity
+from .parsing import ParsedHand
+from .profiling import run_in_threadpool
+from .replay import ReplayService
+from .repository import HandRepository
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class IngestQueueFull(RuntimeError):
+    """Raised when the queue is at capacity (or shutting down) and cannot take a hand."""
+
+
+class IngestQueue:
+    """
+    Bounded queue of accepted-but-unpersisted hands plus the status of every
+    hand that went through it.
+
+    Args:
+        repository: Returns the repository a batch is saved with.
+        replay: Service used to compute payoffs.
+        maxsize: Hands that may wait in the queue before submit refuses more.
+        workers: Background tasks draining the queue.
+        batch_size: Most hands replayed and inserted together.
+        batch_wait: Seconds a worker waits for a batch to fill up.
+        on_saved: Called with every stored HandEntity (cache warm-up).
+    """
+
+    def __init__(
+        self,
+        repository: Callable[[], HandRepository],
+        replay: ReplayService,
+        maxsize: int = 10000,
+        workers: int = 2,
+        batch_size: int = 100,
+        batch_wait: float = 0.05,
+        status_size: int = 100000,
+        status_ttl: float = 3600.0,
+        on_saved: Callable[[HandEntity], None] | None = None,
+    ):
+        self._repository = repository
+        self._replay = replay
+        self.maxsize = maxsize
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._on_saved = on_saved
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+        # id -> content hash of the hands still waiting or being processed
+        self._pending: dict[str, str] = {}
+        self._finished = TTLCache(maxsize=status_size, ttl=status_ttl)
+        self._stats = {"accepted": 0, "done": 0, "failed": 0, "batches": 0}
+
+    @classmethod
+    def from_env(cls, repository, replay, on_saved=None) -> "IngestQueue":
+        return cls(
+            repository,
+            replay,
+            maxsize=int(os.getenv("INGEST_QUEUE_SIZE", "10000")),
+            workers=int(os.getenv("INGEST_WORKERS", "2")),
+            batch_size=int(os.getenv("INGEST_BATCH_SIZE", "100")),
+            batch_wait=float(os.getenv("INGEST_BATCH_WAIT", "0.05")),
+            on_saved=on_saved,
+        )
+
+    def _ensure_started(self):
+        # tasks live on the loop that serves requests, so start on first use
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._tasks = [
+                asyncio.create_task(self._worker(), name=f"ingest-worker-{i}")
+                for i in range(self.workers)
+            ]
+
+    def pending_hash(self, key: str) -> str | None:
+        """Content hash of the queued hand with this id, if it is still pending."""
+        return self._pending.get(key)
+
+    def submit(self, key: str, hand: ParsedHand, payload: dict, digest: str):
+        """
+        Queues a parsed hand (and the payload it came from) for replay and storage.
+
+        Raises:
+            IngestQueueFull: If the queue is full or draining for shutdown.
+        """
+        if self._closing:
+            raise IngestQueueFull("server is shutting down")
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((key, hand, payload, digest, time.monotonic()))
+        except asyncio.QueueFull:
+            raise IngestQueueFull(f"ingest queue is full ({self.maxsize} hands)")
+        self._pending[key] = digest
+        self._stats["accepted"] += 1
+
+    def status(self, key: str) -> dict | None:
+        """{"status": pending|done|failed, ...} of a hand seen by this queue."""
+        if key in self._pending:
+            return {"status": PENDING}
+        return self._finished.get(key)
+
+    def _finish(self, key: str, status: dict):
+        self._pending.pop(key, None)
+        self._finished.set(key, status)
+        self._stats[status["status"]] += 1
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.exception("Ingest batch failed")
+                for key, *_ in batch:
+                    # hands whose replay failed are finished already
+                    if key in self._pending:
+                        self._finish(key, {"status": FAILED, "error": f"storage error: {e}"})
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _process(self, batch: list):
+        self._stats["batches"] += 1
+        outcomes = await asyncio.gather(
+            *(self._replay.replay(hand) for _, hand, *_ in batch),
+            return_exceptions=True,
+        )
+        entities = []
+        for (key, hand, payload, digest, _), outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error("pokerkit failed for queued hand %s: %s", key, outcome)
+                self._finish(
+                    key, {"status": FAILED, "error": f"pokerkit evaluation error: {outcome}"}
+                )
+                continue
+            entities.append(
+                HandEntity(
+                    id=key,
+                    payload_json=payload,
+                    payoffs_json=outcome,
+                    content_hash=digest,
+                    parsed=hand,
+                )
+            )
+        if not entities:
+            return
+
+        repo = self._repository()
+        saved = {h.id for h in await run_in_threadpool(repo.save_many, entities)}
+        missing = [h.id for h in entities if h.id not in saved]
+        existing = await run_in_threadpool(repo.find_existing, missing) if missing else {}
+        for h in entities:
+            if h.id in saved:
+                if self._on_saved is not None:
+                    self._on_saved(h)
+                self._finish(h.id, {"status": DONE, "payoffs": h.payoffs_json})
+                continue
+            stored = existing.get(h.id)
+            stored_hash = stored and (stored.content_hash or payload_hash(stored.payload_json))
+            if stored_hash == h.content_hash:
+                # the same hand was stored meanwhile, e.g. by a synchronous retry
+                self._finish(h.id, {"status": DONE, "payoffs": stored.payoffs_json})
+            else:
+                self._finish(h.id, {"status": FAILED, "error": "hand id already exists"})
+
+    async def drain(self, timeout: float | None = None):
+        """
+        Stops accepting hands, waits until every queued hand is stored (or
+        failed) and stops the workers.
+        """
+        self._closing = True
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Ingest queue not drained: %d hand(s) dropped", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Ingest queue drained: %s", self.stats())
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "pending": len(self._pending),
+            "max_size": self.maxsize,
+            **self._stats,
+        }
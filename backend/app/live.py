@@ -0,0 +1,304 @@
+# app/live.py
+"""
+Live hands: one pokerkit state per hand, held in memory while the hand is
+played and advanced one action at a time (the /live/hands endpoints and the
+/live/ws WebSocket in app/main.py).
+
+A hand submitted to POST /hands after the fact has to be replayed from the
+start, and a disputed hand means replaying it again. A live hand instead
+checks and applies each action as it arrives, refusing an illegal one on
+the spot, and answers with what may happen next: the actor, the legal
+actions, the pot and the stacks. When the hand ends its payoffs come
+straight from the state, and it is stored together with the ParsedHand
+built along the way, so it is never replayed.
+
+The store evicts hands idle for LIVE_HAND_IDLE_TIMEOUT seconds and holds at
+most LIVE_HANDS_MAX of them (a six-handed hand takes about 20 KB); starting
+one more than that raises LiveHandLimitError. The store and its hands are
+only used from the event loop, one action at a time, so they take no locks.
+"""
+import os
+import time
+from collections import OrderedDict
+
+from .parsing import (
+    BET_OR_RAISE,
+    BOARD_OPS,
+    CHECK_OR_CALL,
+    FLOP,
+    RIVER,
+    TURN,
+    UNKNOWN,
+    ParsedHand,
+    format_cards,
+    parse_hand,
+    tokenize_action,
+)
+from .poker_service import POKERKIT_CARDS, apply_op, new_pokerkit_state
+
+# board cards dealt so far -> (the next board action, its opcode, cards it deals)
+_NEXT_BOARD = {0: ("F", FLOP, 3), 3: ("T", TURN, 1), 4: ("R", RIVER, 1)}
+
+
+class LiveHandError(ValueError):
+    """Raised for an action the live hand cannot take; the message is meant for the client."""
+
+
+class LiveHandLimitError(RuntimeError):
+    """Raised when the store already holds as many live hands as allowed."""
+
+
+class LiveHand:
+    """
+    A hand being played.
+
+    Args:
+        setup: A HandIn-shaped payload without actions, communityCards,
+            finalPot or winnings (those are filled in as the hand is played).
+
+    Raises:
+        HandParseError: If the setup is not a valid hand.
+    """
+
+    def __init__(self, setup: dict):
+        self.setup = {
+            **setup,
+            "players": [
+                {**p, "winnings": 0} if isinstance(p, dict) else p
+                for p in setup.get("players") or []
+            ],
+            "actions": [],
+            "communityCards": [],
+            "finalPot": 0,
+        }
+        hand = parse_hand(self.setup)
+        self.id = hand.id
+        self.seats = hand.seats
+        self.state = new_pokerkit_state([seat.stack for seat in self.seats])
+        for seat in self.seats:
+            self.state.deal_hole([POKERKIT_CARDS[c] for c in seat.cards])
+        self._dealt = {c for seat in self.seats for c in seat.cards}
+        self.board: list[int] = []
+        self.ops = bytearray()
+        self.args: list = []
+        self.actions: list[str] = []
+        self.final_pot = self.state.total_pot_amount
+        self.saved = False
+        self.last_used = time.monotonic()
+
+    @property
+    def complete(self) -> bool:
+        return not self.state.status
+
+    def apply(self, action: str):
+        """
+        Applies one payload action (c, x, f, bN, rN, F[...], T[...], R[...]).
+
+        Raises:
+            LiveHandError: If the action is malformed or not legal now; the
+                hand is left unchanged.
+        """
+        state = self.state
+        if self.complete:
+            raise LiveHandError("the hand is over")
+        try:
+            op, arg = tokenize_action(action)
+        except ValueError as e:
+            raise LiveHandError(str(e))
+        if op == UNKNOWN:
+            raise LiveHandError(f"unknown action {action!r}")
+
+        if op in BOARD_OPS:
+            _, expected, _ = _NEXT_BOARD.get(len(self.board), (None, None, 0))
+            if not state.can_burn_card() or op != expected:
+                raise LiveHandError(f"cannot deal {action!r} now")
+            if self._dealt.intersection(arg):
+                raise LiveHandError(f"{action!r} deals a card that is already out")
+        elif state.actor_index is None:
+            raise LiveHandError("the next board cards must be dealt first")
+        else:
+            self._check_betting(action, op, arg)
+
+        try:
+            apply_op(state, op, arg, action, len(self.actions))
+        except ValueError as e:
+            raise LiveHandError(f"illegal action {action!r}: {e}")
+
+        if op in BOARD_OPS:
+            self.board.extend(arg)
+            self._dealt.update(arg)
+        self.ops.append(op)
+        self.args.append(arg)
+        self.actions.append(action)
+        self.final_pot = max(self.final_pot, state.total_pot_amount)
+
+    def _check_betting(self, action: str, op: int, arg):
+        """
+        Refuses a player action that legal_actions() does not offer: replays
+        take x for c and b for r alike, and let pokerkit settle an all-in
+        amount, but a live client is held to the exact action and range.
+        """
+        state = self.state
+        if op == CHECK_OR_CALL:
+            if not state.can_check_or_call():
+                raise LiveHandError(f"cannot {'check' if action == 'x' else 'call'} now")
+            amount = state.checking_or_calling_amount
+            if action == "x" and amount:
+                raise LiveHandError(f"cannot check: {amount} to call")
+            if action == "c" and not amount:
+                raise LiveHandError("nothing to call: check with 'x'")
+        elif op == BET_OR_RAISE:
+            if not state.can_complete_bet_or_raise_to():
+                raise LiveHandError(f"cannot bet or raise now: {action!r}")
+            expected = "b" if max(state.bets) == 0 else "r"
+            if action[0] != expected:
+                what = "bet" if expected == "b" else "raise"
+                raise LiveHandError(f"{action!r} is not legal now: {what} with '{expected}N'")
+            low = state.min_completion_betting_or_raising_to_amount
+            high = state.max_completion_betting_or_raising_to_amount
+            if not low <= arg <= high:
+                raise LiveHandError(f"{action!r} is not legal now: the amount must be {low} to {high}")
+
+    def legal_actions(self) -> list[dict]:
+        """What may be sent next, in payload syntax; bet and raise amounts are totals for the street."""
+        state = self.state
+        if self.complete:
+            return []
+        if state.actor_index is None:
+            if not state.can_burn_card():
+                return []
+            street, _, count = _NEXT_BOARD[len(self.board)]
+            return [{"action": street, "cards": count}]
+
+        legal = []
+        if state.can_fold():
+            legal.append({"action": "f"})
+        if state.can_check_or_call():
+            amount = state.checking_or_calling_amount
+            legal.append({"action": "c", "amount": amount} if amount else {"action": "x"})
+        if state.can_complete_bet_or_raise_to():
+            legal.append(
+                {
+                    "action": "b" if max(state.bets) == 0 else "r",
+                    "min": state.min_completion_betting_or_raising_to_amount,
+                    "max": state.max_completion_betting_or_raising_to_amount,
+                }
+            )
+        return legal
+
+    def payoffs(self) -> dict:
+        return {seat.id: payoff for seat, payoff in zip(self.seats, self.state.payoffs)}
+
+    def view(self) -> dict:
+        state = self.state
+        actor = state.actor_index
+        view = {
+            "id": self.id,
+            "status": "complete" if self.complete else "active",
+            "actor": self.seats[actor].id if actor is not None else None,
+            "legal_actions": self.legal_actions(),
+            "pot": state.total_pot_amount,
+            "stacks": {seat.id: stack for seat, stack in zip(self.seats, state.stacks)},
+            "bets": {seat.id: bet for seat, bet in zip(self.seats, state.bets)},
+            "board": format_cards(self.board),
+            "actions": len(self.actions),
+        }
+        if self.complete:
+            view["payoffs"] = self.payoffs()
+            view["saved"] = self.saved
+        return view
+
+    def to_hand(self) -> tuple[dict, ParsedHand]:
+        """The payload of the finished hand and its ParsedHand, which parse_hand(payload) equals."""
+        payoffs = self.payoffs()
+        payload = {
+            **self.setup,
+            "players": [
+                {**p, "winnings": payoffs.get(p["id"], 0)} for p in self.setup["players"]
+            ],
+            "actions": list(self.actions),
+            "communityCards": [format_cards((c,)) for c in self.board],
+            "finalPot": self.final_pot,
+        }
+        hand = ParsedHand(
+            id=self.id,
+            seats=self.seats,
+            ops=bytes(self.ops),
+            args=tuple(self.args),
+            actions=tuple(self.actions),
+        )
+        return payload, hand
+
+
+class LiveHandStore:
+    """
+    The live hands of this server process, by hand id.
+
+    Args:
+        max_hands: Most hands held at once.
+        idle_timeout: Seconds without a request after which a hand is evicted.
+    """
+
+    def __init__(self, max_hands: int = 1000, idle_timeout: float = 300.0):
+        self.max_hands = max_hands
+        self.idle_timeout = idle_timeout
+        # least recently used first
+        self._hands: OrderedDict[str, LiveHand] = OrderedDict()
+        self.started = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls) -> "LiveHandStore":
+        return cls(
+            max_hands=int(os.getenv("LIVE_HANDS_MAX", "1000")),
+            idle_timeout=float(os.getenv("LIVE_HAND_IDLE_TIMEOUT", "300")),
+        )
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._hands:
+            key, hand = next(iter(self._hands.items()))
+            if hand.last_used > cutoff:
+                break
+            del self._hands[key]
+            self.evicted += 1
+
+    def start(self, key: str, setup: dict) -> LiveHand:
+        """
+        Starts a live hand under ``key`` (its normalized id).
+
+        Raises:
+            HandParseError: If the setup is not a valid hand.
+            LiveHandError: If a hand with this id is already live.
+            LiveHandLimitError: If the store is full.
+        """
+        self._evict_idle()
+        if key in self._hands:
+            raise LiveHandError(f"hand {setup.get('id')} is already live")
+        if len(self._hands) >= self.max_hands:
+            raise LiveHandLimitError(f"too many live hands ({self.max_hands})")
+        hand = LiveHand(setup)
+        self._hands[key] = hand
+        self.started += 1
+        return hand
+
+    def get(self, key: str) -> LiveHand | None:
+        self._evict_idle()
+        hand = self._hands.get(key)
+        if hand is not None:
+            hand.last_used = time.monotonic()
+            self._hands.move_to_end(key)
+        return hand
+
+    def discard(self, key: str):
+        self._hands.pop(key, None)
+
+    def stats(self) -> dict:
+        self._evict_idle()
+        return {
+            "live": len(self._hands),
+            "max_hands": self.max_hands,
+            "idle_timeout": self.idle_timeout,
+            "started": self.started,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,182 @@
+# app/loadgen.py
+"""
+HTTP load generator for POST /hands.
+
+Usage:
+    python -m app.loadgen --url http://localhost:8000 --rate 200 --duration 30
+    python -m app.loadgen --hands hands.ndjson --rate 500 --concurrency 64 --out load.json
+
+Hands come from an ndjson file (python -m app.handgen) or are generated up
+front with the given seed and seat policies. Each is sent with a fresh id
+(unless --keep-ids), so repeated runs against the same database store new
+hands instead of hitting the idempotent-retry path.
+
+Requests are sent open-loop: hand i is due at start + i / rate whether or
+not earlier requests have been answered, and its latency is measured from
+that due time. A server that falls behind therefore shows up as latency
+instead of quietly lowering the offered load. At most --concurrency
+requests are in flight; a due hand waiting for a free slot counts that wait
+in its latency (the service time, measured from the actual send, is
+reported too).
+"""
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import itertools
+from collections import Counter
+from typing import Iterable
+
+import httpx
+
+from .benchmark import summarize
+from .handgen import POLICIES, generate_hands
+
+logger = logging.getLogger(__name__)
+
+
+def _request_bodies(payloads: Iterable[dict], keep_ids: bool) -> list[bytes]:
+    bodies = []
+    for payload in payloads:
+        if not keep_ids:
+            payload = {**payload, "id": str(uuid.uuid4())}
+        bodies.append(json.dumps(payload, separators=(",", ":")).encode())
+    return bodies
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    bodies: list[bytes],
+    rate: float,
+    concurrency: int = 32,
+    duration: float | None = None,
+) -> dict:
+    """
+    POSTs ``bodies`` to /hands at ``rate`` per second, at most
+    ``concurrency`` at a time, for ``duration`` seconds or until the bodies
+    run out. Returns throughput, error rate and latency percentiles.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    latencies, service_times = [], []
+    statuses: Counter = Counter()
+    tasks = set()
+    headers = {"content-type": "application/json"}
+
+    async def send(body: bytes, due: float):
+        try:
+            sent = time.perf_counter()
+            try:
+                response = await client.post("/hands", content=body, headers=headers)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            done = time.perf_counter()
+            latencies.append(done - due)
+            service_times.append(done - sent)
+        finally:
+            slots.release()
+
+    started = time.perf_counter()
+    for i, body in enumerate(bodies):
+        due = started + i / rate
+        if duration is not None and due - started >= duration:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await slots.acquire()
+        task = asyncio.create_task(send(body, due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    sent = sum(statuses.values())
+    ok = sum(n for status, n in statuses.items() if status.isdigit() and int(status) < 400)
+    report = {
+        "offered_rate": rate,
+        "concurrency": concurrency,
+        "sent": sent,
+        "ok": ok,
+        "errors": sent - ok,
+        "error_rate": (sent - ok) / sent if sent else 0.0,
+        "throughput": ok / elapsed,
+        "elapsed_s": elapsed,
+        "statuses": dict(sorted(statuses.items())),
+    }
+    if sent:
+        latency = summarize(latencies, elapsed, unit="requests")
+        service = summarize(service_times, elapsed, unit="requests")
+        report.update({k: latency[k] for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")})
+        report.update({f"service_{k}": service[k] for k in ("p50_ms", "p99_ms")})
+    return report
+
+
+def _read_payloads(path: str) -> Iterable[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.loadgen")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rate", type=float, default=100, help="requests per second offered")
+    parser.add_argument("--concurrency", type=int, default=32, help="most requests in flight")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to send for")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout")
+    parser.add_argument("--hands", help="ndjson file of payloads (generated when omitted)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--players", type=int, choices=range(2, 7))
+    parser.add_argument("--policy", action="append", choices=list(POLICIES))
+    parser.add_argument("--keep-ids", action="store_true", help="send the hand ids unchanged")
+    parser.add_argument("--out", help="write the report JSON here")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # one line per request otherwise
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("app.poker_service").setLevel(logging.WARNING)
+    needed = int(args.rate * args.duration) + 1
+    if args.hands:
+        payloads = _read_payloads(args.hands)
+    else:
+        logger.info("Generating %d hands", needed)
+        policies = [POLICIES[name] for name in args.policy or ["random"]]
+        payloads = (g.payload for g in generate_hands(args.seed, needed, args.players, policies))
+    bodies = _request_bodies(itertools.islice(payloads, needed), args.keep_ids)
+    if len(bodies) < needed:
+        logger.warning(
+            "Only %d hands: the run ends after %.1fs", len(bodies), len(bodies) / args.rate
+        )
+
+    async def go():
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+            return await run_load(client, bodies, args.rate, args.concurrency, args.duration)
+
+    report = asyncio.run(go())
+    print(
+        f"sent {report['sent']} in {report['elapsed_s']:.1f}s: "
+        f"{report['throughput']:,.1f} ok/s (offered {args.rate:g}/s), "
+        f"error rate {report['error_rate']:.2%} {report['statuses']}"
+    )
+    if report["sent"]:
+        print(
+            f"latency p50 {report['p50_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms, "
+            f"max {report['max_ms']:.1f} ms "
+            f"(service p50 {report['service_p50_ms']:.1f} ms, p99 {report['service_p99_ms']:.1f} ms)"
+        )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["sent"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+# app/logs.py
+"""
+Logging for the server and its replay worker processes.
+
+configure_logging puts a QueueHandler on the root logger. Request threads
+and the event loop only check the level, draw a sample and append the
+record to an in-memory queue; a listener thread formats records and writes
+them to stderr, so a slow terminal or log collector never stalls a request.
+When the queue is full, records are dropped and counted instead of
+blocking.
+
+Records are formatted on the listener thread, so pass values as arguments
+(``logger.debug("hand %s", hand_id)``) or as structured fields
+(``extra={"hand_id": ...}``), not as f-strings: a record that is filtered
+out or sampled away is never formatted at all. Containers among the
+arguments and fields are rendered when the record is queued, since the
+caller may change them afterwards.
+
+Environment:
+    LOG_LEVEL: Root level (INFO).
+    LOG_FORMAT: json (one object per line, with the structured fields) or text.
+    LOG_SAMPLE: Share of DEBUG and INFO records kept per logger, as
+        ``app.poker_service=0.01,app.main=0.1``; a setting covers the
+        logger's children too. Warnings and errors are always kept.
+    LOG_MAX_CHARS: Longest message or field value written; longer ones are cut.
+    LOG_QUEUE_SIZE: Records waiting for the listener before new ones are dropped.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from .metrics import Counter
+
+LOG_RECORDS_DROPPED = Counter(
+    "poker_log_records_dropped_total",
+    "Log records not written, by reason (sampled, queue_full)",
+    ("reason",),
+)
+
+# attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "taskName"}
+_CONTAINERS = (dict, list, set, bytearray)
+
+_listener: QueueListener | None = None
+_handler: logging.Handler | None = None
+# what configure_logging changed besides the handlers: the root level and
+# module-level settings of logging, restored by stop_logging
+_saved_level: int | None = None
+_saved_settings: dict | None = None
+_SETTINGS = ("_srcfile", "logThreads", "logProcesses", "logMultiprocessing", "logAsyncioTasks")
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    """
+    Parses LOG_SAMPLE (``logger=rate,...``).
+
+    Raises:
+        ValueError: If an entry is malformed or a rate is not between 0 and 1.
+    """
+    rates = {}
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        name, sep, rate = entry.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"LOG_SAMPLE entry must look like logger=rate: {entry!r}")
+        value = float(rate)
+        if not 0.0 <= value <= 1.0:
+            raise ValueError(f"LOG_SAMPLE rate must be between 0 and 1: {entry!r}")
+        rates[name.strip()] = value
+    return rates
+
+
+def cap(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... ({len(text) - max_chars} more chars)"
+
+
+def _render(value, max_chars: int) -> str:
+    try:
+        text = json.dumps(value, default=str, separators=(",", ":"))
+    except (TypeError, ValueError):
+        text = repr(value)
+    return cap(text, max_chars)
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRS}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a share of the DEBUG and INFO records of each logger, set by the
+    most specific entry of ``rates`` that covers it (all of them otherwise).
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        # logger name -> rate, resolved on the first record of each logger
+        self._resolved: dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, prefix = 1.0, name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        LOG_RECORDS_DROPPED.inc(reason="sampled")
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queues records for the listener thread without formatting them, and
+    drops (and counts) them rather than wait when the queue is full.
+    """
+
+    def __init__(self, queue_: queue.Queue, max_chars: int):
+        super().__init__(queue_)
+        self.max_chars = max_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and any(isinstance(a, _CONTAINERS) for a in (args if isinstance(args, tuple) else (args,))):
+            record.msg, record.args = cap(record.getMessage(), self.max_chars), None
+        for key, value in _fields(record).items():
+            if isinstance(value, _CONTAINERS):
+                setattr(record, key, _render(value, self.max_chars))
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and the structured fields."""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": cap(record.getMessage(), self.max_chars),
+        }
+        for key, value in _fields(record).items():
+            if isinstance(value, str):
+                entry[key] = cap(value, self.max_chars)
+            elif value is None or isinstance(value, (bool, int, float)):
+                entry[key] = value
+            else:
+                entry[key] = _render(value, self.max_chars)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """``time level logger: message key=value ...``"""
+
+    def __init__(self, max_chars: int):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = cap(record.message, self.max_chars)
+        line = super().formatMessage(record)
+        fields = " ".join(
+            f"{key}={cap(value, self.max_chars) if isinstance(value, str) else _render(value, self.max_chars)}"
+            for key, value in _fields(record).items()
+        )
+        return f"{line} {fields}" if fields else line
+
+
+class _StderrHandler(logging.StreamHandler):
+    # whatever sys.stderr is when a record is written, not when logging was set up
+    def __init__(self):
+        super().__init__(sys.stderr)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def stop_logging():
+    """
+    Writes out the records still queued, stops the listener thread and
+    undoes the rest of configure_logging but the handlers it removed.
+    """
+    global _listener, _handler, _saved_level, _saved_settings
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _saved_level is not None:
+        logging.getLogger().setLevel(_saved_level)
+        _saved_level = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _saved_settings is not None:
+        for name, value in _saved_settings.items():
+            setattr(logging, name, value)
+        _saved_settings = None
+
+
+def configure_logging(
+    level: str | None = None,
+    fmt: str | None = None,
+    sample: str | None = None,
+    max_chars: int | None = None,
+    queue_size: int | None = None,
+) -> QueueListener:
+    """
+    Replaces the root handlers with a queue-backed handler and starts the
+    listener thread that writes records to stderr. Arguments left out are
+    read from the environment; calling it again reconfigures logging.
+    Processes call it when they start serving (the server's lifespan, the
+    replay workers, the command-line tools), not on import, since it
+    changes process-wide logging state until stop_logging().
+
+    Raises:
+        ValueError: If LOG_FORMAT or LOG_SAMPLE is invalid.
+    """
+    global _listener, _handler, _saved_level, _saved_settings
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    rates = parse_sample_rates(sample if sample is not None else os.getenv("LOG_SAMPLE", ""))
+    max_chars = max_chars or int(os.getenv("LOG_MAX_CHARS", "2000"))
+    queue_size = queue_size or int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    if fmt not in ("json", "text"):
+        raise ValueError(f"LOG_FORMAT must be json or text, not {fmt!r}")
+
+    stop_logging()
+    output = _StderrHandler()
+    output.setFormatter(JsonFormatter(max_chars) if fmt == "json" else TextFormatter(max_chars))
+    records: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(records, max_chars)
+    handler.addFilter(SamplingFilter(rates))
+
+    # neither formatter writes the caller's file and line, thread or process,
+    # so skip collecting them for every record (see "Optimization" in the
+    # logging HOWTO)
+    _saved_settings = {name: getattr(logging, name) for name in _SETTINGS if hasattr(logging, name)}
+    logging._srcfile = None
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False
+
+    # a handler left in place (basicConfig's, say) would write every record twice
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    _saved_level = root.level
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    _handler = handler
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+atexit.register(stop_logging)
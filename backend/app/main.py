@@ -1,39 +1,309 @@
 # app/main.py
 import os
+import json
+import asyncio
+import uuid
 import logging
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from .schemas import HandIn, HandStored
-from .repository import HandRepository
-from .models_entity import HandEntity
-from .poker_service import compute_payoffs_using_pokerkit, validate_hand_payload
-
-logging.basicConfig(level=logging.INFO)
+from typing import List
+from datetime import datetime
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, Query, WebSocket, WebSocketDisconnect
+from starlette.requests import HTTPConnection
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from .schemas import EquityIn, HandIn, HandStored, WhatIfIn
+from .db import ConnectionPool, PoolTimeoutError
+from .repository import HandRepository, DuplicateHandError, DB_URL
+from .models_entity import HandEntity, PlayerStatsEntity
+from .cache import TTLCache
+from . import codec
+from . import fastjson
+from .idempotency import payload_hash
+from .migrate import apply_migrations
+from .partitions import PARTITION_MONTHS_AHEAD, create_partitions
+from .pagination import encode_cursor, decode_cursor
+from .search import HandFilter
+from .replay import ReplayService, ReplayTimeoutError
+from .ingest import IngestQueue, IngestQueueFull
+from .live import LiveHand, LiveHandError, LiveHandLimitError, LiveHandStore
+from .whatif import SnapshotTrie, WhatIfError, what_if
+from .equity import EQUITY_MAX_SAMPLES, calculate_equity, hand_equity, parse_hole_cards
+from .evaluator import parse_cards
+from . import preflop
+from .parsing import HandParseError, ParsedHand, parse_hand
+from . import evaluator
+from . import metrics
+from .metrics import STAGE_SECONDS
+from .logs import configure_logging, stop_logging
+from .profiling import ProfiledRoute, RequestProfiler, RequestTimingMiddleware, run_in_threadpool
+
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Poker Backend")
+BATCH_MAX_SIZE = int(os.getenv("HANDS_BATCH_MAX_SIZE", "1000"))
+PAGE_DEFAULT_LIMIT = int(os.getenv("HANDS_PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("HANDS_PAGE_MAX_LIMIT", "1000"))
+MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "1") == "1"
+# "async" answers POST /hands with 202 and stores hands in the background;
+# clients can also ask for that per request with "Prefer: respond-async"
+INGEST_MODE = os.getenv("INGEST_MODE", "sync")
+INGEST_DRAIN_TIMEOUT = float(os.getenv("INGEST_DRAIN_TIMEOUT", "30"))
+# PROFILE_SLOWEST=N keeps cProfile stats of the N slowest sampled requests
+profiler = RequestProfiler.from_env()
+
+# serialized JSON of stored hands; hands never change once saved, so entries
+# are filled on insert and on lookup and never invalidated
+hand_cache = TTLCache(
+    maxsize=int(os.getenv("HAND_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("HAND_CACHE_TTL", "3600")),
+)
+
+# hands being played through /live/hands and /live/ws
+live_hands = LiveHandStore.from_env()
+
+# pokerkit snapshots of stored hands at street boundaries, for /hands/{id}/whatif
+whatif_snapshots = SnapshotTrie.from_env()
+
+# hand id -> (content hash, payoffs) of stored hands, so that a retried
+# submission is answered without a replay and usually without a query
+result_cache = TTLCache(maxsize=int(os.getenv("HAND_RESULT_CACHE_SIZE", "100000")))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    # map the hand rank tables before the replay workers start, so that a
+    # missing table file is built once here rather than by every worker
+    evaluator.load_tables()
+    preflop.load_tables()
+    # one replay process pool and one connection pool per worker process,
+    # shared by every request
+    app.state.replay_service = ReplayService.from_env()
+    app.state.replay_service.start()
+    app.state.db_pool = None
+    if DB_URL:
+        app.state.db_pool = ConnectionPool.from_env(DB_URL)
+        logger.info("Database pool ready: %s", app.state.db_pool.stats())
+        if MIGRATE_ON_STARTUP:
+            with app.state.db_pool.connection() as conn:
+                applied = apply_migrations(conn)
+                # in case the maintenance job (app/partitions.py) has not run lately
+                created = create_partitions(conn, PARTITION_MONTHS_AHEAD)
+            if applied:
+                logger.info("Applied migrations: %s", applied)
+            if created:
+                logger.info("Created partitions: %s", created)
+    else:
+        logger.warning("DATABASE_URL not set - database pool disabled")
+    app.state.ingest = IngestQueue.from_env(
+        lambda: _repository_for(app), app.state.replay_service, on_saved=_on_hand_saved
+    )
+    try:
+        yield
+    finally:
+        # accepted hands are stored before the replay and database pools go away
+        await app.state.ingest.drain(timeout=INGEST_DRAIN_TIMEOUT)
+        app.state.replay_service.shutdown()
+        if app.state.db_pool is not None:
+            app.state.db_pool.close()
+        stop_logging()
 
 
-def get_repository() -> HandRepository:
+app = FastAPI(title="Poker Backend", lifespan=lifespan)
+app.add_middleware(RequestTimingMiddleware, profiler=profiler)
+if profiler is not None:
+    # sync endpoints run in the threadpool, out of the middleware's profile
+    app.router.route_class = ProfiledRoute
+
+
+@app.exception_handler(PoolTimeoutError)
+def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse({"detail": str(exc)}, status_code=503)
+
+
+def _repository_for(app: FastAPI) -> HandRepository:
+    pool = getattr(app.state, "db_pool", None)
+    if pool is not None:
+        return HandRepository(pool=pool)
     return HandRepository()  # reads DATABASE_URL from env
 
 
+def get_repository(conn: HTTPConnection) -> HandRepository:
+    # HTTPConnection so that WebSocket endpoints can depend on it too
+    return _repository_for(conn.app)
+
+
+# used whenever the lifespan has not started a process pool (e.g. in tests)
+_inline_replay_service = ReplayService(workers=0)
+
+
+def get_replay_service(request: Request) -> ReplayService:
+    return getattr(request.app.state, "replay_service", _inline_replay_service)
+
+
+def get_ingest_queue(request: Request) -> IngestQueue | None:
+    # None without the lifespan; POST /hands then always works synchronously
+    return getattr(request.app.state, "ingest", None)
+
+
+def get_live_hands() -> LiveHandStore:
+    return live_hands
+
+
+def get_whatif_snapshots() -> SnapshotTrie:
+    return whatif_snapshots
+
+
+@app.get("/health/db")
+def db_pool_stats(request: Request):
+    pool = getattr(request.app.state, "db_pool", None)
+    if pool is None:
+        raise HTTPException(status_code=503, detail="database pool not initialised")
+    return pool.stats()
+
+
+@app.get("/health/live")
+def live_hand_stats(store: LiveHandStore = Depends(get_live_hands)):
+    return store.stats()
+
+
+@app.get("/health/whatif")
+def whatif_stats(trie: SnapshotTrie = Depends(get_whatif_snapshots)):
+    return trie.stats()
+
+
+@app.get("/health/ingest")
+def ingest_stats(ingest: IngestQueue | None = Depends(get_ingest_queue)):
+    if ingest is None:
+        raise HTTPException(status_code=503, detail="ingest queue not initialised")
+    return ingest.stats()
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Request stage, replay and HTTP metrics in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/debug/profiles")
+def get_profiles():
+    """cProfile stats of the slowest sampled requests, slowest first."""
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="profiling disabled (set PROFILE_SLOWEST)")
+    return {
+        "sample_rate": profiler.sample_rate,
+        "profiled": profiler.profiled,
+        "slowest": profiler.slowest(),
+    }
+
+
+def _remember_result(h: HandEntity) -> tuple[str, dict | None]:
+    result = (h.content_hash or payload_hash(h.payload_json), h.payoffs_json)
+    key = _cache_key(h.id)
+    if key is not None:
+        result_cache.set(key, result)
+    return result
+
+
+async def _stored_result(repo: HandRepository, key: str) -> tuple[str, dict | None] | None:
+    """(content hash, payoffs) of the stored hand with this id, if any."""
+    result = result_cache.get(key)
+    if result is None:
+        found = await run_in_threadpool(repo.find_existing, [key])
+        if key in found:
+            result = _remember_result(found[key])
+    return result
+
+
+def _resubmission_response(payload: dict, digest: str, stored: tuple) -> JSONResponse:
+    stored_digest, payoffs = stored
+    if stored_digest != digest:
+        raise HTTPException(
+            status_code=409,
+            detail=f"hand {payload['id']} already exists with a different payload",
+        )
+    return JSONResponse(
+        {"message": "Hand saved", "id": payload["id"], "payoffs": payoffs},
+        headers={"Idempotent-Replay": "true"},
+    )
+
+
+def _on_hand_saved(h: HandEntity):
+    _cache_hand(h)
+    _remember_result(h)
+
+
+def _wants_async(request: Request, ingest: IngestQueue | None) -> bool:
+    if ingest is None:
+        return False
+    return INGEST_MODE == "async" or "respond-async" in request.headers.get("prefer", "")
+
+
+def _accepted_response(payload: dict, key: str) -> JSONResponse:
+    return JSONResponse(
+        {"message": "Hand accepted", "id": payload["id"], "status": "pending"},
+        status_code=202,
+        headers={"Location": f"/hands/{key}/status"},
+    )
+
+
 @app.post("/hands")
-def post_hand(payload: dict, repo: HandRepository = Depends(get_repository)):
-    # basic validation using pydantic
-    is_valid, msg = validate_hand_payload(payload)
-    if not is_valid:
-        raise HTTPException(status_code=400, detail=msg)
+async def post_hand(
+    payload: dict,
+    request: Request,
+    repo: HandRepository = Depends(get_repository),
+    replay: ReplayService = Depends(get_replay_service),
+    ingest: IngestQueue | None = Depends(get_ingest_queue),
+):
+    """
+    Replays and stores one hand. Submitting the same hand again returns the
+    stored payoffs without replaying it; a different hand reusing a stored
+    id is rejected with 409.
+
+    In async mode (INGEST_MODE=async or "Prefer: respond-async") the hand is
+    only validated and queued, and the response is 202 with a Location
+    header pointing at GET /hands/{id}/status.
+    """
+    # one parse validates the hand and decodes it for replay and storage
+    try:
+        with STAGE_SECONDS.time(stage="validate"):
+            hand = parse_hand(payload)
+    except HandParseError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    key = _cache_key(payload["id"])
+    if key is None:
+        raise HTTPException(status_code=400, detail=f"hand id must be a UUID: {payload['id']}")
+
+    logger.debug("Hand validated", extra={"hand_id": key, "payload": payload})
 
-    print(payload)
-    print("Payload validated successfully")
+    digest = payload_hash(payload)
+    stored = await _stored_result(repo, key)
+    if stored is not None:
+        return _resubmission_response(payload, digest, stored)
+
+    if ingest is not None and ingest.pending_hash(key) is not None:
+        if ingest.pending_hash(key) != digest:
+            raise HTTPException(
+                status_code=409,
+                detail=f"hand {payload['id']} already exists with a different payload",
+            )
+        return _accepted_response(payload, key)
+
+    if _wants_async(request, ingest):
+        try:
+            ingest.submit(key, hand, payload, digest)
+        except IngestQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        return _accepted_response(payload, key)
 
     # try compute payoffs
     payoffs = None
     try:
-        payoffs_map = compute_payoffs_using_pokerkit(payload)  # write this
+        with STAGE_SECONDS.time(stage="replay"):
+            payoffs_map = await replay.replay(hand)
         payoffs = payoffs_map
-        print("Payoffs computed:", payoffs)
+        logger.debug("Payoffs computed", extra={"hand_id": key, "payoffs": payoffs})
+    except ReplayTimeoutError as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         # return server error with helpful message
         logger.exception("pokerkit failed")
@@ -41,24 +311,547 @@ def post_hand(payload: dict, repo: HandRepository = Depends(get_repository)):
 
     # build entity and persist
     hand_entity = HandEntity(
-        id=payload["id"], payload_json=payload, payoffs_json=payoffs
+        id=payload["id"],
+        payload_json=payload,
+        payoffs_json=payoffs,
+        content_hash=digest,
+        parsed=hand,
     )
-    saved = repo.save(hand_entity)
-    print("Hand saved with id:", saved.id)
+    try:
+        saved = await run_in_threadpool(repo.save, hand_entity)
+    except DuplicateHandError:
+        # a concurrent submission of the same id was stored first
+        stored = await _stored_result(repo, key)
+        if stored is None:
+            raise
+        return _resubmission_response(payload, digest, stored)
+    _on_hand_saved(saved)
+    logger.info("Hand saved", extra={"hand_id": saved.id})
 
     return JSONResponse({"message": "Hand saved", "id": saved.id, "payoffs": payoffs})
 
 
+def _check_batch_item(payload) -> tuple[str, ParsedHand]:
+    """Parses one hand of a batch; returns its normalized id and parsed hand or raises ValueError."""
+    if not isinstance(payload, dict):
+        raise ValueError("hand must be a JSON object")
+    try:
+        key = str(uuid.UUID(str(payload.get("id"))))
+    except ValueError:
+        raise ValueError(f"hand id must be a UUID: {payload.get('id')}")
+
+    with STAGE_SECONDS.time(stage="validate"):
+        return key, parse_hand(payload)
+
+
+@app.post("/hands/batch")
+async def post_hands_batch(
+    payloads: List[dict],
+    repo: HandRepository = Depends(get_repository),
+    replay: ReplayService = Depends(get_replay_service),
+):
+    """
+    Validates and replays every hand independently, then persists all the
+    valid ones in a single transaction. A hand that fails does not affect
+    the others; the response carries one result per input hand, in order.
+    Hands that are already stored with the same content are reported as
+    saved with their stored payoffs and are not replayed again.
+    """
+    if len(payloads) > BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"batch too large: {len(payloads)} hands (max {BATCH_MAX_SIZE})",
+        )
+
+    results = []
+    keys = set()
+    for payload in payloads:
+        hand_id = payload.get("id") if isinstance(payload, dict) else None
+        try:
+            key, hand = _check_batch_item(payload)
+            if key in keys:
+                raise ValueError("duplicate hand id within batch")
+        except ValueError as e:
+            results.append({"id": hand_id, "status": "error", "error": str(e)})
+            continue
+        keys.add(key)
+        results.append(
+            {"id": hand_id, "status": "saved", "_key": key, "_payload": payload, "_hand": hand}
+        )
+
+    # retried hands: one lookup for every id not already in the result cache
+    stored = {key: result_cache.get(key) for key in keys}
+    unknown = [key for key, result in stored.items() if result is None]
+    for key, h in (await run_in_threadpool(repo.find_existing, unknown)).items():
+        stored[key] = _remember_result(h)
+    for result in results:
+        known = stored.get(result.get("_key"))
+        if known is None:
+            continue
+        payload = result.pop("_payload")
+        del result["_key"], result["_hand"]
+        if known[0] == payload_hash(payload):
+            result["payoffs"] = known[1]
+        else:
+            result["status"] = "error"
+            result["error"] = "hand id already exists"
+
+    # replays of the whole batch run concurrently across the replay workers
+    pending = [r for r in results if "_payload" in r]
+    outcomes = await asyncio.gather(
+        *(replay.replay(r["_hand"]) for r in pending), return_exceptions=True
+    )
+    entities = []
+    for result, outcome in zip(pending, outcomes):
+        payload = result.pop("_payload")
+        hand = result.pop("_hand")
+        if isinstance(outcome, Exception):
+            logger.error("pokerkit failed for hand %s: %s", result["id"], outcome)
+            del result["_key"]
+            result["status"] = "error"
+            result["error"] = f"pokerkit evaluation error: {outcome}"
+            continue
+        result["payoffs"] = outcome
+        entities.append(
+            HandEntity(
+                id=result["_key"],
+                payload_json=payload,
+                payoffs_json=outcome,
+                content_hash=payload_hash(payload),
+                parsed=hand,
+            )
+        )
+
+    saved = set()
+    for h in await run_in_threadpool(repo.save_many, entities):
+        _on_hand_saved(h)
+        saved.add(h.id)
+
+    for result in results:
+        key = result.pop("_key", None)
+        if key is not None and key not in saved:
+            result["status"] = "error"
+            result["error"] = "hand id already exists"
+            del result["payoffs"]
+
+    saved_count = sum(1 for r in results if r["status"] == "saved")
+    logger.info("Batch stored %d/%d hands", saved_count, len(results))
+    return {
+        "saved": saved_count,
+        "failed": len(results) - saved_count,
+        "results": results,
+    }
+
+
+def _cache_key(hand_id: str) -> str | None:
+    try:
+        return str(uuid.UUID(str(hand_id)))
+    except ValueError:
+        return None
+
+
+def _cache_hand(h: HandEntity) -> bytes:
+    with STAGE_SECONDS.time(stage="serialize"):
+        body = fastjson.hand_record_json(h)
+    key = _cache_key(h.id)
+    if key is not None:
+        hand_cache.set(key, body)
+    return body
+
+
+def _stream_ndjson(records):
+    for record in records:
+        yield record + b"\n"
+
+
 @app.get("/hands")
-def get_hands(repo: HandRepository = Depends(get_repository)):
-    hands = repo.list_all()
-    # return list of simple dicts
-    return [
-        {
-            "id": h.id,
-            "payload": h.payload_json,
-            "payoffs": h.payoffs_json,
-            "created_at": h.created_at.isoformat(),
-        }
-        for h in hands
-    ]
+def get_hands(
+    request: Request,
+    limit: int | None = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+    after: str | None = None,
+    format: str = Query("json", pattern="^(json|ndjson|binary)$"),
+    player: str | None = None,
+    winner: str | None = None,
+    min_pot: int | None = Query(None, ge=0),
+    max_pot: int | None = Query(None, ge=0),
+    since: datetime | None = None,
+    until: datetime | None = None,
+    players: int | None = Query(None, ge=2, le=6),
+    showdown: bool | None = None,
+    repo: HandRepository = Depends(get_repository),
+):
+    """
+    Lists hands newest first, one keyset page at a time. The cursor for the
+    next page is returned in the X-Next-Cursor header and is passed back as
+    ``after``. With ``format=ndjson`` (or Accept: application/x-ndjson) every
+    hand after the cursor is streamed, one JSON object per line. With
+    ``format=binary`` (or Accept: application/x-poker-hand) the page is a
+    sequence of app/codec.py frames instead of JSON.
+
+    Optional filters, combined with AND: ``player`` (id or name), ``winner``
+    (id of a player who finished ahead), ``min_pot``/``max_pot`` (final pot),
+    ``since``/``until`` (created_at), ``players`` (count) and ``showdown``.
+    """
+    try:
+        position = decode_cursor(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = HandFilter(
+        player=player,
+        winner=winner,
+        min_pot=min_pot,
+        max_pot=max_pot,
+        since=since,
+        until=until,
+        players=players,
+        showdown=showdown,
+    )
+
+    if format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", ""):
+        records = repo.iter_all_json(after=position, limit=limit, filters=filters)
+        return StreamingResponse(_stream_ndjson(records), media_type="application/x-ndjson")
+
+    limit = limit or PAGE_DEFAULT_LIMIT
+    if format == "binary" or codec.CONTENT_TYPE in request.headers.get("accept", ""):
+        encoded = repo.list_page_encoded(limit + 1, after=position, filters=filters)
+        headers = {}
+        if len(encoded) > limit:
+            encoded = encoded[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(encoded[-1][1], encoded[-1][0])
+        with STAGE_SECONDS.time(stage="serialize"):
+            body = b"".join(codec.encode_frame(created_at, data) for _, created_at, data in encoded)
+        return Response(content=body, media_type=codec.CONTENT_TYPE, headers=headers)
+
+    # fetch one extra row to learn whether another page exists; the records
+    # are JSON built by PostgreSQL and go out as they came in
+    rows = repo.list_page_json(limit + 1, after=position, filters=filters)
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1][1], rows[-1][0])
+    with STAGE_SECONDS.time(stage="serialize"):
+        body = fastjson.json_array(record for _, _, record in rows)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/hands/{hand_id}")
+def get_hand(hand_id: str, request: Request, repo: HandRepository = Depends(get_repository)):
+    key = _cache_key(hand_id)
+    if key is None:
+        raise HTTPException(status_code=404, detail=f"Hand {hand_id} not found")
+
+    if codec.CONTENT_TYPE in request.headers.get("accept", ""):
+        data = repo.get_encoded(key)
+        if data is None:
+            raise HTTPException(status_code=404, detail=f"Hand {hand_id} not found")
+        return Response(content=data, media_type=codec.CONTENT_TYPE)
+
+    body = hand_cache.get(key)
+    if body is None:
+        body = repo.get_json(key)
+        if body is None:
+            raise HTTPException(status_code=404, detail=f"Hand {hand_id} not found")
+        hand_cache.set(key, body)
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/hands/{hand_id}/status")
+async def get_hand_status(
+    hand_id: str,
+    repo: HandRepository = Depends(get_repository),
+    ingest: IngestQueue | None = Depends(get_ingest_queue),
+):
+    """Reports whether a submitted hand is pending, done (with payoffs) or failed."""
+    key = _cache_key(hand_id)
+    if key is None:
+        raise HTTPException(status_code=404, detail=f"Hand {hand_id} not found")
+
+    status = ingest.status(key) if ingest is not None else None
+    if status is None:
+        stored = await _stored_result(repo, key)
+        if stored is None:
+            raise HTTPException(status_code=404, detail=f"Hand {hand_id} not found")
+        status = {"status": "done", "payoffs": stored[1]}
+    return {"id": key, **status}
+
+
+async def _start_live_hand(setup, repo: HandRepository, store: LiveHandStore) -> tuple[str, dict]:
+    key = _cache_key(setup.get("id")) if isinstance(setup, dict) else None
+    if key is None:
+        raise HTTPException(status_code=400, detail="hand id must be a UUID")
+    if await _stored_result(repo, key) is not None:
+        raise HTTPException(status_code=409, detail=f"hand {setup['id']} is already stored")
+    try:
+        live = store.start(key, setup)
+    except LiveHandLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:  # HandParseError, LiveHandError
+        raise HTTPException(status_code=400, detail=str(e))
+    return key, live.view()
+
+
+def _live_hand(store: LiveHandStore, hand_id) -> tuple[str, LiveHand]:
+    key = _cache_key(hand_id)
+    live = store.get(key) if key is not None else None
+    if live is None:
+        raise HTTPException(status_code=404, detail=f"live hand {hand_id} not found")
+    return key, live
+
+
+async def _save_live_hand(key: str, live: LiveHand, repo: HandRepository, store: LiveHandStore):
+    """Stores a finished live hand with the payoffs and ParsedHand it already has."""
+    payload, hand = live.to_hand()
+    entity = HandEntity(
+        id=key,
+        payload_json=payload,
+        payoffs_json=live.payoffs(),
+        content_hash=payload_hash(payload),
+        parsed=hand,
+    )
+    try:
+        saved = await run_in_threadpool(repo.save, entity)
+    except DuplicateHandError:
+        store.discard(key)
+        raise HTTPException(status_code=409, detail=f"hand {live.id} already exists")
+    _on_hand_saved(saved)
+    live.saved = True
+    store.discard(key)
+
+
+async def _live_action(
+    hand_id, action, repo: HandRepository, store: LiveHandStore
+) -> dict:
+    key, live = _live_hand(store, hand_id)
+    if not isinstance(action, str):
+        raise HTTPException(status_code=400, detail="action must be a string like \"c\" or \"r100\"")
+    try:
+        live.apply(action)
+    except LiveHandError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if live.complete:
+        await _save_live_hand(key, live, repo, store)
+    return live.view()
+
+
+@app.post("/live/hands", status_code=201)
+async def start_live_hand(
+    setup: dict,
+    repo: HandRepository = Depends(get_repository),
+    store: LiveHandStore = Depends(get_live_hands),
+):
+    """
+    Starts playing a hand on the server: the HandIn fields without actions,
+    communityCards, finalPot or winnings. Returns the hand's live view.
+    """
+    _, view = await _start_live_hand(setup, repo, store)
+    return view
+
+
+@app.get("/live/hands/{hand_id}")
+async def get_live_hand(
+    hand_id: str,
+    repo: HandRepository = Depends(get_repository),
+    store: LiveHandStore = Depends(get_live_hands),
+):
+    """The actor, legal actions, pot, bets, stacks and board of a live hand."""
+    key, live = _live_hand(store, hand_id)
+    if live.complete and not live.saved:
+        # storing it failed when the last action came in
+        await _save_live_hand(key, live, repo, store)
+    return live.view()
+
+
+@app.post("/live/hands/{hand_id}/actions")
+async def post_live_action(
+    hand_id: str,
+    body: dict,
+    repo: HandRepository = Depends(get_repository),
+    store: LiveHandStore = Depends(get_live_hands),
+):
+    """
+    Applies one action ({"action": "r100"}) to a live hand and returns its
+    new view. The action that ends the hand also stores it, with the payoffs
+    from the live state instead of a replay.
+    """
+    return await _live_action(hand_id, body.get("action"), repo, store)
+
+
+@app.delete("/live/hands/{hand_id}", status_code=204)
+async def abandon_live_hand(hand_id: str, store: LiveHandStore = Depends(get_live_hands)):
+    key, _ = _live_hand(store, hand_id)
+    store.discard(key)
+    return Response(status_code=204)
+
+
+@app.websocket("/live/ws")
+async def live_hand_socket(
+    websocket: WebSocket,
+    repo: HandRepository = Depends(get_repository),
+    store: LiveHandStore = Depends(get_live_hands),
+):
+    """
+    The /live/hands endpoints over one WebSocket. The client sends
+    {"start": setup} or {"join": hand_id}, then one {"action": "..."} per
+    message; every message is answered with the hand's live view or with
+    {"error": ..., "status": ...}. Closing the socket leaves the hand live
+    until it is idle for too long.
+    """
+    await websocket.accept()
+    key = None
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                try:
+                    message = json.loads(text)
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="message must be JSON")
+                if not isinstance(message, dict):
+                    raise HTTPException(status_code=400, detail="message must be a JSON object")
+                if "start" in message:
+                    key, view = await _start_live_hand(message["start"], repo, store)
+                elif "join" in message:
+                    key, live = _live_hand(store, message["join"])
+                    view = live.view()
+                elif "action" in message:
+                    if key is None:
+                        raise HTTPException(status_code=400, detail="start or join a hand first")
+                    view = await _live_action(key, message["action"], repo, store)
+                else:
+                    raise HTTPException(status_code=400, detail="expected start, join or action")
+            except HTTPException as e:
+                await websocket.send_json({"error": e.detail, "status": e.status_code})
+                continue
+            except Exception as e:
+                # e.g. the database is down when the finished hand is stored
+                logger.exception("Live hand message failed")
+                await websocket.send_json({"error": str(e), "status": 500})
+                continue
+            await websocket.send_json(view)
+    except WebSocketDisconnect:
+        pass
+
+
+@app.get("/hands/{hand_id}/equity")
+def get_hand_equity(
+    hand_id: str,
+    samples: int | None = Query(None, ge=100, le=EQUITY_MAX_SAMPLES),
+    seed: int | None = None,
+    repo: HandRepository = Depends(get_repository),
+):
+    """All-in equity of every player preflop and after each dealt street."""
+    key = _cache_key(hand_id)
+    hand = repo.get(key) if key is not None else None
+    if hand is None:
+        raise HTTPException(status_code=404, detail=f"Hand {hand_id} not found")
+    try:
+        streets = hand_equity(hand.payload_json, samples=samples, seed=seed)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"id": key, "streets": streets}
+
+
+@app.post("/hands/{hand_id}/whatif")
+def post_hand_whatif(
+    hand_id: str,
+    body: WhatIfIn,
+    repo: HandRepository = Depends(get_repository),
+    trie: SnapshotTrie = Depends(get_whatif_snapshots),
+):
+    """Replays a stored hand with its actions from ``index`` on replaced by ``actions``."""
+    key = _cache_key(hand_id)
+    # kept with the snapshots of the hand since its first variant
+    cached = trie.hand(key) if key is not None else None
+    try:
+        if cached is not None:
+            hand, payoffs = cached
+        else:
+            stored = repo.get(key) if key is not None else None
+            if stored is None:
+                raise HTTPException(status_code=404, detail=f"Hand {hand_id} not found")
+            hand, payoffs = stored.parsed or parse_hand(stored.payload_json), stored.payoffs_json
+        result = what_if(key, hand, body.index, body.actions, trie, payoffs)
+    except HandParseError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except WhatIfError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"id": key, "index": body.index, **result, "original_payoffs": payoffs}
+
+
+def _serialize_player_stats(s: PlayerStatsEntity) -> dict:
+    def rate(count: int, total: int) -> float | None:
+        return count / total if total else None
+
+    return {
+        "id": s.player_id,
+        "name": s.name,
+        "hands": s.hands,
+        "net": s.net,
+        "vpip": rate(s.vpip_hands, s.hands),
+        "pfr": rate(s.pfr_hands, s.hands),
+        "showdowns": s.showdowns,
+        "showdown_win_rate": rate(s.showdowns_won, s.showdowns),
+        "last_hand_at": s.last_hand_at.isoformat() if s.last_hand_at else None,
+    }
+
+
+@app.get("/players")
+def get_players(
+    limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+    repo: HandRepository = Depends(get_repository),
+):
+    """Lists player totals, biggest winners first."""
+    return [_serialize_player_stats(s) for s in repo.list_player_stats(limit)]
+
+
+@app.get("/players/{player_id}/stats")
+def get_player_stats(player_id: str, repo: HandRepository = Depends(get_repository)):
+    """Net winnings, hands played, VPIP, PFR and showdown win rate of one player."""
+    stats = repo.get_player_stats(player_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"Player {player_id} not found")
+    return _serialize_player_stats(stats)
+
+
+@app.post("/equity")
+def post_equity(body: EquityIn):
+    """All-in equity of the given hole cards on the given (partial) board."""
+    if body.samples is not None and body.samples > EQUITY_MAX_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"samples must be at most {EQUITY_MAX_SAMPLES}")
+    try:
+        holes = [parse_hole_cards(cards) for cards in body.players]
+        board = parse_cards("".join(body.board))
+        result = calculate_equity(holes, board, samples=body.samples, seed=body.seed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "method": result.method,
+        "samples": result.samples,
+        "players": [
+            {"cards": cards, "equity": equity, "win": win, "tie": tie}
+            for cards, equity, win, tie in zip(body.players, result.equity, result.win, result.tie)
+        ],
+    }
+
+
+@app.get("/equity/preflop")
+def get_preflop_equity(
+    hand: str,
+    opponents: int = Query(1, ge=1, le=preflop.MAX_OPPONENTS),
+):
+    """
+    Precomputed equity of a starting hand ("AKs", "T9o", "77" or hole cards
+    like "AsKd") against 1 to 5 random hands.
+    """
+    tables = preflop.load_tables()
+    if tables is None:
+        raise HTTPException(status_code=503, detail="preflop equity tables have not been built")
+    try:
+        # short strings are classes, anything longer is a pair of cards
+        name = hand if len(hand) <= 3 else preflop.hand_class(parse_hole_cards(hand))
+        equity = tables.versus_random(name, opponents)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if equity is None:
+        raise HTTPException(status_code=503, detail="preflop equity tables are incomplete")
+    return {"hand": name, "opponents": opponents, "equity": equity, "samples": tables.samples}
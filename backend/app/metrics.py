@@ -0,0 +1,220 @@
+# app/metrics.py
+"""
+In-process Prometheus metrics: counters and histograms with labels, rendered
+in the text exposition format by GET /metrics.
+
+Replays run in worker processes (app/replay.py), whose metrics would never
+be scraped. There the replay function is called through ``collecting``,
+which records every observation made during the call into a list instead,
+and the server process folds that list into its own registry with
+``merge``.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# single pokerkit actions take tens of microseconds
+ACTION_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+
+_metrics: dict[str, "_Metric"] = {}
+# set while ``collecting`` runs in a replay worker process
+_captured: list | None = None
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        if name in _metrics:
+            raise ValueError(f"metric {name} already registered")
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._labelset = frozenset(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        _metrics[name] = self
+
+    def _key(self, labels: dict) -> tuple:
+        if labels.keys() != self._labelset:
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple([str(labels[name]) for name in self.labelnames])
+
+    def _labels(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _record(self, key: tuple, value: float):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_one(key, value))
+        return lines
+
+    def _render_one(self, key: tuple, value) -> list[str]:
+        raise NotImplementedError
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        if _captured is not None:
+            _captured.append((self.name, key, amount))
+            return
+        self._record(key, amount)
+
+    def _record(self, key: tuple, amount: float):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_one(self, key: tuple, value: float) -> list[str]:
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        if _captured is not None:
+            _captured.append((self.name, key, value))
+            return
+        self._record(key, value)
+
+    def _record(self, key: tuple, value: float):
+        # per label set: [count per bucket (last one is +Inf), sum]
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the seconds the ``with`` block took."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state[0]) if state else 0
+
+    def _render_one(self, key: tuple, state: list) -> list[str]:
+        counts, total = state
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text format."""
+    lines = []
+    for metric in _metrics.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def collecting(fn: Callable, *args):
+    """
+    Calls ``fn(*args)`` and returns ``(result, samples)``, samples being the
+    metric observations made during the call, which are not recorded here.
+    Meant for replay worker processes, which run one call at a time.
+    """
+    global _captured
+    _captured = samples = []
+    try:
+        return fn(*args), samples
+    finally:
+        _captured = None
+
+
+def merge(samples: list[tuple[str, tuple, float]]):
+    """Records observations returned by ``collecting`` in another process."""
+    for name, key, value in samples:
+        _metrics[name]._record(key, value)
+
+
+STAGE_SECONDS = Histogram(
+    "poker_stage_seconds",
+    "Seconds spent per request stage "
+    "(validate, replay, player_stats, db_connect, insert, serialize)",
+    ("stage",),
+)
+REPLAY_SECONDS = Histogram(
+    "poker_replay_seconds",
+    "Seconds per hand payoff computation, by settlement path (settle or pokerkit)",
+    ("path",),
+)
+REPLAY_ACTION_SECONDS = Histogram(
+    "poker_replay_action_seconds",
+    "Seconds per action applied to a pokerkit state, by action type",
+    ("action",),
+    buckets=ACTION_BUCKETS,
+)
+REPLAY_ERRORS = Counter(
+    "poker_replay_errors_total",
+    "Replays that failed, by reason (error, timeout, crash)",
+    ("reason",),
+)
+UNKNOWN_ACTIONS = Counter(
+    "poker_unknown_actions_total",
+    "Unknown payload actions skipped during replay",
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "poker_http_request_seconds",
+    "Seconds per HTTP request, by method, route template and status",
+    ("method", "route", "status"),
+)
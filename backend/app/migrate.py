@@ -0,0 +1,115 @@
+# app/migrate.py
+"""
+Applies the SQL files in sql/migrations on top of the base schema in
+sql/init.sql. Files run once each, in filename order, and are recorded in
+the schema_migrations table.
+
+Usage: python -m app.migrate
+"""
+import os
+import sys
+import uuid
+import logging
+from pathlib import Path
+
+INIT_SQL = Path(__file__).resolve().parent.parent / "sql" / "init.sql"
+MIGRATIONS_DIR = Path(
+    os.getenv(
+        "MIGRATIONS_DIR", Path(__file__).resolve().parent.parent / "sql" / "migrations"
+    )
+)
+
+# arbitrary constant shared by every process running migrations, so that
+# several uvicorn workers starting together apply them only once
+_ADVISORY_LOCK_KEY = 0x504F4B4552
+
+logger = logging.getLogger(__name__)
+
+
+def migration_files() -> list[Path]:
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+
+def apply_migrations(conn) -> list[str]:
+    """Applies every pending migration; returns the names of those applied."""
+    applied = []
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_ADVISORY_LOCK_KEY,))
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                  name TEXT PRIMARY KEY,
+                  applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                )
+                """
+            )
+            cur.execute("SELECT name FROM schema_migrations")
+            done = {row[0] for row in cur.fetchall()}
+
+            for path in migration_files():
+                if path.name in done:
+                    continue
+                logger.info("Applying migration %s", path.name)
+                cur.execute(path.read_text())
+                cur.execute(
+                    "INSERT INTO schema_migrations (name) VALUES (%s)", (path.name,)
+                )
+                applied.append(path.name)
+    return applied
+
+
+def create_scratch_schema(db_url: str, prefix: str = "scratch") -> tuple[str, str]:
+    """
+    Creates a throwaway schema with the base schema and every migration
+    applied, for tests and benchmarks. Returns the schema name and a DSN
+    whose search_path points at it; drop it with drop_schema.
+    """
+    import psycopg2
+    import psycopg2.extensions
+
+    schema = f"{prefix}_{uuid.uuid4().hex[:12]}"
+    dsn = psycopg2.extensions.make_dsn(db_url, options=f"-csearch_path={schema}")
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(f"CREATE SCHEMA {schema}")
+                cur.execute(INIT_SQL.read_text())
+        apply_migrations(conn)
+    finally:
+        conn.close()
+    return schema, dsn
+
+
+def drop_schema(db_url: str, schema: str):
+    import psycopg2
+
+    conn = psycopg2.connect(db_url)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA {schema} CASCADE")
+    finally:
+        conn.close()
+
+
+def main() -> int:
+    import psycopg2
+    from .repository import DB_URL
+
+    logging.basicConfig(level=logging.INFO)
+    if not DB_URL:
+        print("DATABASE_URL not provided (set environment variable).", file=sys.stderr)
+        return 1
+    conn = psycopg2.connect(DB_URL)
+    try:
+        applied = apply_migrations(conn)
+    finally:
+        conn.close()
+    print(f"Applied {len(applied)} migration(s): {', '.join(applied) or 'none pending'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
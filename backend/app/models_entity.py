@@ -3,6 +3,8 @@ from dataclasses import dataclass
 from typing import Any
 from datetime import datetime
 
+from .parsing import ParsedHand
+
 
 @dataclass
 class HandEntity:
@@ -10,3 +12,36 @@ class HandEntity:
     payload_json: dict
     payoffs_json: dict | None
     created_at: datetime = datetime.utcnow()
+    content_hash: str | None = None
+    # set for hands just submitted, so storing them does not parse the payload again
+    parsed: ParsedHand | None = None
+
+
+@dataclass
+class HandPlayerEntity:
+    """One seated player's part in a stored hand (a hand_players row)."""
+
+    hand_id: str
+    player_id: str
+    name: str
+    seat: int  # pokerkit seat, 0 is the small blind (the big blind heads-up)
+    net: int
+    vpip: bool  # put chips in preflop voluntarily
+    pfr: bool  # raised preflop
+    showdown: bool  # still in when the hand was decided at showdown
+    won: bool  # went to showdown and finished ahead
+
+
+@dataclass
+class PlayerStatsEntity:
+    """Running totals of one player over every stored hand (a player_stats row)."""
+
+    player_id: str
+    name: str
+    hands: int
+    net: int
+    vpip_hands: int
+    pfr_hands: int
+    showdowns: int
+    showdowns_won: int
+    last_hand_at: datetime | None = None
@@ -0,0 +1,27 @@
+# app/pagination.py
+import base64
+import json
+import uuid
+from datetime import datetime
+
+
+def encode_cursor(created_at: datetime, hand_id: str) -> str:
+    """Opaque keyset cursor pointing just past the given (created_at, id)."""
+    raw = json.dumps([created_at.isoformat(), str(hand_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """
+    Inverse of encode_cursor.
+
+    Raises:
+        ValueError: If the cursor was not produced by encode_cursor.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, hand_id = json.loads(base64.urlsafe_b64decode(padded))
+        # the id reaches a ::uuid cast in the page query
+        return datetime.fromisoformat(created_at), str(uuid.UUID(hand_id))
+    except Exception:
+        raise ValueError(f"invalid pagination cursor: {cursor!r}")
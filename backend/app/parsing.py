@@ -0,0 +1,211 @@
+# app/parsing.py
+"""
+One-pass parsing of a submitted hand into a typed ParsedHand.
+
+parse_hand validates the payload against HandIn and decodes it once: hole
+and board cards become evaluator card ints (app/evaluator.py), every action
+becomes an opcode with its argument (a bet amount or the dealt cards), and
+the players are put in pokerkit seat order, starting from the small blind.
+Validation, replay (app/poker_service.py, app/settlement.py) and
+persistence (app/player_stats.py) all work from that result, so a hand is
+never walked as a dict or matched against a regex again after it is
+accepted, and malformed cards are rejected before pokerkit sees them.
+
+A ParsedHand is a named tuple of tuples, strings and ints, so it is cheap
+to build and to send to a replay worker process.
+"""
+import logging
+from typing import NamedTuple
+
+from pydantic import ValidationError
+
+from .evaluator import format_card, parse_cards
+from .schemas import HandIn
+
+logger = logging.getLogger(__name__)
+
+# action opcodes
+CHECK_OR_CALL, FOLD, BET_OR_RAISE, FLOP, TURN, RIVER, UNKNOWN = range(7)
+
+BOARD_OPS = frozenset((FLOP, TURN, RIVER))
+# the action label of each opcode in the poker_replay_action_seconds metric
+OP_KINDS = {
+    CHECK_OR_CALL: "check_or_call",
+    FOLD: "fold",
+    BET_OR_RAISE: "bet_or_raise",
+    FLOP: "deal_board",
+    TURN: "deal_board",
+    RIVER: "deal_board",
+    UNKNOWN: "unknown",
+}
+
+_CARD_CODES = {format_card(c): c for c in range(52)}
+_SIMPLE_OPS = {"c": CHECK_OR_CALL, "x": CHECK_OR_CALL, "f": FOLD, "F": FOLD}
+# board action prefix -> (opcode, number of cards dealt)
+_BOARD_ACTIONS = {"F": (FLOP, 3), "T": (TURN, 1), "R": (RIVER, 1)}
+
+
+class HandParseError(ValueError):
+    """Raised when a payload is not a valid hand; the message is meant for the client."""
+
+
+class Seat(NamedTuple):
+    """A player with chips, in pokerkit seat order."""
+
+    id: str
+    name: str
+    stack: int
+    cards: tuple[int, ...]
+
+
+class ParsedHand(NamedTuple):
+    """
+    A validated hand.
+
+    Attributes:
+        id: The payload hand id.
+        seats: Players with chips, small blind first.
+        ops: One opcode per payload action.
+        args: Per action, the bet-to amount, the dealt board cards or 0.
+        actions: The payload actions, for messages.
+    """
+
+    id: str
+    seats: tuple[Seat, ...]
+    ops: bytes
+    args: tuple
+    actions: tuple[str, ...]
+
+
+def format_cards(cards) -> str:
+    """The pokerkit spelling ("AsKd") of card ints."""
+    return "".join(format_card(c) for c in cards)
+
+
+def decode_cards(text: str) -> tuple[int, ...]:
+    """
+    parse_cards with one dict lookup per card for the usual spelling
+    ("AsKd"); other spellings ("As Kd", "10c") go through parse_cards.
+
+    Raises:
+        ValueError: If a card is invalid.
+    """
+    if len(text) == 4:  # hole cards
+        first, second = _CARD_CODES.get(text[:2]), _CARD_CODES.get(text[2:])
+        if first is not None and second is not None:
+            return first, second
+    elif not len(text) & 1:
+        try:
+            return tuple([_CARD_CODES[text[i : i + 2]] for i in range(0, len(text), 2)])
+        except KeyError:
+            pass
+    return tuple(parse_cards(text))
+
+
+def tokenize_action(action: str) -> tuple[int, int | tuple[int, ...]]:
+    """
+    Returns the opcode and argument of one payload action (c, x, f, bN, rN,
+    F[...], T[...], R[...]); anything else is UNKNOWN, which replays skip.
+
+    Raises:
+        ValueError: If a board action does not deal the right number of valid cards.
+    """
+    op = _SIMPLE_OPS.get(action)
+    if op is not None:
+        return op, 0
+    head, amount = action[:1], action[1:]
+    if head in ("b", "r") and amount.isascii() and amount.isdigit():
+        return BET_OR_RAISE, int(amount)
+    if head in _BOARD_ACTIONS and amount.startswith("["):
+        op, count = _BOARD_ACTIONS[head]
+        if not action.endswith("]"):
+            raise ValueError(f"unterminated board action {action!r}")
+        cards = decode_cards(action[2:-1])
+        if len(cards) != count:
+            raise ValueError(f"{action!r} must deal {count} card(s)")
+        return op, cards
+    return UNKNOWN, 0
+
+
+def seat_order(names: list[str], stacks: list[int], small_blind: str) -> list[int]:
+    """
+    Indexes of the players in pokerkit seat order: starting from the small
+    blind and skipping anyone without chips.
+
+    Raises:
+        ValueError: If the small blind is unknown or fewer than 2 players have chips.
+    """
+    try:
+        sb_index = names.index(small_blind)
+    except ValueError:
+        raise ValueError(f"Small blind '{small_blind}' not found in player list.")
+
+    order = []
+    for step in range(len(names)):
+        i = (sb_index + step) % len(names)
+        if stacks[i] <= 0:
+            logger.warning("Skipping player %s due to non-positive stack: %s", names[i], stacks[i])
+            continue
+        order.append(i)
+
+    if len(order) < 2:
+        raise ValueError("Cannot start a poker hand with less than 2 players having chips.")
+    return order
+
+
+def parse_hand(payload: dict) -> ParsedHand:
+    """
+    Validates a submitted hand and decodes it for replay.
+
+    Raises:
+        HandParseError: If the payload does not match HandIn, a card or
+            action is malformed, or the seating cannot be resolved.
+    """
+    try:
+        hand = HandIn.model_validate(payload)
+    except ValidationError as e:
+        raise HandParseError(f"Schema validation error: {e}")
+
+    holes = []
+    for p in hand.players:
+        try:
+            cards = decode_cards(p.cards)
+        except ValueError:
+            cards = ()
+        if len(cards) != 2:
+            raise HandParseError(f"player {p.name} cards invalid: {p.cards}")
+        holes.append(cards)
+
+    try:
+        for cards in hand.communityCards:
+            decode_cards(cards)
+    except ValueError:
+        raise HandParseError("communityCards must be a list of card codes like ['Ts','Kd','5s']")
+
+    if hand.finalPot < 0:
+        raise HandParseError("finalPot must be non-negative")
+
+    ops, args = bytearray(), []
+    for i, action in enumerate(hand.actions):
+        try:
+            op, arg = tokenize_action(action)
+        except ValueError as e:
+            raise HandParseError(f"action {i} invalid: {e}")
+        ops.append(op)
+        args.append(arg)
+
+    players = hand.players
+    try:
+        order = seat_order([p.name for p in players], [p.stack for p in players], hand.smallBlind)
+    except ValueError as e:
+        raise HandParseError(str(e))
+
+    return ParsedHand(
+        id=hand.id,
+        seats=tuple(
+            Seat(players[i].id, players[i].name, players[i].stack, holes[i]) for i in order
+        ),
+        ops=bytes(ops),
+        args=tuple(args),
+        actions=tuple(hand.actions),
+    )
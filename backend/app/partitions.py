@@ -0,0 +1,293 @@
+# app/partitions.py
+"""
+Maintenance of the monthly partitions of the hands table (see
+sql/migrations/006_hands_partitioned.sql): hands_pYYYYMM holds the hands
+created in that month, UTC.
+
+Usage:
+    python -m app.partitions
+    python -m app.partitions --keep-months 6 --archive-dir /var/lib/poker/archive
+    python -m app.partitions --list
+
+Each run, meant for a daily cron job:
+    1. creates the partitions of the coming --ahead months, so that inserts
+       never meet a month without one;
+    2. archives every partition whose month ended more than --keep-months
+       months ago: detaches it without blocking inserts or listings
+       (DETACH PARTITION ... CONCURRENTLY), exports it to
+       <archive-dir>/hands_pYYYYMM.ndjson.gz in the format of app/bulk.py,
+       then drops it along with its hand_players rows, whose totals are
+       taken out of player_stats in the same transaction;
+    3. deletes the archive files older than --archive-keep-months months.
+
+A run that stops half way is finished by the next one: a partition left
+detached is exported and dropped like the others, and an export is only
+kept once complete. Player totals (app/player_stats.py) only count the
+hands still stored. An archive goes back with
+``python -m app.bulk import <file>``, which creates the partition it
+needs and counts its hands in the player totals again; raise
+--keep-months first, or the next run archives the month again.
+
+Environment:
+    PARTITION_MONTHS_AHEAD: Months created ahead (3).
+    PARTITION_KEEP_MONTHS: Whole months kept besides the current one (12);
+        0 keeps every month.
+    PARTITION_ARCHIVE_DIR: Where archives are written (archive).
+    PARTITION_ARCHIVE_KEEP_MONTHS: Months of archives kept (0: all of them).
+"""
+import os
+import re
+import sys
+import logging
+import argparse
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import NamedTuple
+
+from .bulk import export_hands
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_KEEP_MONTHS = int(os.getenv("PARTITION_KEEP_MONTHS", "12"))
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "archive")
+PARTITION_ARCHIVE_KEEP_MONTHS = int(os.getenv("PARTITION_ARCHIVE_KEEP_MONTHS", "0"))
+
+_NAME = re.compile(r"^hands_p(\d{4})(\d{2})$")
+_ARCHIVE = re.compile(r"^(hands_p\d{6})\.ndjson\.gz$")
+
+logger = logging.getLogger(__name__)
+
+
+class Partition(NamedTuple):
+    name: str
+    month: date  # first day
+    attached: bool
+    # a DETACH ... CONCURRENTLY that was interrupted (finished by archive_partition)
+    detach_pending: bool
+
+
+def partition_month(name: str) -> date:
+    match = _NAME.match(name)
+    if match is None:
+        raise ValueError(f"not a hands partition: {name!r}")
+    return date(int(match[1]), int(match[2]), 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def cutoff(keep_months: int, today: date | None = None) -> date | None:
+    """
+    First month kept when keeping ``keep_months`` whole months besides the
+    current one; None when ``keep_months`` is 0 (everything is kept).
+    """
+    if keep_months <= 0:
+        return None
+    today = today or datetime.now(timezone.utc).date()
+    return add_months(today.replace(day=1), -keep_months)
+
+
+def create_partitions(conn, months_ahead: int, since: date | None = None) -> list[str]:
+    """
+    Creates the missing partitions from the month of ``since`` (this month
+    by default) through ``months_ahead`` months from now; returns the names
+    of those created.
+    """
+    if since is not None:
+        since = datetime(since.year, since.month, 1, tzinfo=timezone.utc)
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT create_hands_partitions(%s, %s)", (months_ahead, since))
+            return [row[0] for row in cur.fetchall()]
+
+
+def list_partitions(conn) -> list[Partition]:
+    """The hands partitions of the current schema, attached or not, oldest first."""
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.relname, i.inhrelid IS NOT NULL, COALESCE(i.inhdetachpending, FALSE)
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+                WHERE n.nspname = current_schema()
+                  AND c.relkind = 'r'
+                  AND c.relname ~ '^hands_p[0-9]{6}$'
+                ORDER BY c.relname
+                """
+            )
+            return [
+                Partition(name, partition_month(name), attached, pending)
+                for name, attached, pending in cur.fetchall()
+            ]
+
+
+def archive_partition(conn, partition: Partition, archive_dir: str) -> tuple[str, int]:
+    """
+    Detaches ``partition``, exports it to ``archive_dir`` and drops it
+    along with its player statistics; returns the archive path and the
+    number of hands archived.
+    """
+    if partition.attached:
+        # CONCURRENTLY cannot run inside a transaction block
+        autocommit, conn.autocommit = conn.autocommit, True
+        try:
+            with conn.cursor() as cur:
+                mode = "FINALIZE" if partition.detach_pending else "CONCURRENTLY"
+                cur.execute(f'ALTER TABLE hands DETACH PARTITION "{partition.name}" {mode}')
+        finally:
+            conn.autocommit = autocommit
+
+    path = Path(archive_dir) / f"{partition.name}.ndjson.gz"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # still ends in .gz, so that export_hands compresses it
+    partial = path.with_name(f"{partition.name}.partial.ndjson.gz")
+    count = export_hands(conn, str(partial), "ndjson", table=partition.name)
+    os.replace(partial, path)
+
+    with conn:
+        with conn.cursor() as cur:
+            _subtract_player_stats(cur, partition.name)
+            # hand_players rows go with the ids
+            cur.execute(f'DELETE FROM hand_ids WHERE id IN (SELECT id FROM "{partition.name}")')
+            cur.execute(f'DROP TABLE "{partition.name}"')
+    logger.info("archived %s: %d hands to %s", partition.name, count, path)
+    return str(path), count
+
+
+def _subtract_player_stats(cur, table: str):
+    """
+    Takes the hand_players rows of the hands in ``table`` out of the
+    player_stats totals, and drops the players left without a hand. The
+    name and last_hand_at of a player are kept as they are.
+    """
+    archived = f'SELECT hp.* FROM hand_players hp JOIN "{table}" h ON h.id = hp.hand_id'
+    # rows are locked in the order _record_players locks them, so hands
+    # saved meanwhile wait instead of deadlocking
+    cur.execute(
+        f"""
+        SELECT 1 FROM player_stats
+        WHERE player_id IN (SELECT player_id FROM ({archived}) a)
+        ORDER BY player_id
+        FOR UPDATE
+        """
+    )
+    cur.execute(
+        f"""
+        UPDATE player_stats s SET
+          hands = s.hands - a.hands,
+          net = s.net - a.net,
+          vpip_hands = s.vpip_hands - a.vpip_hands,
+          pfr_hands = s.pfr_hands - a.pfr_hands,
+          showdowns = s.showdowns - a.showdowns,
+          showdowns_won = s.showdowns_won - a.showdowns_won
+        FROM (
+          SELECT player_id, count(*) AS hands, sum(net) AS net,
+                 count(*) FILTER (WHERE vpip) AS vpip_hands,
+                 count(*) FILTER (WHERE pfr) AS pfr_hands,
+                 count(*) FILTER (WHERE showdown) AS showdowns,
+                 count(*) FILTER (WHERE won) AS showdowns_won
+          FROM ({archived}) a
+          GROUP BY player_id
+        ) a
+        WHERE s.player_id = a.player_id
+        """
+    )
+    cur.execute("DELETE FROM player_stats WHERE hands <= 0")
+
+
+def prune_archives(archive_dir: str, keep_months: int, today: date | None = None) -> list[str]:
+    """Deletes the archives of months before the last ``keep_months``; returns their paths."""
+    first_kept = cutoff(keep_months, today)
+    directory = Path(archive_dir)
+    if first_kept is None or not directory.is_dir():
+        return []
+    deleted = []
+    for path in sorted(directory.iterdir()):
+        match = _ARCHIVE.match(path.name)
+        if match and partition_month(match[1]) < first_kept:
+            path.unlink()
+            deleted.append(str(path))
+    return deleted
+
+
+def maintain(
+    conn,
+    months_ahead: int = PARTITION_MONTHS_AHEAD,
+    keep_months: int = PARTITION_KEEP_MONTHS,
+    archive_dir: str = PARTITION_ARCHIVE_DIR,
+    archive_keep_months: int = PARTITION_ARCHIVE_KEEP_MONTHS,
+    today: date | None = None,
+) -> dict:
+    """
+    Creates upcoming partitions, archives expired ones and prunes old
+    archives (see the module docstring).
+
+    Returns:
+        The names of the partitions created, the paths of the archives
+        written with their hand counts, and the paths of the archives deleted.
+    """
+    created = create_partitions(conn, months_ahead)
+    first_kept = cutoff(keep_months, today)
+    archived = []
+    for partition in list_partitions(conn):
+        # a detached partition is left over from an interrupted run
+        if not partition.attached or (first_kept is not None and partition.month < first_kept):
+            archived.append(archive_partition(conn, partition, archive_dir))
+    return {
+        "created": created,
+        "archived": archived,
+        "pruned": prune_archives(archive_dir, archive_keep_months, today),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.partitions")
+    parser.add_argument("--ahead", type=int, default=PARTITION_MONTHS_AHEAD, help="months created ahead")
+    parser.add_argument(
+        "--keep-months",
+        type=int,
+        default=PARTITION_KEEP_MONTHS,
+        help="whole months kept besides the current one (0: all)",
+    )
+    parser.add_argument("--archive-dir", default=PARTITION_ARCHIVE_DIR)
+    parser.add_argument(
+        "--archive-keep-months",
+        type=int,
+        default=PARTITION_ARCHIVE_KEEP_MONTHS,
+        help="months of archives kept (0: all)",
+    )
+    parser.add_argument("--list", action="store_true", help="only list the partitions")
+    args = parser.parse_args(argv)
+
+    import psycopg2
+    from .repository import DB_URL
+
+    logging.basicConfig(level=logging.INFO)
+    if not DB_URL:
+        print("DATABASE_URL not provided (set environment variable).", file=sys.stderr)
+        return 1
+
+    conn = psycopg2.connect(DB_URL)
+    try:
+        if args.list:
+            for p in list_partitions(conn):
+                state = "attached" if p.attached and not p.detach_pending else "detached"
+                print(f"{p.name}  {p.month:%Y-%m}  {state}")
+            return 0
+        result = maintain(
+            conn, args.ahead, args.keep_months, args.archive_dir, args.archive_keep_months
+        )
+    finally:
+        conn.close()
+    print(f"Created {len(result['created'])} partition(s): {', '.join(result['created']) or '-'}")
+    for path, count in result["archived"]:
+        print(f"Archived {count} hand(s) to {path}")
+    print(f"Deleted {len(result['pruned'])} old archive(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# app/player_stats.py
+"""
+Per-player statistics of stored hands.
+
+Every stored hand gets one hand_players row per seated player (net result,
+VPIP, PFR, showdown) and player_stats keeps each player's running totals.
+HandRepository writes both in the same transaction as the hand, so the
+player endpoints read a handful of rows instead of scanning every payload.
+
+Hands stored before these tables existed are filled in with:
+
+    python -m app.player_stats backfill
+"""
+import sys
+import logging
+import argparse
+
+from .models_entity import HandEntity, HandPlayerEntity
+from .parsing import BET_OR_RAISE, CHECK_OR_CALL, FOLD, ParsedHand, parse_hand
+from .poker_service import (
+    BIG_BLIND_AMOUNT,
+    SMALL_BLIND_AMOUNT,
+    POKERKIT_CARDS,
+    apply_op,
+    new_pokerkit_state,
+)
+from .settlement import settle
+
+logger = logging.getLogger(__name__)
+
+# board size -> street (0 preflop, 1 flop, 2 turn, 3 river)
+_STREETS = {0: 0, 3: 1, 4: 2, 5: 3}
+
+
+def action_trace(hand: ParsedHand) -> list[tuple[int, int, str]]:
+    """
+    Returns (seat, street, kind) for every betting action of a hand, kind
+    being "check", "call", "fold" or "raise". The betting is followed by
+    settle; hands it declines are walked through pokerkit instead.
+    """
+    trace = []
+    payoffs = settle(
+        [seat.stack for seat in hand.seats],
+        [seat.cards for seat in hand.seats],
+        hand.ops,
+        hand.args,
+        SMALL_BLIND_AMOUNT,
+        BIG_BLIND_AMOUNT,
+        trace=trace,
+    )
+    if payoffs is not None:
+        return trace
+    return _pokerkit_trace(hand)
+
+
+def _pokerkit_trace(hand: ParsedHand) -> list[tuple[int, int, str]]:
+    state = new_pokerkit_state([seat.stack for seat in hand.seats])
+    for seat in hand.seats:
+        state.deal_hole([POKERKIT_CARDS[c] for c in seat.cards])
+
+    trace = []
+    for i, (op, arg) in enumerate(zip(hand.ops, hand.args)):
+        actor = state.actor_index
+        if actor is not None:
+            street = _STREETS[len(state.board_cards)]
+            if op == CHECK_OR_CALL:
+                trace.append((actor, street, "call" if state.checking_or_calling_amount else "check"))
+            elif op == FOLD:
+                trace.append((actor, street, "fold"))
+            elif op == BET_OR_RAISE:
+                # apply_op turns a bet matching the current all-in into a call
+                called = arg == max(state.bets) and arg > state.bets[actor]
+                trace.append((actor, street, "call" if called else "raise"))
+        apply_op(state, op, arg, hand.actions[i], i)
+    return trace
+
+
+def hand_players(hand: HandEntity) -> list[HandPlayerEntity]:
+    """
+    Derives the hand_players rows of a replayed hand, from its parsed form
+    when it has one. Hands without payoffs, or whose betting cannot be
+    followed, get no rows.
+    """
+    if not hand.payoffs_json:
+        return []
+    try:
+        parsed = hand.parsed or parse_hand(hand.payload_json)
+        seats = parsed.seats
+        trace = action_trace(parsed)
+    except Exception as e:
+        logger.warning("No player stats for hand %s: %s", hand.id, e)
+        return []
+
+    vpip, pfr, folded = set(), set(), set()
+    for seat, street, kind in trace:
+        if kind == "fold":
+            folded.add(seat)
+        elif street == 0 and kind in ("call", "raise"):
+            vpip.add(seat)
+            if kind == "raise":
+                pfr.add(seat)
+    showdown = len(seats) - len(folded) >= 2
+
+    players = []
+    for i, seat in enumerate(seats):
+        net = hand.payoffs_json.get(seat.id, 0)
+        at_showdown = showdown and i not in folded
+        players.append(
+            HandPlayerEntity(
+                hand_id=hand.id,
+                player_id=seat.id,
+                name=seat.name,
+                seat=i,
+                net=net,
+                vpip=i in vpip,
+                pfr=i in pfr,
+                showdown=at_showdown,
+                won=at_showdown and net > 0,
+            )
+        )
+    return players
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.player_stats")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=1000, help="hands per transaction")
+    args = parser.parse_args(argv)
+
+    from .repository import DB_URL, HandRepository
+
+    logging.basicConfig(level=logging.INFO)
+    if not DB_URL:
+        print("DATABASE_URL not provided (set environment variable).", file=sys.stderr)
+        return 1
+    hands, rows = HandRepository().backfill_player_stats(batch_size=args.batch_size)
+    print(f"Recorded {rows} player row(s) for {hands} hand(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
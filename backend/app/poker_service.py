@@ -1,95 +1,54 @@
 # app/poker_service.py
-from typing import Dict, Any
-from .schemas import HandIn
 import logging
-import re  # Import re for regex parsing
+import time
 
 logger = logging.getLogger(__name__)
-from pokerkit import Automation, NoLimitTexasHoldem
-from typing import Dict, Any
-
-import re  # Import re for regex parsing
-from typing import Dict, Any
+from pokerkit import Automation, Card, NoLimitTexasHoldem
+from .settlement import settle
+from .metrics import REPLAY_ACTION_SECONDS, REPLAY_SECONDS, UNKNOWN_ACTIONS
+from .parsing import (
+    BET_OR_RAISE,
+    BOARD_OPS,
+    CHECK_OR_CALL,
+    FOLD,
+    OP_KINDS,
+    UNKNOWN,
+    HandParseError,
+    ParsedHand,
+    format_cards,
+    parse_hand,
+    seat_order,
+    tokenize_action,
+)
 
 # from pokerkit import State, Automation
 # from pokerkit.games import NoLimitTexasHoldem
 
 # ... (rest of imports and logging setup)
 
+# The payload carries no blind sizes; every hand is played at 20/40.
+SMALL_BLIND_AMOUNT = 20
+BIG_BLIND_AMOUNT = 40
 
-def compute_payoffs_using_pokerkit(payload: dict) -> dict:
-    """
-    Computes the hand payoffs using pokerkit by replaying the hand
-    from the provided payload.
+# pokerkit cards by evaluator card int, so replays never parse card strings
+POKERKIT_CARDS = tuple(next(Card.parse(format_cards((c,)))) for c in range(52))
 
-    Args:
-        payload: The hand data as a dictionary.
 
-    Returns:
-        A dictionary mapping player 'id' strings to their calculated payoff.
+def seat_players(payload: dict) -> list[dict]:
+    """
+    Orders the payload players the way pokerkit seats them: starting from the
+    small blind and skipping anyone without chips.
 
     Raises:
-        ValueError: If the payload is malformed or actions are unexpected.
+        ValueError: If the small blind is unknown or fewer than 2 players have chips.
     """
-    logger.info(f"Computing payoffs for hand {payload.get('id')}")
-
-    # --- 1. Infer Blinds ---
-    # The payload winnings (-40 for 5, +200 for 1) and pot (240)
-    # strongly suggest a 20/40 blind structure where everyone put in 40.
-    small_blind_amount = 20
-    big_blind_amount = 40
-    original_num_players = len(payload["players"])
-
-    # --- 2. Map Players to pokerkit Order (SB, BB, UTG, ..., D) ---
-    players_by_name = {p["name"]: p for p in payload["players"]}
-    player_names_from_payload = [p["name"] for p in payload["players"]]
-    sb_name = payload["smallBlind"]
-
-    try:
-        # Find the SB's index in the original player list
-        sb_index_in_payload = player_names_from_payload.index(sb_name)
-    except ValueError:
-        raise ValueError(f"Small blind '{sb_name}' not found in player list.")
-
-    pk_player_names = []
-    pk_starting_stacks = []
-    pk_hole_cards = []
-    pk_player_id_map = {}  # Maps pokerkit index (0..n-1) to payload player_id
-    pk_index_counter = 0
-
-    # Re-order players starting from the Small Blind
-    for i in range(original_num_players):
-        current_index = (sb_index_in_payload + i) % original_num_players
-        player_name = player_names_from_payload[current_index]
-        player_data = players_by_name[player_name]
-
-        # --- FIX: Filter out players with non-positive stacks (must have chips to play) ---
-        if player_data["stack"] <= 0:
-            logger.warning(
-                f"Skipping player {player_name} (ID: {player_data['id']}) due to non-positive stack: {player_data['stack']}"
-            )
-            continue
-        # --- END FIX ---
-
-        pk_player_names.append(player_name)
-        pk_starting_stacks.append(player_data["stack"])
-        pk_hole_cards.append(player_data["cards"])
-        # Map the sequential pokerkit index to the original ID
-        pk_player_id_map[pk_index_counter] = player_data["id"]
-        pk_index_counter += 1
+    players = payload["players"]
+    order = seat_order([p["name"] for p in players], [p["stack"] for p in players], payload["smallBlind"])
+    return [players[i] for i in order]
 
-    num_players = len(pk_starting_stacks)  # Update num_players after filtering
 
-    if num_players < 2:
-        raise ValueError(
-            "Cannot start a poker hand with less than 2 players having chips."
-        )
-
-    logger.debug(f"pokerkit player order (SB first): {pk_player_names}")
-    logger.debug(f"pokerkit stacks: {pk_starting_stacks}")
-    logger.debug(f"pokerkit ID map: {pk_player_id_map}")
-
-    # --- 3. Create pokerkit State ---
+def new_pokerkit_state(starting_stacks: list[int]):
+    """Creates the 20/40 no-limit hold'em pokerkit state used for every replay."""
     automations = (
         Automation.ANTE_POSTING,
         Automation.BET_COLLECTION,
@@ -100,134 +59,180 @@ def compute_payoffs_using_pokerkit(payload: dict) -> dict:
         Automation.CHIPS_PULLING,
     )
 
-    state = NoLimitTexasHoldem.create_state(
+    return NoLimitTexasHoldem.create_state(
         automations,
         False,  # Uniform antes
         0,  # Antes amount
-        (small_blind_amount, big_blind_amount),  # Blinds
-        big_blind_amount,  # Min-bet
-        tuple(pk_starting_stacks),
-        num_players,
+        (SMALL_BLIND_AMOUNT, BIG_BLIND_AMOUNT),  # Blinds
+        BIG_BLIND_AMOUNT,  # Min-bet
+        tuple(starting_stacks),
+        len(starting_stacks),
+    )
+
+
+def _as_parsed(hand: ParsedHand | dict) -> ParsedHand:
+    return hand if isinstance(hand, ParsedHand) else parse_hand(hand)
+
+
+def compute_payoffs(hand: ParsedHand | dict) -> dict:
+    """
+    Computes the hand payoffs, settling fold-outs and showdowns natively and
+    replaying whatever the fast path declines through pokerkit. Both paths
+    return identical payoffs for the hands the fast path accepts.
+
+    Args:
+        hand: A parsed hand, or a payload to parse first.
+    """
+    hand = _as_parsed(hand)
+    started = time.perf_counter()
+    seats = hand.seats
+    pk_payoffs = settle(
+        [seat.stack for seat in seats],
+        [seat.cards for seat in seats],
+        hand.ops,
+        hand.args,
+        SMALL_BLIND_AMOUNT,
+        BIG_BLIND_AMOUNT,
     )
+    if pk_payoffs is None:
+        payoffs = compute_payoffs_using_pokerkit(hand)
+        REPLAY_SECONDS.observe(time.perf_counter() - started, path="pokerkit")
+        return payoffs
+
+    REPLAY_SECONDS.observe(time.perf_counter() - started, path="settle")
+    # settle skips unknown actions just like apply_op does
+    unknown = hand.ops.count(UNKNOWN)
+    if unknown:
+        UNKNOWN_ACTIONS.inc(unknown)
+    logger.debug("Settled hand %s without pokerkit", hand.id)
+    return {seat.id: payoff for seat, payoff in zip(seats, pk_payoffs)}
+
+
+def apply_op(state, op: int, arg, action_str: str = "", i: int = 0):
+    """
+    Applies one tokenized action (app/parsing.py) to a pokerkit state.
+    Unknown actions are logged and skipped.
+    """
+    if op == CHECK_OR_CALL:
+        state.check_or_call()
+    elif op == FOLD:
+        state.fold()
+    elif op == BET_OR_RAISE:
+        # Handle explicit bets (bXXX) or raises (rXXX)
+        amount = arg
+
+        # --- FIX: Distinguish between a Call (to match all-in) and a Raise ---
+        # Get the highest amount currently committed by any player this street.
+        # This is the amount the current actor must match to call.
+        amount_to_match = max(state.bets)
+
+        # If the player is committing exactly the highest committed amount,
+        # they are calling/matching the all-in, which pokerkit wants as check_or_call().
+        # We also ensure the action is actually committing new chips (amount > current bet).
+        if amount == amount_to_match and amount > state.bets[state.actor_index]:
+            state.check_or_call()
+        else:
+            # Otherwise, use complete_bet_or_raise_to() for genuine raises or initial bets.
+            state.complete_bet_or_raise_to(amount)
+        # --- END FIX ---
+
+    elif op in BOARD_OPS:
+        # Flop, Turn, or River action (Board Dealing)
+        # This signals the end of the current betting street.
+        # These operations must happen in sequence to advance the street
+        # an unknown card: pokerkit would otherwise burn the top of its own
+        # deck, which may be a card the hand deals later (a UserWarning)
+        state.burn_card("??")
+        state.deal_board([POKERKIT_CARDS[c] for c in arg])
+    else:
+        # Catch any other unknown action strings
+        logger.warning("Unknown action '%s' at index %d - skipping.", action_str, i)
+        UNKNOWN_ACTIONS.inc()
+
+
+def apply_action(state, action_str: str, i: int = 0):
+    """
+    Applies one payload action (c, x, f, bN, rN, F[...], T[...], R[...]) to a
+    pokerkit state. Unknown actions are logged and skipped.
+    """
+    op, arg = tokenize_action(action_str)
+    apply_op(state, op, arg, action_str, i)
+
+
+def compute_payoffs_using_pokerkit(hand: ParsedHand | dict) -> dict:
+    """
+    Computes the hand payoffs using pokerkit by replaying the hand.
+
+    Args:
+        hand: A parsed hand, or a payload to parse first.
+
+    Returns:
+        A dictionary mapping player 'id' strings to their calculated payoff.
+
+    Raises:
+        HandParseError: If a payload is given and it is malformed.
+        Exception: If pokerkit rejects an action.
+    """
+    hand = _as_parsed(hand)
+    logger.debug("Computing payoffs for hand %s", hand.id)
+
+    # --- 1. Infer Blinds ---
+    # The payload winnings (-40 for 5, +200 for 1) and pot (240)
+    # strongly suggest a 20/40 blind structure where everyone put in 40
+    # (see SMALL_BLIND_AMOUNT / BIG_BLIND_AMOUNT).
+
+    # --- 2. Players are already in pokerkit Order (SB, BB, UTG, ..., D) ---
+    seats = hand.seats
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("pokerkit player order (SB first): %s", [seat.name for seat in seats])
+
+    # --- 3. Create pokerkit State ---
+    state = new_pokerkit_state([seat.stack for seat in seats])
 
     # --- 4. Deal Hole Cards ---
     # state.deal_hole() deals cards to players in their index order (0, 1, 2...)
-    for cards in pk_hole_cards:
-        state.deal_hole(cards)
+    for seat in seats:
+        state.deal_hole([POKERKIT_CARDS[c] for c in seat.cards])
 
     # --- 5. Process Actions ---
-    actions = payload["actions"]
-
-    for i, action_str in enumerate(actions):
+    for i, (op, arg) in enumerate(zip(hand.ops, hand.args)):
+        started = time.perf_counter()
         try:
-            if action_str == "c" or action_str == "x":
-                # Check or Call
-                state.check_or_call()
-            elif action_str.lower() == "f":
-                # Fold
-                state.fold()
-            elif re.match(r"[rb]\d+$", action_str):
-                # Handle explicit bets (bXXX) or raises (rXXX)
-                amount_str = action_str[1:]
-                amount = int(amount_str)
-
-                # --- FIX: Distinguish between a Call (to match all-in) and a Raise ---
-                # Get the highest amount currently committed by any player this street.
-                # This is the amount the current actor must match to call.
-                amount_to_match = max(state.bets)
-
-                # If the player is committing exactly the highest committed amount,
-                # they are calling/matching the all-in, which pokerkit wants as check_or_call().
-                # We also ensure the action is actually committing new chips (amount > current bet).
-                if amount == amount_to_match and amount > state.bets[state.actor_index]:
-                    state.check_or_call()
-                else:
-                    # Otherwise, use complete_bet_or_raise_to() for genuine raises or initial bets.
-                    state.complete_bet_or_raise_to(amount)
-                # --- END FIX ---
-
-            elif action_str.startswith(("F[", "T[", "R[")):
-                # Flop, Turn, or River action (Board Dealing)
-                # This signals the end of the current betting street.
-                cards = action_str[2:-1]  # Get the cards (e.g., "9hKs7c")
-
-                # These operations must happen in sequence to advance the street
-                state.burn_card()
-                state.deal_board(cards)
-            else:
-                # Catch any other unknown action strings
-                logger.warning(
-                    f"Unknown action '{action_str}' at index {i} - skipping."
-                )
-                pass
+            apply_op(state, op, arg, hand.actions[i], i)
+            REPLAY_ACTION_SECONDS.observe(time.perf_counter() - started, action=OP_KINDS[op])
         except Exception as e:
-            logger.error(
-                f"pokerkit state error on action '{action_str}' (index {i}): {e}"
-            )
-            logger.error(f"Current state: {state}")
+            action_str = hand.actions[i]
+            logger.error("pokerkit state error on action '%s' (index %d): %s", action_str, i, e)
+            logger.debug("pokerkit state at the failed action: %s", state)
             raise Exception(f"pokerkit error at action {i} ('{action_str}'): {e}")
 
     # --- 6. Get Payoffs ---
     # The automations CHIPS_PUSHING/PULLING should run,
     # and state.payoffs will be populated.
-    if state.status != "ENDED":
-        logger.warning(
-            f"Hand state is '{state.status}', not 'ENDED'. Payoffs may be incomplete."
-        )
+    # state.status is True while the hand is still running
+    if state.status:
+        logger.warning("Hand %s has not ended after its last action. Payoffs may be incomplete.", hand.id)
 
     pk_payoffs = state.payoffs  # This is a tuple, e.g., (-40, 200, -40, ...)
-    logger.debug(f"pokerkit raw payoffs (index-based): {pk_payoffs}")
+    logger.debug("pokerkit raw payoffs (index-based): %s", pk_payoffs)
 
     # --- 7. Map Payoffs back to Player IDs ---
-    payoffs_map = {}
-    for pk_index, payoff_amount in enumerate(pk_payoffs):
-        player_id = pk_player_id_map[pk_index]
-        payoffs_map[player_id] = payoff_amount
+    payoffs_map = {seat.id: payoff for seat, payoff in zip(seats, pk_payoffs)}
 
-    logger.info(f"Computed payoffs: {payoffs_map}")
+    logger.debug("Computed payoffs: %s", payoffs_map)
     return payoffs_map
 
 
-def _validate_cards_format(cards):
-    # simple validation: strings of length 2 per card or like "As"
-    if not isinstance(cards, list):
-        return False
-    for c in cards:
-        if not isinstance(c, str) or len(c.strip()) < 2:
-            return False
-    return True
-
-
-def validate_hand_payload(data: Dict[str, Any]) -> tuple[bool, str]:
+def validate_hand_payload(data: dict) -> tuple[bool, str]:
     """
     Basic validation of incoming payload (structure and some rules).
-    Returns (is_valid, error_message_or_empty).
+    Returns (is_valid, error_message_or_empty); parse_hand returns the
+    parsed hand instead.
     """
     try:
-        hand = HandIn.model_validate(data)
-    except Exception as e:
-        return False, f"Schema validation error: {e}"
-
-    # check player count
-    if not (2 <= len(hand.players) <= 6):
-        return False, "players count must be between 2 and 6"
-
-    # check cards format for each player
-    for p in hand.players:
-        # allow "AsKd" or "As Kd" or ["As","Kd"] as single string - this API expects combined string
-        if not isinstance(p.cards, str) or len(p.cards.strip()) < 2:
-            return False, f"player {p.name} cards invalid: {p.cards}"
-
-    if not _validate_cards_format(hand.communityCards):
-        return (
-            False,
-            "communityCards must be a list of card codes like ['Ts','Kd','5s']",
-        )
-
-    # other checks (finalPot positive etc.)
-    if hand.finalPot < 0:
-        return False, "finalPot must be non-negative"
-
+        parse_hand(data)
+    except HandParseError as e:
+        return False, str(e)
     return True, ""
 
 
@@ -0,0 +1,351 @@
+# app/preflop.py
+"""
+Precomputed preflop equity, served from a memory-mapped file.
+
+Two tables are built once by ``python -m app.preflop build``:
+
+* heads-up: equity and tie chance for every ordered pair of starting hands
+  (1326 x 1326 entries, indexed directly by the two card pairs). Matchups
+  that only differ by a renaming of suits, or by which player is first, have
+  the same equity, so only the 47,008 canonical matchups are simulated and
+  the result is copied to every equivalent entry.
+* multiway: equity of each of the 169 starting-hand classes ("AKs", "T9o",
+  "77") against 1 to 5 random hands.
+
+Lookups are array indexing into the mapped file; every uvicorn worker maps
+the same file read-only, so the pages are shared through the page cache.
+
+Usage:
+    python -m app.preflop build [--samples N] [--workers N]
+"""
+import os
+import sys
+import mmap
+import time
+import struct
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from itertools import permutations
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .evaluator import RANKS, evaluate_batch, parse_cards
+
+logger = logging.getLogger(__name__)
+
+TABLE_PATH = os.getenv(
+    "PREFLOP_TABLE_PATH",
+    os.path.join(tempfile.gettempdir(), "poker-preflop-v1.bin"),
+)
+MAX_OPPONENTS = 5
+
+_MAGIC = b"PKPF"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHII")  # magic, version, byte order, samples, opponents
+_COMBOS = 1326
+_CLASSES = 169
+_MISSING = 0xFFFF
+_SCALE = 0xFFFE  # equity 1.0; 0xFFFF marks an entry that was not built
+
+# combo index of the card pair a < b is b * (b - 1) / 2 + a
+_COMBO_CARDS = np.array([(a, b) for b in range(52) for a in range(b)], dtype=np.int64)
+_COMBO_INDEX = np.full((52, 52), -1, dtype=np.int64)
+_COMBO_INDEX[_COMBO_CARDS[:, 0], _COMBO_CARDS[:, 1]] = np.arange(_COMBOS)
+_COMBO_INDEX[_COMBO_CARDS[:, 1], _COMBO_CARDS[:, 0]] = np.arange(_COMBOS)
+
+
+def combo_index(hole: list[int]) -> int:
+    return int(_COMBO_INDEX[hole[0], hole[1]])
+
+
+def hand_class(hole: list[int]) -> str:
+    """Starting-hand class of two encoded cards, e.g. "AKs", "T9o" or "77"."""
+    high, low = sorted((hole[0] >> 2, hole[1] >> 2), reverse=True)
+    if high == low:
+        return RANKS[high] * 2
+    return RANKS[high] + RANKS[low] + ("s" if hole[0] & 3 == hole[1] & 3 else "o")
+
+
+def class_index(name: str) -> int:
+    """Row of a starting-hand class: pairs on the diagonal, suited above it."""
+    if len(name) not in (2, 3) or name[0] not in RANKS or name[1] not in RANKS:
+        raise ValueError(f"invalid starting hand class: {name!r}")
+    high, low = RANKS.index(name[0]), RANKS.index(name[1])
+    if high < low:
+        high, low = low, high
+    if high == low:
+        if len(name) != 2:
+            raise ValueError(f"invalid starting hand class: {name!r}")
+        return high * 13 + low
+    if len(name) != 3 or name[2] not in "so":
+        raise ValueError(f"invalid starting hand class: {name!r}")
+    return low * 13 + high if name[2] == "s" else high * 13 + low
+
+
+def _class_representative(index: int) -> list[int]:
+    row, col = divmod(index, 13)
+    if row == col:
+        return [row * 4, row * 4 + 1]
+    if row < col:  # suited
+        return [col * 4, row * 4]
+    return [row * 4, col * 4 + 1]
+
+
+# --- canonical matchups -----------------------------------------------------
+
+
+def canonical_matchups() -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Every ordered pair of disjoint starting hands, with the canonical
+    matchup it belongs to.
+
+    Returns:
+        (first, second, canonical, swapped): combo indexes of both hands,
+        the id of the equivalence class (the smallest ``a * 1326 + b`` over
+        all suit renamings and both seat orders) and whether that smallest
+        key had the players the other way round.
+    """
+    first, second = np.meshgrid(np.arange(_COMBOS), np.arange(_COMBOS), indexing="ij")
+    first, second = first.ravel(), second.ravel()
+    h1, h2 = _COMBO_CARDS[first], _COMBO_CARDS[second]
+    disjoint = (h1[:, :, None] != h2[:, None, :]).all(axis=(1, 2))
+    first, second, h1, h2 = first[disjoint], second[disjoint], h1[disjoint], h2[disjoint]
+
+    canonical = np.full(len(first), np.iinfo(np.int64).max)
+    swapped = np.zeros(len(first), dtype=bool)
+    for perm in permutations(range(4)):
+        renamed = np.array([(c >> 2) * 4 + perm[c & 3] for c in range(52)])
+        a = _COMBO_INDEX[renamed[h1[:, 0]], renamed[h1[:, 1]]]
+        b = _COMBO_INDEX[renamed[h2[:, 0]], renamed[h2[:, 1]]]
+        for key, is_swapped in ((a * _COMBOS + b, False), (b * _COMBOS + a, True)):
+            better = key < canonical
+            canonical[better] = key[better]
+            swapped[better] = is_swapped
+    return first, second, canonical, swapped
+
+
+# --- simulation -------------------------------------------------------------
+
+
+def _simulate(hero: list[int], opponents: list[list[int]], random_opponents: int, samples: int, rng):
+    """Monte Carlo equity and tie chance of ``hero``; random opponents are dealt per sample."""
+    from .equity import sample_runouts
+
+    dealt = hero + [c for hole in opponents for c in hole]
+    deck = np.array(sorted(set(range(52)) - set(dealt)), dtype=np.int64)
+    draws = sample_runouts(deck, 5 + 2 * random_opponents, samples, rng)
+    board = draws[:, :5]
+
+    def score(hole_cards):
+        return evaluate_batch(np.hstack([hole_cards, board]))
+
+    scores = [score(np.broadcast_to(np.array(hole), (samples, 2))) for hole in [hero] + opponents]
+    for k in range(random_opponents):
+        scores.append(score(draws[:, 5 + 2 * k : 7 + 2 * k]))
+    scores = np.stack(scores)
+    winners = scores == scores.max(axis=0)
+    shares = winners.sum(axis=0)
+    equity = (winners[0] / shares).mean()
+    tie = (winners[0] & (shares > 1)).mean()
+    return float(equity), float(tie)
+
+
+def _simulate_matchups(keys: list[int], samples: int, seed: int) -> list[tuple[int, float, float]]:
+    rng = np.random.default_rng(seed)
+    results = []
+    for key in keys:
+        a, b = divmod(key, _COMBOS)
+        hero, villain = _COMBO_CARDS[a].tolist(), _COMBO_CARDS[b].tolist()
+        results.append((key, *_simulate(hero, [villain], 0, samples, rng)))
+    return results
+
+
+def _simulate_classes(samples: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    table = np.empty((_CLASSES, MAX_OPPONENTS), dtype=np.float64)
+    for index in range(_CLASSES):
+        hero = _class_representative(index)
+        for opponents in range(1, MAX_OPPONENTS + 1):
+            table[index, opponents - 1] = _simulate(hero, [], opponents, samples, rng)[0]
+    return table
+
+
+def _to_fixed(values: np.ndarray) -> np.ndarray:
+    return np.round(np.asarray(values) * _SCALE).astype(np.uint16)
+
+
+def build_tables(
+    samples: int = 20000,
+    workers: int = 1,
+    matchups: list[tuple[str, str]] | None = None,
+    seed: int = 2024,
+    progress: bool = False,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Simulates the heads-up and multiway tables.
+
+    Args:
+        samples: Monte Carlo boards per matchup.
+        workers: Processes sharing the heads-up simulations.
+        matchups: Only build the classes of these hole card pairs, e.g.
+            [("AsKs", "QdQh")]; everything else stays missing. For tests.
+        seed: Base seed; the same arguments give the same tables.
+
+    Returns:
+        (equity, tie, multiway) as uint16 fixed-point arrays.
+    """
+    first, second, canonical, swapped = canonical_matchups()
+    keys = np.unique(canonical)
+    if matchups is not None:
+        wanted = set()
+        for hero, villain in matchups:
+            pair = first * _COMBOS + second
+            at = np.flatnonzero(pair == combo_index(parse_cards(hero)) * _COMBOS + combo_index(parse_cards(villain)))
+            wanted.update(canonical[at].tolist())
+        keys = np.array(sorted(wanted), dtype=np.int64)
+
+    chunks = [keys[i::max(workers, 1) * 8].tolist() for i in range(max(workers, 1) * 8)]
+    chunks = [chunk for chunk in chunks if chunk]
+    results = {}
+    started = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_simulate_matchups, c, samples, seed + i) for i, c in enumerate(chunks)]
+            for done, future in enumerate(futures, start=1):
+                results.update((k, (e, t)) for k, e, t in future.result())
+                if progress:
+                    print(f"  heads-up: {done}/{len(chunks)} chunks ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+    else:
+        for i, chunk in enumerate(chunks):
+            results.update((k, (e, t)) for k, e, t in _simulate_matchups(chunk, samples, seed + i))
+            if progress:
+                print(f"  heads-up: {i + 1}/{len(chunks)} chunks ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+
+    equity = np.full(_COMBOS * _COMBOS, _MISSING, dtype=np.uint16)
+    tie = np.full(_COMBOS * _COMBOS, _MISSING, dtype=np.uint16)
+    built = np.isin(canonical, keys)
+    lookup = {k: i for i, k in enumerate(keys.tolist())}
+    rep_equity = np.array([results[k][0] for k in keys.tolist()])
+    rep_tie = np.array([results[k][1] for k in keys.tolist()])
+    rows = np.array([lookup[k] for k in canonical[built].tolist()], dtype=np.int64)
+    # the matchup seen from the other seat: equity 1 - e, same tie chance
+    values = np.where(swapped[built], 1.0 - rep_equity[rows], rep_equity[rows])
+    cells = first[built] * _COMBOS + second[built]
+    equity[cells] = _to_fixed(values)
+    tie[cells] = _to_fixed(rep_tie[rows])
+
+    if matchups is None:
+        multiway = _to_fixed(_simulate_classes(samples, seed))
+    else:
+        multiway = np.full((_CLASSES, MAX_OPPONENTS), _MISSING, dtype=np.uint16)
+    return equity, tie, multiway.ravel()
+
+
+def write_tables(path: str = TABLE_PATH, samples: int = 20000, **kwargs) -> None:
+    """Builds the tables and writes them to ``path`` atomically."""
+    equity, tie, multiway = build_tables(samples=samples, **kwargs)
+    byte_order = 1 if sys.byteorder == "little" else 2
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".poker-preflop-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, byte_order, samples, MAX_OPPONENTS))
+            for table in (equity, tie, multiway):
+                f.write(table.tobytes())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# --- lookups ----------------------------------------------------------------
+
+
+class PreflopTables:
+    """Read-only view of a table file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        expected = _HEADER.size + 2 * (2 * _COMBOS * _COMBOS + _CLASSES * MAX_OPPONENTS)
+        if len(self._mm) != expected:
+            self._mm.close()
+            raise ValueError(f"{path} is not a usable preflop table")
+        magic, version, byte_order, samples, opponents = _HEADER.unpack_from(self._mm)
+        if (magic, version, byte_order, opponents) != (
+            _MAGIC, _VERSION, 1 if sys.byteorder == "little" else 2, MAX_OPPONENTS
+        ):
+            self._mm.close()
+            raise ValueError(f"{path} is not a usable preflop table")
+        self.path = path
+        self.samples = samples
+        cells = _COMBOS * _COMBOS
+        self._equity = np.frombuffer(self._mm, dtype=np.uint16, count=cells, offset=_HEADER.size)
+        self._tie = np.frombuffer(self._mm, dtype=np.uint16, count=cells, offset=_HEADER.size + 2 * cells)
+        self._multiway = np.frombuffer(
+            self._mm, dtype=np.uint16, count=_CLASSES * MAX_OPPONENTS, offset=_HEADER.size + 4 * cells
+        ).reshape(_CLASSES, MAX_OPPONENTS)
+
+    def heads_up(self, hero: list[int], villain: list[int]) -> tuple[float, float] | None:
+        """(equity, tie chance) of ``hero`` against ``villain``, or None if not built."""
+        cell = combo_index(hero) * _COMBOS + combo_index(villain)
+        equity, tie = int(self._equity[cell]), int(self._tie[cell])
+        if equity == _MISSING:
+            return None
+        return equity / _SCALE, tie / _SCALE
+
+    def versus_random(self, name: str, opponents: int) -> float | None:
+        """Equity of a starting-hand class against ``opponents`` random hands."""
+        if not 1 <= opponents <= MAX_OPPONENTS:
+            raise ValueError(f"opponents must be between 1 and {MAX_OPPONENTS}")
+        value = int(self._multiway[class_index(name), opponents - 1])
+        return None if value == _MISSING else value / _SCALE
+
+
+_lock = threading.Lock()
+_tables: PreflopTables | None = None
+_checked = False
+
+
+def load_tables(path: str | None = None) -> PreflopTables | None:
+    """
+    Maps the table file once per process. Returns None (and live
+    computation is used instead) when it has not been built.
+    """
+    global _tables, _checked
+    if _checked:
+        return _tables
+    with _lock:
+        if not _checked:
+            path = path or TABLE_PATH
+            try:
+                _tables = PreflopTables(path)
+                logger.info("Preflop equity tables mapped from %s", path)
+            except (OSError, ValueError) as e:
+                logger.warning("Preflop equity tables unavailable (%s); run python -m app.preflop build", e)
+            _checked = True
+    return _tables
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.preflop")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--samples", type=int, default=20000, help="boards simulated per matchup")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--path", default=TABLE_PATH)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    write_tables(args.path, samples=args.samples, workers=args.workers, progress=True)
+    print(f"Wrote {args.path} in {time.perf_counter() - started:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
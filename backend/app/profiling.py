@@ -0,0 +1,247 @@
+# app/profiling.py
+"""
+Opt-in sampled profiling of HTTP requests.
+
+With PROFILE_SLOWEST=N, a fraction (PROFILE_SAMPLE_RATE) of requests runs
+under cProfile, one at a time, and the N slowest profiled requests are kept
+with their stats for GET /debug/profiles.
+
+cProfile only records the thread that enabled it, and only one profiler can
+be active at a time. A sampled request is therefore profiled on the event
+loop thread by the middleware, and each threadpool call it makes through
+this module's run_in_threadpool (which ProfiledRoute also uses for sync
+endpoints) pauses that profile and is profiled in its worker thread instead.
+Other requests that the event loop interleaves while a sampled request
+awaits show up in its profile too; replays on the process pool do not show
+up at all (their timings are in the poker_replay_* metrics).
+"""
+import io
+import os
+import heapq
+import pstats
+import time
+import random
+import inspect
+import cProfile
+import functools
+import itertools
+import threading
+import contextvars
+from datetime import datetime, timezone
+from typing import Callable
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+
+from .metrics import HTTP_REQUEST_SECONDS
+
+STATS_LINES = 40
+
+_current: contextvars.ContextVar["RequestProfile | None"] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+
+class RequestProfile:
+    """
+    The cProfile runs of one sampled request: the event loop thread's, plus
+    one per threadpool call it made.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = cProfile.Profile()
+        self._profiles: list[cProfile.Profile] = [self._loop]
+        self._paused = 0
+        self._in_thread = False
+        self.finished = False
+
+    def start(self):
+        self._loop.enable()
+
+    def pause(self):
+        # called on the event loop thread, around every threadpool call
+        if self._paused == 0 and not self.finished:
+            self._loop.disable()
+        self._paused += 1
+
+    def resume(self):
+        self._paused -= 1
+        if self._paused == 0 and not self.finished:
+            self._loop.enable()
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Calls ``fn`` in a worker thread, profiled unless another call of this request is."""
+        with self._lock:
+            profiled = not (self._in_thread or self.finished)
+            self._in_thread = self._in_thread or profiled
+        if not profiled:
+            return fn(*args, **kwargs)
+        pr = cProfile.Profile()
+        pr.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            pr.disable()
+            with self._lock:
+                self._in_thread = False
+                self._profiles.append(pr)
+
+    def close(self) -> list[cProfile.Profile]:
+        """Stops profiling on the event loop thread and returns every run."""
+        with self._lock:
+            self.finished = True
+            profiles = list(self._profiles)
+        if self._paused == 0:
+            self._loop.disable()
+        return profiles
+
+    def stats_text(self, lines: int = STATS_LINES) -> str:
+        out = io.StringIO()
+        stats = pstats.Stats(*self.close(), stream=out)
+        stats.sort_stats("cumulative").print_stats(lines)
+        return out.getvalue()
+
+
+async def run_in_threadpool(fn: Callable, *args, **kwargs):
+    """starlette's run_in_threadpool, profiling ``fn`` when the request is sampled."""
+    profile = _current.get()
+    if profile is None or profile.finished:
+        return await _run_in_threadpool(fn, *args, **kwargs)
+    profile.pause()
+    try:
+        return await _run_in_threadpool(profile.run, fn, *args, **kwargs)
+    finally:
+        profile.resume()
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose sync endpoints go through this module's run_in_threadpool."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = _wrap_sync(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _wrap_sync(endpoint: Callable) -> Callable:
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        return await run_in_threadpool(endpoint, *args, **kwargs)
+
+    return wrapper
+
+
+class RequestProfiler:
+    """
+    Samples requests for profiling and keeps the ``keep`` slowest.
+
+    Args:
+        keep: How many profiled requests to keep.
+        sample_rate: Fraction of requests to profile (while none is running).
+    """
+
+    def __init__(self, keep: int, sample_rate: float = 0.1):
+        self.keep = keep
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._busy = False
+        self._slowest: list = []  # min-heap of (seconds, seq, entry)
+        self._seq = itertools.count()
+        self.profiled = 0
+
+    @classmethod
+    def from_env(cls) -> "RequestProfiler | None":
+        keep = int(os.getenv("PROFILE_SLOWEST", "0"))
+        if keep <= 0:
+            return None
+        return cls(keep, sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.1")))
+
+    def start(self) -> tuple[RequestProfile, contextvars.Token] | None:
+        """Starts profiling the current request if it is sampled, else returns None."""
+        if random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            if self._busy:
+                return None
+            self._busy = True
+        profile = RequestProfile()
+        try:
+            profile.start()
+        except ValueError:
+            # another profiler (a debugger, coverage) owns the interpreter
+            with self._lock:
+                self._busy = False
+            return None
+        return profile, _current.set(profile)
+
+    def finish(self, started: tuple, seconds: float, method: str, route: str, status: int):
+        profile, token = started
+        _current.reset(token)
+        try:
+            with self._lock:
+                self.profiled += 1
+                fastest = self._slowest[0][0] if len(self._slowest) >= self.keep else None
+            if fastest is not None and seconds <= fastest:
+                profile.close()
+                return
+            entry = {
+                "method": method,
+                "route": route,
+                "status": status,
+                "seconds": round(seconds, 6),
+                "profiled_at": datetime.now(timezone.utc).isoformat(),
+                "stats": profile.stats_text(),
+            }
+            with self._lock:
+                item = (seconds, next(self._seq), entry)
+                if len(self._slowest) < self.keep:
+                    heapq.heappush(self._slowest, item)
+                else:
+                    heapq.heappushpop(self._slowest, item)
+        finally:
+            with self._lock:
+                self._busy = False
+
+    def slowest(self) -> list[dict]:
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware that observes every HTTP request in
+    poker_http_request_seconds (by route template, not raw path) and runs the
+    requests the profiler samples under cProfile.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler | None = None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        sampled = self.profiler.start() if self.profiler is not None else None
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - started
+            # the router stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(
+                seconds, method=scope["method"], route=route, status=status
+            )
+            if sampled is not None:
+                self.profiler.finish(sampled, seconds, scope["method"], route, status)
@@ -0,0 +1,170 @@
+# app/replay.py
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+from . import metrics
+from .metrics import REPLAY_ERRORS
+from .parsing import ParsedHand
+from .poker_service import compute_payoffs
+from .profiling import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayTimeoutError(RuntimeError):
+    """Raised when a replay does not finish within the configured timeout."""
+
+
+class ReplayWorkerCrashed(RuntimeError):
+    """Raised when the replay keeps killing its worker process even after a restart."""
+
+
+def _init_worker():
+    # import pokerkit (and map the hand rank tables) once per worker process,
+    # instead of on the first replay that lands there
+    import pokerkit  # noqa: F401
+    from . import poker_service  # noqa: F401
+    from .evaluator import load_tables
+    from .logs import configure_logging
+
+    load_tables()
+    # spawned workers start with unconfigured logging
+    configure_logging()
+
+
+def _hand_id(hand) -> str | None:
+    # replay functions given to ReplayService may take plain dicts
+    return hand.id if isinstance(hand, ParsedHand) else hand.get("id")
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class ReplayService:
+    """
+    Runs hand replays on a pool of worker processes so CPU-bound pokerkit
+    work scales with cores and never blocks the event loop.
+
+    With ``workers=0`` replays run inline on the default threadpool instead,
+    which is what tests and single-core deployments use.
+    """
+
+    def __init__(
+        self,
+        workers: int = 0,
+        timeout: float = 10.0,
+        fn: Callable[[ParsedHand], dict] = compute_payoffs,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self._fn = fn
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    @classmethod
+    def from_env(cls) -> "ReplayService":
+        return cls(
+            workers=int(os.getenv("REPLAY_WORKERS", str(os.cpu_count() or 1))),
+            timeout=float(os.getenv("REPLAY_TIMEOUT", "10")),
+        )
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn rather than fork: the server process runs threads and an event loop
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def start(self):
+        """Creates the worker pool and waits until every worker is up."""
+        if self.workers <= 0:
+            return
+        self._executor = self._new_executor()
+        pids = {f.result() for f in [self._executor.submit(_ping) for _ in range(self.workers)]}
+        logger.info("Replay pool started with %d worker process(es)", len(pids))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _restart(self, broken: ProcessPoolExecutor, stuck: bool = False):
+        """
+        Replaces a pool whose worker died, or, when ``stuck``, one whose worker
+        is still running a replay that timed out: its processes are killed, so
+        that a hung replay does not hold on to a worker for good. Replays in
+        flight on the old pool fail with BrokenProcessPool and are retried.
+        """
+        with self._lock:
+            # several in-flight replays see the same crash; restart only once
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self.restarts += 1
+        processes = list((broken._processes or {}).values()) if stuck else []
+        logger.error(
+            "Replay %s - process pool restarted", "timed out" if stuck else "worker died"
+        )
+        broken.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    async def replay(self, hand: ParsedHand) -> dict:
+        """
+        Computes the payoffs of one hand. The parsed hand, not its payload,
+        is what a worker process receives.
+
+        Raises:
+            ReplayTimeoutError: If the replay exceeds the configured timeout.
+            ReplayWorkerCrashed: If the worker process dies twice in a row.
+            Exception: Whatever the replay function raised for a bad hand.
+        """
+        try:
+            return await self._replay(hand)
+        except ReplayTimeoutError:
+            REPLAY_ERRORS.inc(reason="timeout")
+            raise
+        except ReplayWorkerCrashed:
+            REPLAY_ERRORS.inc(reason="crash")
+            raise
+        except Exception:
+            REPLAY_ERRORS.inc(reason="error")
+            raise
+
+    async def _replay(self, hand: ParsedHand) -> dict:
+        loop = asyncio.get_running_loop()
+        for attempt in (1, 2):
+            executor = self._executor
+            if executor is None:
+                future = run_in_threadpool(self._fn, hand)
+            else:
+                # the worker's metrics come back with the result (app/metrics.py)
+                future = loop.run_in_executor(executor, metrics.collecting, self._fn, hand)
+            try:
+                result = await asyncio.wait_for(future, self.timeout)
+                if executor is not None:
+                    result, samples = result
+                    metrics.merge(samples)
+                return result
+            except asyncio.TimeoutError:
+                if executor is not None:
+                    self._restart(executor, stuck=True)
+                raise ReplayTimeoutError(
+                    f"replay of hand {_hand_id(hand)} exceeded {self.timeout}s"
+                )
+            except BrokenProcessPool:
+                self._restart(executor)
+                if attempt == 2:
+                    raise ReplayWorkerCrashed(
+                        f"replay of hand {_hand_id(hand)} crashed its worker process"
+                    )
@@ -1,71 +1,501 @@
 # app/repository.py
 import os
 import json
+import time
+import logging
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 import psycopg2.extras
-from typing import List
-from .models_entity import HandEntity
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List
+from .codec import encode_hand
+from .db import ConnectionPool
+from .metrics import STAGE_SECONDS
+from .models_entity import HandEntity, HandPlayerEntity, PlayerStatsEntity
+from .player_stats import hand_players
+from .search import HandFilter
+
+logger = logging.getLogger(__name__)
 
 DB_URL = os.getenv("DATABASE_URL")  ## "postgresql://ibrahim@localhost:5432/pokerdb"  ##
 
+# newest first; (created_at, id) is unique and backed by hands_created_at_id_idx
+_KEYSET_ORDER = "ORDER BY created_at DESC, id DESC"
+
+_HAND_COLUMNS = "id, payload, payoffs, created_at"
+# the JSON is only read for hands stored before payload_bin existed
+_ENCODED_COLUMNS = (
+    "id, created_at, payload_bin, "
+    "CASE WHEN payload_bin IS NULL THEN payload END AS payload, "
+    "CASE WHEN payload_bin IS NULL THEN payoffs END AS payoffs"
+)
+# the API record of a hand (app/fastjson.hand_record), assembled by PostgreSQL;
+# cast to text so psycopg2 does not parse it back into a dict
+_RECORD_COLUMNS = (
+    "id, created_at, "
+    "json_build_object('id', id, 'payload', payload, 'payoffs', payoffs, "
+    "'created_at', created_at)::text AS record"
+)
+
+
+def _raw_text(cur):
+    """Makes ``cur`` return text columns as the bytes PostgreSQL sent, undecoded."""
+    psycopg2.extensions.register_type(psycopg2.extensions.BYTES, cur)
+
+
+def _page_query(
+    after: tuple[datetime, str] | None = None,
+    filters: HandFilter | None = None,
+    limit: int | None = None,
+    columns: str = _HAND_COLUMNS,
+) -> tuple[str, list]:
+    """SELECT of the hands strictly older than ``after`` that match ``filters``, newest first."""
+    conditions, params = [], []
+    if after is not None:
+        # the plain bound lets the planner skip newer created_at ranges
+        conditions.append("created_at <= %s AND (created_at, id) < (%s, %s::uuid)")
+        params += [after[0], *after]
+    if filters is not None:
+        more, more_params = filters.conditions()
+        conditions += more
+        params += more_params
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT %s"
+        params.append(limit)
+    return (
+        f"SELECT {columns} FROM hands {where} {_KEYSET_ORDER} {limit_clause}",
+        params,
+    )
+
+
+def _row_to_entity(r) -> HandEntity:
+    return HandEntity(
+        id=r["id"],
+        payload_json=r["payload"],
+        payoffs_json=r["payoffs"],
+        created_at=r["created_at"],
+        content_hash=r.get("content_hash"),
+    )
+
+
+def _row_to_encoded(r) -> tuple[str, datetime, bytes]:
+    if r["payload_bin"] is not None:
+        data = bytes(r["payload_bin"])
+    else:
+        data = encode_hand(r["payload"], r["payoffs"])
+    return r["id"], r["created_at"], data
+
+
+def _row_to_player_stats(r) -> PlayerStatsEntity:
+    return PlayerStatsEntity(
+        player_id=r["player_id"],
+        name=r["name"],
+        hands=r["hands"],
+        net=r["net"],
+        vpip_hands=r["vpip_hands"],
+        pfr_hands=r["pfr_hands"],
+        showdowns=r["showdowns"],
+        showdowns_won=r["showdowns_won"],
+        last_hand_at=r["last_hand_at"],
+    )
+
+
+def _record_players(cur, players: List[tuple[HandPlayerEntity, datetime]]) -> int:
+    """
+    Inserts the hand_players rows of stored hands and adds them to the
+    player_stats totals; returns the number of rows inserted. Rows that
+    already exist are skipped, so no hand is ever counted twice.
+    """
+    if not players:
+        return 0
+    inserted = psycopg2.extras.execute_values(
+        cur,
+        """
+        INSERT INTO hand_players
+          (hand_id, player_id, name, seat, net, vpip, pfr, showdown, won, created_at)
+        VALUES %s
+        ON CONFLICT (hand_id, player_id) DO NOTHING
+        RETURNING player_id, name, net, vpip, pfr, showdown, won, created_at
+        """,
+        [
+            (p.hand_id, p.player_id, p.name, p.seat, p.net, p.vpip, p.pfr, p.showdown, p.won, at)
+            for p, at in players
+        ],
+        template="(%s::uuid, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        page_size=len(players),
+        fetch=True,
+    )
+
+    # one row per player: ON CONFLICT cannot update the same row twice
+    totals = {}
+    for player_id, name, net, vpip, pfr, showdown, won, created_at in inserted:
+        t = totals.setdefault(player_id, [name, 0, 0, 0, 0, 0, 0, created_at])
+        if created_at >= t[7]:
+            t[0], t[7] = name, created_at
+        t[1] += 1
+        t[2] += net
+        t[3] += vpip
+        t[4] += pfr
+        t[5] += showdown
+        t[6] += won
+    if totals:
+        psycopg2.extras.execute_values(
+            cur,
+            """
+            INSERT INTO player_stats (player_id, name, hands, net, vpip_hands, pfr_hands,
+                                      showdowns, showdowns_won, last_hand_at)
+            VALUES %s
+            ON CONFLICT (player_id) DO UPDATE SET
+              name = CASE WHEN EXCLUDED.last_hand_at >= player_stats.last_hand_at
+                          THEN EXCLUDED.name ELSE player_stats.name END,
+              hands = player_stats.hands + EXCLUDED.hands,
+              net = player_stats.net + EXCLUDED.net,
+              vpip_hands = player_stats.vpip_hands + EXCLUDED.vpip_hands,
+              pfr_hands = player_stats.pfr_hands + EXCLUDED.pfr_hands,
+              showdowns = player_stats.showdowns + EXCLUDED.showdowns,
+              showdowns_won = player_stats.showdowns_won + EXCLUDED.showdowns_won,
+              last_hand_at = GREATEST(player_stats.last_hand_at, EXCLUDED.last_hand_at)
+            """,
+            # rows are locked in a fixed order, so concurrent saves of hands
+            # sharing players wait for each other instead of deadlocking
+            [(player_id, *t) for player_id, t in sorted(totals.items())],
+            page_size=len(totals),
+        )
+    return len(inserted)
+
+
+class DuplicateHandError(Exception):
+    """Raised by save when a hand with the same id is already stored."""
+
 
 class HandRepository:
-    def __init__(self, db_url: str | None = None):
+    def __init__(self, db_url: str | None = None, pool: ConnectionPool | None = None):
+        self._pool = pool
+        if pool is not None:
+            return
         url = db_url or DB_URL
         if not url:
             raise RuntimeError("DATABASE_URL not provided (set environment variable).")
         self._db_url = url
 
+    @contextmanager
     def _get_conn(self):
+        # borrow from the shared pool when the app owns one, otherwise fall
+        # back to a dedicated connection (scripts, one-off usage)
+        started = time.perf_counter()
+        if self._pool is not None:
+            with self._pool.connection() as conn:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage="db_connect")
+                yield conn
+            return
         # psycopg2.connect accepts a DSN string
-        return psycopg2.connect(self._db_url)
+        conn = psycopg2.connect(self._db_url)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="db_connect")
+        try:
+            yield conn
+        finally:
+            conn.close()
 
     def save(self, hand: HandEntity) -> HandEntity:
-        conn = self._get_conn()
-        try:
-            with conn:
+        """
+        Stores a hand together with its player statistics.
+
+        Raises:
+            DuplicateHandError: If a hand with this id is already stored.
+        """
+        with STAGE_SECONDS.time(stage="player_stats"):
+            players = hand_players(hand)
+        with self._get_conn() as conn:
+            try:
+                with STAGE_SECONDS.time(stage="insert"), conn:
+                    with conn.cursor() as cur:
+                        cur.execute(
+                            """
+                            INSERT INTO hands
+                              (id, payload, payoffs, content_hash, payload_bin, created_at)
+                            VALUES (%s, %s::jsonb, %s::jsonb, %s, %s, NOW())
+                            RETURNING created_at
+                            """,
+                            (
+                                hand.id,
+                                json.dumps(hand.payload_json),
+                                (
+                                    json.dumps(hand.payoffs_json)
+                                    if hand.payoffs_json is not None
+                                    else None
+                                ),
+                                hand.content_hash,
+                                encode_hand(hand.payload_json, hand.payoffs_json),
+                            ),
+                        )
+                        row = cur.fetchone()
+                        if row is None:
+                            # the table skips a hand whose id is stored already
+                            raise DuplicateHandError(f"hand {hand.id} already exists")
+                        created_at = row[0]
+                        hand.created_at = created_at
+                        _record_players(cur, [(p, created_at) for p in players])
+            except psycopg2.errors.UniqueViolation:
+                raise DuplicateHandError(f"hand {hand.id} already exists")
+            return hand
+
+    def save_many(self, hands: List[HandEntity]) -> List[HandEntity]:
+        """
+        Inserts all hands with one multi-row INSERT in a single transaction.
+        Hands whose id already exists are skipped; only the hands that were
+        actually written are returned (with created_at filled in). Player
+        statistics of the written hands are stored in the same transaction.
+        """
+        if not hands:
+            return []
+        with STAGE_SECONDS.time(stage="player_stats"):
+            players = {h.id: hand_players(h) for h in hands}
+        with self._get_conn() as conn:
+            with STAGE_SECONDS.time(stage="insert"), conn:
                 with conn.cursor() as cur:
-                    cur.execute(
+                    rows = psycopg2.extras.execute_values(
+                        cur,
                         """
-                        INSERT INTO hands (id, payload, payoffs, created_at)
-                        VALUES (%s, %s::jsonb, %s::jsonb, NOW())
-                        RETURNING created_at
+                        INSERT INTO hands
+                          (id, payload, payoffs, content_hash, payload_bin, created_at)
+                        VALUES %s
+                        ON CONFLICT DO NOTHING
+                        RETURNING id, created_at
                         """,
-                        (
-                            hand.id,
-                            json.dumps(hand.payload_json),
+                        [
                             (
-                                json.dumps(hand.payoffs_json)
-                                if hand.payoffs_json is not None
-                                else None
-                            ),
-                        ),
+                                h.id,
+                                json.dumps(h.payload_json),
+                                (
+                                    json.dumps(h.payoffs_json)
+                                    if h.payoffs_json is not None
+                                    else None
+                                ),
+                                h.content_hash,
+                                encode_hand(h.payload_json, h.payoffs_json),
+                            )
+                            for h in hands
+                        ],
+                        template="(%s, %s::jsonb, %s::jsonb, %s, %s, NOW())",
+                        page_size=len(hands),
+                        fetch=True,
                     )
-                    created_at = cur.fetchone()[0]
-                    hand.created_at = created_at
-            return hand
-        finally:
-            conn.close()
+                    created = {str(hand_id).lower(): created_at for hand_id, created_at in rows}
+                    saved = []
+                    for h in hands:
+                        created_at = created.get(str(h.id).lower())
+                        if created_at is not None:
+                            h.created_at = created_at
+                            saved.append(h)
+                    _record_players(
+                        cur, [(p, h.created_at) for h in saved for p in players[h.id]]
+                    )
+        return saved
+
+    def get(self, hand_id: str) -> HandEntity | None:
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(
+                        "SELECT id, payload, payoffs, created_at FROM hands WHERE id = %s",
+                        (hand_id,),
+                    )
+                    row = cur.fetchone()
+                    return _row_to_entity(row) if row is not None else None
+
+    def find_existing(self, hand_ids: List[str]) -> dict[str, HandEntity]:
+        """Returns the stored hands among ``hand_ids``, keyed by normalized id."""
+        if not hand_ids:
+            return {}
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(
+                        "SELECT id, payload, payoffs, content_hash, created_at FROM hands "
+                        "WHERE id = ANY(%s::uuid[])",
+                        (list(hand_ids),),
+                    )
+                    return {str(r["id"]).lower(): _row_to_entity(r) for r in cur.fetchall()}
 
     def list_all(self) -> List[HandEntity]:
-        conn = self._get_conn()
-        try:
+        with self._get_conn() as conn:
             with conn:
                 with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                     cur.execute(
                         "SELECT id, payload, payoffs, created_at FROM hands ORDER BY created_at DESC;"
                     )
                     rows = cur.fetchall()
-                    res = []
-                    for r in rows:
-                        res.append(
-                            HandEntity(
-                                id=r["id"],
-                                payload_json=r["payload"],
-                                payoffs_json=r["payoffs"],
-                                created_at=r["created_at"],
-                            )
+                    return [_row_to_entity(r) for r in rows]
+
+    def list_page(
+        self,
+        limit: int,
+        after: tuple[datetime, str] | None = None,
+        filters: HandFilter | None = None,
+    ) -> List[HandEntity]:
+        """
+        Returns at most ``limit`` hands matching ``filters``, newest first,
+        strictly older than the ``after`` (created_at, id) keyset position
+        when given.
+        """
+        query, params = _page_query(after, filters, limit)
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(query, params)
+                    return [_row_to_entity(r) for r in cur.fetchall()]
+
+    def list_page_encoded(
+        self,
+        limit: int,
+        after: tuple[datetime, str] | None = None,
+        filters: HandFilter | None = None,
+    ) -> List[tuple[str, datetime, bytes]]:
+        """list_page, but (id, created_at, binary encoding) of every hand."""
+        query, params = _page_query(after, filters, limit, columns=_ENCODED_COLUMNS)
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(query, params)
+                    return [_row_to_encoded(r) for r in cur.fetchall()]
+
+    def list_page_json(
+        self,
+        limit: int,
+        after: tuple[datetime, str] | None = None,
+        filters: HandFilter | None = None,
+    ) -> List[tuple[str, datetime, bytes]]:
+        """
+        list_page, but (id, created_at, JSON record) of every hand, the
+        record built by PostgreSQL and never decoded here.
+        """
+        query, params = _page_query(after, filters, limit, columns=_RECORD_COLUMNS)
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    _raw_text(cur)
+                    cur.execute(query, params)
+                    return cur.fetchall()
+
+    def get_json(self, hand_id: str) -> bytes | None:
+        """The JSON record of a stored hand, as built by PostgreSQL."""
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    _raw_text(cur)
+                    cur.execute(f"SELECT {_RECORD_COLUMNS} FROM hands WHERE id = %s", (hand_id,))
+                    row = cur.fetchone()
+                    return row[2] if row is not None else None
+
+    def get_encoded(self, hand_id: str) -> bytes | None:
+        """Binary encoding (app/codec.py) of a stored hand's payload and payoffs."""
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(f"SELECT {_ENCODED_COLUMNS} FROM hands WHERE id = %s", (hand_id,))
+                    row = cur.fetchone()
+                    return _row_to_encoded(row)[2] if row is not None else None
+
+    def iter_all(
+        self,
+        after: tuple[datetime, str] | None = None,
+        limit: int | None = None,
+        batch_size: int = 1000,
+        filters: HandFilter | None = None,
+    ) -> Iterator[HandEntity]:
+        """
+        Yields hands matching ``filters`` newest first through a server-side
+        cursor, so only ``batch_size`` rows are held in memory at a time. The
+        connection stays checked out until the generator is exhausted or
+        closed.
+        """
+        query, params = _page_query(after, filters, limit)
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(
+                    name="hands_stream", cursor_factory=psycopg2.extras.RealDictCursor
+                ) as cur:
+                    cur.itersize = batch_size
+                    cur.execute(query, params)
+                    for r in cur:
+                        yield _row_to_entity(r)
+
+    def iter_all_json(
+        self,
+        after: tuple[datetime, str] | None = None,
+        limit: int | None = None,
+        batch_size: int = 1000,
+        filters: HandFilter | None = None,
+    ) -> Iterator[bytes]:
+        """iter_all, but the JSON record of every hand, as built by PostgreSQL."""
+        query, params = _page_query(after, filters, limit, columns=_RECORD_COLUMNS)
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(name="hands_stream_json") as cur:
+                    _raw_text(cur)
+                    cur.itersize = batch_size
+                    cur.execute(query, params)
+                    for r in cur:
+                        yield r[2]
+
+    def get_player_stats(self, player_id: str) -> PlayerStatsEntity | None:
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute("SELECT * FROM player_stats WHERE player_id = %s", (player_id,))
+                    row = cur.fetchone()
+                    return _row_to_player_stats(row) if row is not None else None
+
+    def list_player_stats(self, limit: int) -> List[PlayerStatsEntity]:
+        """Returns the totals of at most ``limit`` players, biggest winners first."""
+        with self._get_conn() as conn:
+            with conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(
+                        "SELECT * FROM player_stats ORDER BY net DESC, player_id LIMIT %s",
+                        (limit,),
+                    )
+                    return [_row_to_player_stats(r) for r in cur.fetchall()]
+
+    def backfill_player_stats(self, batch_size: int = 1000) -> tuple[int, int]:
+        """
+        Records the player statistics of stored hands that have none yet,
+        oldest first, one transaction per ``batch_size`` hands, so an
+        interrupted backfill resumes where it stopped. Returns the number of
+        hands visited and of hand_players rows written.
+        """
+        hands = rows = 0
+        after = None
+        while True:
+            where, params = "", []
+            if after is not None:
+                where = "AND (created_at, id) > (%s, %s::uuid)"
+                params = list(after)
+            with self._get_conn() as conn:
+                with conn:
+                    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                        cur.execute(
+                            f"""
+                            SELECT id, payload, payoffs, created_at FROM hands h
+                            WHERE payoffs IS NOT NULL {where}
+                              AND NOT EXISTS (SELECT 1 FROM hand_players hp WHERE hp.hand_id = h.id)
+                            ORDER BY created_at, id
+                            LIMIT %s
+                            """,
+                            (*params, batch_size),
                         )
-                    return res
-        finally:
-            conn.close()
+                        batch = [_row_to_entity(r) for r in cur.fetchall()]
+                        if not batch:
+                            return hands, rows
+                    # _record_players reads the rows it inserted as tuples
+                    with conn.cursor() as cur:
+                        rows += _record_players(
+                            cur, [(p, h.created_at) for h in batch for p in hand_players(h)]
+                        )
+            hands += len(batch)
+            after = (batch[-1].created_at, str(batch[-1].id))
+            logger.info("Backfilled player stats of %d hand(s)", hands)
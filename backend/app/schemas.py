@@ -27,3 +27,15 @@ class HandStored(BaseModel):
     payload: dict
     payoffs: dict | None = None
     created_at: str
+
+
+class EquityIn(BaseModel):
+    players: List[str] = Field(..., min_length=2, max_length=6)  # hole cards, e.g. "AsKd"
+    board: List[str] = Field(default_factory=list)  # e.g. ["2c", "3d", "4h"] or ["2c3d4h"]
+    samples: int | None = Field(None, ge=100)
+    seed: int | None = None
+
+
+class WhatIfIn(BaseModel):
+    index: int = Field(..., ge=0)  # how many of the stored actions to keep
+    actions: List[str] = Field(default_factory=list)  # played instead of the rest
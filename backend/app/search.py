@@ -0,0 +1,52 @@
+# app/search.py
+"""
+Filters of GET /hands. Each one is translated into a condition that an
+index of sql/migrations/004_hands_search.sql can serve, either directly on
+the JSONB payload or on a column generated from it.
+"""
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass
+class HandFilter:
+    player: str | None = None  # id or name of a player in the hand
+    winner: str | None = None  # id of a player who finished ahead
+    min_pot: int | None = None
+    max_pot: int | None = None
+    since: datetime | None = None  # created_at >= since
+    until: datetime | None = None  # created_at < until
+    players: int | None = None  # number of players in the payload
+    showdown: bool | None = None  # two or more players never folded
+
+    def conditions(self) -> tuple[list[str], list]:
+        """SQL conditions on the hands table, to be joined with AND, and their parameters."""
+        conditions, params = [], []
+        if self.player is not None:
+            conditions.append(
+                "(payload->'players' @> %s::jsonb OR payload->'players' @> %s::jsonb)"
+            )
+            params += [json.dumps([{"id": self.player}]), json.dumps([{"name": self.player}])]
+        if self.winner is not None:
+            conditions.append("winners @> %s::jsonb")
+            params.append(json.dumps([self.winner]))
+        if self.min_pot is not None:
+            conditions.append("final_pot >= %s")
+            params.append(self.min_pot)
+        if self.max_pot is not None:
+            conditions.append("final_pot <= %s")
+            params.append(self.max_pot)
+        if self.since is not None:
+            conditions.append("created_at >= %s")
+            params.append(self.since)
+        if self.until is not None:
+            conditions.append("created_at < %s")
+            params.append(self.until)
+        if self.players is not None:
+            conditions.append("player_count = %s")
+            params.append(self.players)
+        if self.showdown is not None:
+            conditions.append("showdown = %s")
+            params.append(self.showdown)
+        return conditions, params
@@ -0,0 +1,245 @@
+# app/settlement.py
+"""
+Pure-Python settlement of hands, without replaying them through pokerkit.
+
+Replaying a hand through pokerkit costs far more than the arithmetic it
+needs. settle follows the betting (blinds, bets per street, folds,
+all-ins) with the same seating and blind conventions as
+compute_payoffs_using_pokerkit. A hand that ends with everyone folding to one
+player gives that player every committed chip; a hand that reaches showdown
+(after the river betting or after an all-in run-out) has its main and side
+pots awarded with the lookup-table evaluator. It gives up by returning None
+as soon as the hand does anything it does not model exactly - a short all-in
+raise, an illegal action, a pot that does not split evenly - so pokerkit
+stays the reference for those.
+"""
+from .evaluator import evaluate, parse_cards
+from .parsing import BOARD_OPS, CHECK_OR_CALL, FLOP, FOLD, RIVER, TURN, UNKNOWN, tokenize_action
+
+# street -> the board action that starts it
+_STREET_OPS = {1: FLOP, 2: TURN, 3: RIVER}
+
+
+def settle_hand(
+    stacks: list[int],
+    hole_cards: list[str],
+    actions: list[str],
+    small_blind: int,
+    big_blind: int,
+    trace: list | None = None,
+) -> list[int] | None:
+    """
+    settle() for hole card strings ("AsKd") and payload actions; hands with
+    malformed cards or actions are left to pokerkit (None).
+    """
+    try:
+        holes = [parse_cards(cards) for cards in hole_cards]
+        tokens = [tokenize_action(action) for action in actions]
+    except ValueError:
+        return None
+    ops = bytes(op for op, _ in tokens)
+    args = tuple(arg for _, arg in tokens)
+    return settle(stacks, holes, ops, args, small_blind, big_blind, trace)
+
+
+def settle(
+    stacks: list[int],
+    holes: list,
+    ops: bytes,
+    args: tuple,
+    small_blind: int,
+    big_blind: int,
+    trace: list | None = None,
+) -> list[int] | None:
+    """
+    Settles a hand in pokerkit seat order (small blind first).
+
+    Args:
+        stacks: Starting stacks, all positive.
+        holes: Hole card ints per seat.
+        ops: Action opcodes (app/parsing.py).
+        args: The argument of each action.
+        small_blind: Small blind amount.
+        big_blind: Big blind amount (also the minimum bet).
+        trace: If given, a (seat, street, kind) tuple is appended for every
+            betting action, kind being "check", "call", "fold" or "raise".
+
+    Returns:
+        Payoffs per seat if the hand ends after the last action, either
+        with a single player left or at showdown, otherwise None.
+    """
+    n = len(stacks)
+    if n < 2 or any(len(cards) != 2 for cards in holes):
+        return None
+
+    stacks = list(stacks)
+    bets = [0] * n
+    committed = [0] * n
+    folded = [False] * n
+
+    # pokerkit posts the blinds in seat order, except heads-up where seat 0
+    # is the big blind and the button (seat 1) posts the small blind
+    bb_seat = 0 if n == 2 else 1
+    sb_seat = 1 if n == 2 else 0
+    for seat, blind in ((sb_seat, small_blind), (bb_seat, big_blind)):
+        if stacks[seat] <= blind:
+            return None  # all-in on the blind: leave it to pokerkit
+        stacks[seat] -= blind
+        bets[seat] = blind
+        committed[seat] = blind
+
+    max_bet = big_blind
+    increment = big_blind
+    street = 0  # 0 preflop, 1 flop, 2 turn, 3 river
+    to_act = set(range(n))
+    actor = (bb_seat + 1) % n
+    awaiting_board = False
+    run_out = False  # nobody can bet any more, the board is just dealt out
+    board = []
+    winner = None
+    showdown = False
+
+    def active(seat):
+        return not folded[seat] and stacks[seat] > 0
+
+    for op, arg in zip(ops, args):
+        if op == UNKNOWN:
+            continue  # pokerkit replay skips unknown actions too
+
+        if winner is not None or showdown:
+            return None  # pokerkit rejects anything after the hand ended
+
+        if op in BOARD_OPS:
+            if not awaiting_board or op != _STREET_OPS[street]:
+                return None
+            board.extend(arg)
+            if run_out:
+                if street == 3:
+                    showdown = True
+                else:
+                    street += 1
+                continue
+            bets = [0] * n
+            max_bet = 0
+            increment = big_blind
+            to_act = {seat for seat in range(n) if active(seat)}
+            actor = min(to_act)
+            awaiting_board = False
+            continue
+
+        if awaiting_board:
+            return None
+
+        if op == CHECK_OR_CALL:
+            kind = "call"
+        elif op == FOLD:
+            kind = "fold"
+        else:
+            amount = arg
+            kind = "call" if amount == max_bet and amount > bets[actor] else "raise"
+
+        if kind == "call":
+            paid = min(max_bet - bets[actor], stacks[actor])
+            stacks[actor] -= paid
+            bets[actor] += paid
+            committed[actor] += paid
+            if trace is not None:
+                trace.append((actor, street, "call" if paid else "check"))
+        elif kind == "fold":
+            if bets[actor] >= max_bet:
+                return None  # pokerkit: no reason to fold
+            folded[actor] = True
+            if trace is not None:
+                trace.append((actor, street, "fold"))
+        else:
+            all_in_to = bets[actor] + stacks[actor]
+            others_can_act = any(
+                active(seat) for seat in range(n) if seat != actor
+            )
+            # only full raises; short all-in raises change who may re-raise
+            if not others_can_act or amount < max_bet + increment or amount > all_in_to:
+                return None
+            paid = amount - bets[actor]
+            stacks[actor] -= paid
+            bets[actor] = amount
+            committed[actor] += paid
+            increment = amount - max_bet
+            max_bet = amount
+            to_act = {seat for seat in range(n) if active(seat)}
+            if trace is not None:
+                trace.append((actor, street, "raise"))
+
+        to_act.discard(actor)
+
+        remaining = [seat for seat in range(n) if not folded[seat]]
+        if len(remaining) == 1:
+            winner = remaining[0]
+            continue
+
+        live = [seat for seat in range(n) if active(seat)]
+        to_act &= set(live)
+        if len(live) == 1 and bets[live[0]] >= max_bet:
+            to_act.clear()
+
+        if to_act:
+            actor = next(
+                (actor + step) % n
+                for step in range(1, n + 1)
+                if (actor + step) % n in to_act
+            )
+            continue
+
+        # betting round closed with two or more players still in the pot
+        if street == 3:
+            showdown = True
+            continue
+        run_out = len(live) <= 1
+        street += 1
+        awaiting_board = True
+
+    if winner is not None:
+        payoffs = [-amount for amount in committed]
+        payoffs[winner] = sum(committed) - committed[winner]
+        return payoffs
+    if showdown:
+        return _award_showdown(holes, board, committed, folded)
+    return None
+
+
+def _award_showdown(
+    holes: list,
+    board: list[int],
+    committed: list[int],
+    folded: list[bool],
+) -> list[int] | None:
+    """
+    Splits the committed chips into a main pot and side pots, one per
+    distinct contribution level, and awards each to the best hands among
+    the players still in that contributed to it. A level only one player
+    reached is simply that player's uncalled chips coming back.
+    """
+    n = len(committed)
+    hands = [list(cards) for cards in holes]
+    board_cards = list(board)
+    dealt = [c for seat in range(n) for c in hands[seat]] + board_cards
+    if len(set(dealt)) != len(dealt):
+        return None  # pokerkit tolerates duplicate cards; leave them to it
+
+    strength = [None if folded[seat] else evaluate(hands[seat] + board_cards) for seat in range(n)]
+    payoffs = [-amount for amount in committed]
+    floor = 0
+    for level in sorted(set(committed)):
+        amount = sum(min(c, level) - min(c, floor) for c in committed)
+        if not amount:
+            continue
+        eligible = [seat for seat in range(n) if not folded[seat] and committed[seat] >= level]
+        floor = level
+        if not eligible:
+            return None
+        best = max(strength[seat] for seat in eligible)
+        winners = [seat for seat in eligible if strength[seat] == best]
+        if amount % len(winners):
+            return None  # odd chips follow pokerkit's pot merging; not modelled
+        for seat in winners:
+            payoffs[seat] += amount // len(winners)
+    return payoffs
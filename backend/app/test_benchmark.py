@@ -0,0 +1,33 @@
+import copy
+
+from .benchmark import CORPORA, build_corpus, compare, run
+
+
+def test_corpora_are_deterministic_and_shaped():
+    for name, (_, keep) in CORPORA.items():
+        hands = build_corpus(name, 5, seed=3)
+        assert [g.payload for g in hands] == [g.payload for g in build_corpus(name, 5, seed=3)]
+        assert all(keep(g) for g in hands)
+    assert all(len(g.payload["players"]) == 4 for g in build_corpus("players_4", 5))
+    assert not any(g.showdown for g in build_corpus("foldout", 5))
+
+
+def test_run_and_compare():
+    document = run(size=3, http_hands=3, pages=2, corpora=["foldout"], read_rows=200)
+    assert set(document["results"]) == {
+        "replay.pokerkit.foldout",
+        "replay.fast.foldout",
+        "http.memory.post_hands",
+        "http.memory.get_hands",
+        "read.decode.page",
+        "read.fastjson.page",
+        "read.passthrough.page",
+    }
+    assert document["results"]["http.memory.post_hands"]["count"] == 3
+
+    slower = copy.deepcopy(document)
+    slower["results"]["replay.fast.foldout"]["per_sec"] /= 2
+    lines, regressions = compare(document, slower, threshold=0.1)
+    assert regressions == ["replay.fast.foldout"]
+    assert len(lines) == 7
+    assert compare(document, document)[1] == []
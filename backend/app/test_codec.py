@@ -0,0 +1,68 @@
+import json
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from .codec import decode_hand, encode_frame, encode_hand, iter_frames
+from .handgen import generate_hand
+from .schemas import HandIn
+
+
+def test_round_trip_on_generated_corpus():
+    rng = random.Random(2024)
+    json_size = binary_size = 0
+    for _ in range(300):
+        hand = generate_hand(rng)
+        data = encode_hand(hand.payload, hand.payoffs)
+
+        payload, payoffs = decode_hand(data)
+        assert (payload, payoffs) == (hand.payload, hand.payoffs)
+        assert HandIn.model_validate(payload) == HandIn.model_validate(hand.payload)
+
+        json_size += len(json.dumps(hand.payload, separators=(",", ":")))
+        binary_size += len(data)
+    assert binary_size < 0.3 * json_size
+
+
+def test_round_trip_keeps_unusual_spellings():
+    payload = {
+        "id": "0B7F4C1E-2F63-4A51-9A55-3F0D6F1C2A10",  # not the canonical UUID form
+        "dealer": "Nobody",  # not one of the players
+        "smallBlind": "Alice",
+        "bigBlind": "Alice",  # duplicate names refer to the first one
+        "players": [
+            {"id": "p1", "name": "Alice", "stack": 1000, "cards": "As Kd", "winnings": -40},
+            {"id": "p2", "name": "Alice", "stack": -5, "cards": "10c9c", "winnings": 0},
+            {"id": "p3", "name": "Bob", "stack": 0, "cards": "", "winnings": 40},
+        ],
+        "actions": ["b040", "r60", "F[As Kd 2c]", "T[Qh]", "zz", "F", "c", "x", "f"],
+        "communityCards": ["Qh", "2c"],
+        "finalPot": 123456789,
+    }
+    payoffs = {"p1": -40, "ghost": 40}
+
+    decoded, decoded_payoffs = decode_hand(encode_hand(payload, payoffs))
+
+    assert decoded == payload
+    assert decoded_payoffs == payoffs
+    assert decode_hand(encode_hand(payload))[1] is None
+
+
+def test_rejects_unknown_versions_and_garbage():
+    data = encode_hand(generate_hand(random.Random(5)).payload)
+    with pytest.raises(ValueError):
+        decode_hand(b"\x02" + data[1:])
+    with pytest.raises(ValueError):
+        decode_hand(data[:-3])
+    with pytest.raises(ValueError):
+        decode_hand(data + b"\x00")
+
+
+def test_frames_round_trip():
+    hands = [encode_hand(generate_hand(random.Random(i)).payload) for i in range(3)]
+    created = [datetime(2025, 1, 1, 12, i, 30, 123456, tzinfo=timezone.utc) for i in range(3)]
+
+    stream = b"".join(encode_frame(at, data) for at, data in zip(created, hands))
+
+    assert list(iter_frames(stream)) == list(zip(created, hands))
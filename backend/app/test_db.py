@@ -0,0 +1,101 @@
+import pytest
+from types import SimpleNamespace
+from psycopg2 import extensions
+
+from .db import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool to manage."""
+
+    def __init__(self):
+        self.closed = 0
+        self.info = SimpleNamespace(
+            transaction_status=extensions.TRANSACTION_STATUS_IDLE
+        )
+        self.rollbacks = 0
+
+    def cursor(self):
+        conn = self
+
+        class _Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                if conn.closed:
+                    raise extensions.QueryCanceledError("closed")
+
+        return _Cursor()
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect(dsn):
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    pool = ConnectionPool("postgresql://fake", connect=connect, **kwargs)
+    return pool, created
+
+
+def test_pool_reuses_connections():
+    pool, created = make_pool(minconn=1, maxconn=2)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert len(created) == 1
+    stats = pool.stats()
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+
+
+def test_pool_checkout_times_out_when_exhausted():
+    pool, _ = make_pool(minconn=0, maxconn=1, timeout=0.05)
+
+    held = pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+    pool.putconn(held)
+    with pool.connection():
+        pass
+
+
+def test_pool_replaces_broken_connections():
+    pool, created = make_pool(minconn=1, maxconn=1, health_check_after=0)
+    created[0].close()
+
+    with pool.connection() as conn:
+        assert conn is not created[0]
+
+    assert pool.stats()["discarded"] == 1
+
+
+def test_pool_rolls_back_open_transactions_on_return():
+    pool, _ = make_pool(minconn=0, maxconn=1)
+
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
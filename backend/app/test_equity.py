@@ -0,0 +1,89 @@
+from itertools import combinations
+
+import pytest
+
+from .equity import calculate_equity, hand_equity
+from .evaluator import evaluate, parse_cards
+
+
+def brute_force_equity(holes, board):
+    deck = [c for c in range(52) if c not in board and all(c not in h for h in holes)]
+    totals = [0.0] * len(holes)
+    runouts = list(combinations(deck, 5 - len(board)))
+    for runout in runouts:
+        scores = [evaluate(h + board + list(runout)) for h in holes]
+        winners = [i for i, s in enumerate(scores) if s == max(scores)]
+        for i in winners:
+            totals[i] += 1 / len(winners)
+    return [t / len(runouts) for t in totals]
+
+
+def test_exact_equity_matches_brute_force():
+    holes = [parse_cards("AsKs"), parse_cards("QdQc"), parse_cards("7h6h")]
+    board = parse_cards("Ts9h2s")
+
+    result = calculate_equity(holes, board)
+
+    assert result.method == "exact"
+    assert result.samples == 903
+    assert result.equity == pytest.approx(brute_force_equity(holes, board))
+    assert sum(result.equity) == pytest.approx(1.0)
+
+
+def test_monte_carlo_is_close_to_exact_preflop():
+    holes = [parse_cards("AsAd"), parse_cards("KsKd")]
+
+    result = calculate_equity(holes, [], samples=50000, seed=7)
+
+    assert result.method == "monte_carlo"
+    # exact enumeration of all 1,712,304 boards gives 0.82637
+    assert result.equity[0] == pytest.approx(0.82637, abs=0.01)
+    assert result.win[0] + result.tie[0] + result.win[1] == pytest.approx(1.0)
+
+
+def test_split_board_is_a_tie():
+    result = calculate_equity([parse_cards("2c3d"), parse_cards("4h5s")], parse_cards("AcKdQhJsTc"))
+    assert result.equity == [0.5, 0.5]
+    assert result.tie == [1.0, 1.0]
+
+
+@pytest.mark.parametrize(
+    "holes, board",
+    [
+        (["AsKs", "AsQd"], ""),  # the same card twice
+        (["AsKs", "QdQc"], "2c3c"),  # two-card board
+        (["AsKs"], ""),  # a single player
+    ],
+)
+def test_invalid_input_is_rejected(holes, board):
+    with pytest.raises(ValueError):
+        calculate_equity([parse_cards(h) for h in holes], parse_cards(board))
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_hand_equity_follows_streets_and_folds():
+    payload = {
+        "id": "0c1d2e3f-0000-4000-8000-000000000001",
+        "dealer": "Carol",
+        "smallBlind": "Alice",
+        "bigBlind": "Bob",
+        "players": [
+            {"id": "p1", "name": "Alice", "stack": 1000, "cards": "AsKd", "winnings": 0},
+            {"id": "p2", "name": "Bob", "stack": 1000, "cards": "7h2c", "winnings": 0},
+            {"id": "p3", "name": "Carol", "stack": 1000, "cards": "QsQd", "winnings": 0},
+        ],
+        # Carol calls, Alice completes, Bob checks; Bob folds to Alice's flop bet
+        "actions": ["c", "c", "x", "F[Ah9c4d]", "b40", "f", "c", "T[5s]", "x", "x", "R[2h]"],
+        "communityCards": [],
+        "finalPot": 0,
+    }
+
+    streets = hand_equity(payload, samples=5000, seed=1)
+
+    assert [s["street"] for s in streets] == ["preflop", "flop", "turn", "river"]
+    assert streets[1]["board"] == ["Ah", "9c", "4d"]
+    assert [p["folded"] for p in streets[1]["players"]] == [False, False, False]
+    assert [p["folded"] for p in streets[2]["players"]] == [False, True, False]
+    assert streets[2]["method"] == "exact"
+    river = {p["name"]: p["equity"] for p in streets[3]["players"]}
+    assert river == {"Alice": 1.0, "Bob": 0.0, "Carol": 0.0}
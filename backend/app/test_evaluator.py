@@ -0,0 +1,57 @@
+import random
+import pytest
+from pokerkit import StandardHighHand
+
+from . import evaluator
+from .evaluator import evaluate, format_card, parse_cards
+
+
+def test_known_hand_classes():
+    assert evaluate(parse_cards("AsKsQsJsTs2c3d")) == evaluator.HAND_CLASSES
+    assert evaluator.category(evaluate(parse_cards("AhAdAcKsKd2c3c"))) == "Full house"
+    assert evaluator.category(evaluate(parse_cards("5h4d3c2sAd9cJc"))) == "Straight"
+    assert evaluator.category(evaluate(parse_cards("2h4h6h8hTh3c3d"))) == "Flush"
+    # the flush beats the pair that uses the same cards
+    assert evaluate(parse_cards("2h4h6h8hTh3c3d")) > evaluate(parse_cards("2h4h6h8hTc3c3d"))
+
+
+def test_parse_cards_accepts_payload_spellings():
+    assert parse_cards("As Kd") == parse_cards("AsKd")
+    assert parse_cards("10c") == parse_cards("Tc")
+    with pytest.raises(ValueError):
+        parse_cards("as")
+
+
+def test_table_file_round_trip(tmp_path):
+    path = str(tmp_path / "ranks.bin")
+    evaluator.write_tables(path)
+    rank_table, flush_table, mm = evaluator._map_tables(path)
+    try:
+        built_ranks, built_flushes = evaluator.build_tables()
+        assert rank_table.tolist() == built_ranks.tolist()
+        assert flush_table.tolist() == built_flushes.tolist()
+    finally:
+        rank_table.release()
+        flush_table.release()
+        mm.close()
+
+
+def test_stale_table_file_is_rejected(tmp_path):
+    path = tmp_path / "ranks.bin"
+    path.write_bytes(b"not a table")
+    with pytest.raises(ValueError):
+        evaluator._map_tables(str(path))
+
+
+def test_agrees_with_pokerkit_on_random_hands():
+    # `python -m app.evaluator verify` does this for every hand class
+    rng = random.Random(1234)
+    hands = []
+    for _ in range(1500):
+        cards = rng.sample(range(52), 7)
+        text = "".join(format_card(c) for c in cards)
+        hands.append((evaluate(cards), StandardHighHand.from_game(text[:4], text[4:])))
+
+    for (ours_a, theirs_a), (ours_b, theirs_b) in zip(hands, hands[1:]):
+        assert (ours_a < ours_b) == (theirs_a < theirs_b)
+        assert (ours_a == ours_b) == (theirs_a == theirs_b)
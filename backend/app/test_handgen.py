@@ -0,0 +1,29 @@
+import pytest
+
+from .handgen import POLICIES, generate_hands
+from .poker_service import compute_payoffs_using_pokerkit, validate_hand_payload
+
+
+# boards are dealt from the cards pokerkit still holds, so nothing warns
+@pytest.mark.filterwarnings("error::UserWarning")
+def test_policies_produce_legal_hands_in_their_style():
+    folds = {}
+    for name, policy in POLICIES.items():
+        hands = list(generate_hands(seed=4, count=30, policies=[policy]))
+        for g in hands:
+            assert validate_hand_payload(g.payload) == (True, "")
+            assert compute_payoffs_using_pokerkit(g.payload) == g.payoffs
+        actions = [a for g in hands for a in g.payload["actions"]]
+        folds[name] = actions.count("f") / len(actions)
+    assert folds["tight"] > folds["random"] > folds["station"]
+
+
+def test_policies_are_assigned_per_seat():
+    # heads-up the button (seat 1, small blind) acts first preflop
+    def open_folds(policies):
+        hands = generate_hands(seed=2, count=60, num_players=2, policies=policies)
+        return sum(g.payload["actions"][:1] == ["f"] for g in hands)
+
+    assert open_folds([POLICIES["station"], POLICIES["tight"]]) > open_folds(
+        [POLICIES["tight"], POLICIES["station"]]
+    )
@@ -0,0 +1,197 @@
+import io
+import json
+
+import psycopg2
+import pytest
+
+from .bulk import map_batches
+from .conftest import needs_database
+from .partitions import list_partitions, maintain
+from .histories import (
+    HandText,
+    _import_batch,
+    import_file,
+    read_hand_texts,
+    translate,
+    verified_row,
+)
+from .repository import HandRepository
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning")
+
+# 3-handed at $0.01/$0.02 to a showdown, with rake and a player sitting out
+SHOWDOWN = """\
+PokerStars Hand #254404443212:  Hold'em No Limit ($0.01/$0.02 USD) - 2025/01/02 18:34:56 CET [2025/01/02 12:34:56 ET]
+Table 'Aludra' 6-max Seat #1 is the button
+Seat 1: Alice ($2.00 in chips)
+Seat 2: Bob ($1.50 in chips)
+Seat 3: Carol ($3.00 in chips)
+Seat 5: Dave ($2.40 in chips) is sitting out
+Bob: posts small blind $0.01
+Carol: posts big blind $0.02
+*** HOLE CARDS ***
+Dealt to Alice [As Qd]
+Alice: raises $0.04 to $0.06
+Bob: folds
+Carol: calls $0.04
+*** FLOP *** [Ah 7c 2d]
+Carol: checks
+Alice: bets $0.08
+Carol: calls $0.08
+*** TURN *** [Ah 7c 2d] [Ks]
+Carol: checks
+Alice: checks
+*** RIVER *** [Ah 7c 2d Ks] [3h]
+Carol: bets $0.20
+Alice: calls $0.20
+*** SHOW DOWN ***
+Carol: shows [7h 7d] (three of a kind, Sevens)
+Alice: shows [As Qd] (a pair of Aces)
+Carol collected $0.66 from pot
+*** SUMMARY ***
+Total pot $0.69 | Rake $0.03
+Board [Ah 7c 2d Ks 3h]
+Seat 1: Alice (button) showed [As Qd] and lost with a pair of Aces
+Seat 2: Bob (small blind) folded before Flop
+Seat 3: Carol (big blind) showed [7h 7d] and won ($0.66) with three of a kind, Sevens
+Seat 5: Dave is sitting out
+"""
+
+# heads-up in chips, won uncontested by the big blind
+HEADS_UP = """\
+PokerStars Hand #254404443213:  Hold'em No Limit (10/20) - 2025/01/02 12:36:01 ET
+Table 'Heads Up' 2-max Seat #1 is the button
+Seat 1: Dan (1500 in chips)
+Seat 2: Eve (1,480 in chips)
+Dan: posts small blind 10
+Eve: posts big blind 20
+*** HOLE CARDS ***
+Dan: raises 40 to 60
+Eve: raises 120 to 180
+Dan: folds
+Uncalled bet (120) returned to Eve
+Eve collected 120 from pot
+Eve: doesn't show hand
+*** SUMMARY ***
+Total pot 120 | Rake 0
+Seat 1: Dan (button) (small blind) folded before Flop
+Seat 2: Eve (big blind) collected (120)
+"""
+
+ANTE = """\
+PokerStars Hand #254404443214:  Hold'em No Limit (10/20) - 2025/01/02 12:37:15 ET
+Table 'Heads Up' 2-max Seat #2 is the button
+Seat 1: Dan (1380 in chips)
+Seat 2: Eve (1,600 in chips)
+Dan: posts the ante 2
+Eve: posts the ante 2
+Eve: posts small blind 10
+Dan: posts big blind 20
+*** HOLE CARDS ***
+Eve: folds
+Uncalled bet (10) returned to Dan
+Dan collected 24 from pot
+*** SUMMARY ***
+Total pot 24 | Rake 0
+"""
+
+
+def test_showdown_is_rescaled_to_20_40_and_verified():
+    hand = translate(SHOWDOWN)
+    payload = hand.payload
+    assert [p["name"] for p in payload["players"]] == ["Alice", "Bob", "Carol"]
+    assert (payload["dealer"], payload["smallBlind"], payload["bigBlind"]) == ("Alice", "Bob", "Carol")
+    assert payload["actions"] == [
+        "r120", "f", "c", "F[Ah7c2d]", "x", "b160", "c", "T[Ks]", "x", "x", "R[3h]", "b400", "c"
+    ]
+    assert payload["communityCards"] == ["Ah", "7c", "2d", "Ks", "3h"]
+    assert [p["stack"] for p in payload["players"]] == [4000, 3000, 6000]
+    assert payload["players"][0]["cards"] == "AsQd" and payload["players"][2]["cards"] == "7h7d"
+    assert payload["finalPot"] == 1380 and hand.rake == 60
+    assert payload["playedAt"] == "2025-01-02T17:34:56+00:00"
+
+    row = verified_row(hand)
+    ids = {p["name"]: p["id"] for p in payload["players"]}
+    # pokerkit takes no rake: Carol wins the whole pot
+    assert json.loads(row.payoffs) == {ids["Alice"]: -680, ids["Bob"]: -20, ids["Carol"]: 700}
+    assert row.id == translate(SHOWDOWN).payload["id"]
+    assert [p["winnings"] for p in json.loads(row.payload)["players"]] == [-680, -20, 700]
+    assert row.created_at is None  # the time of the import
+
+
+def test_heads_up_big_blind_takes_the_first_seat():
+    payload = translate(HEADS_UP).payload
+    assert (payload["dealer"], payload["smallBlind"], payload["bigBlind"]) == ("Dan", "Eve", "Dan")
+    assert payload["actions"] == ["r120", "r360", "f"]
+    assert [p["stack"] for p in payload["players"]] == [3000, 2960]
+    ids = {p["name"]: p["id"] for p in payload["players"]}
+    assert json.loads(verified_row(translate(HEADS_UP)).payoffs) == {ids["Dan"]: -120, ids["Eve"]: 120}
+
+
+def test_unsupported_hands_are_skipped_by_reason():
+    tampered = SHOWDOWN.replace("Carol collected", "Alice collected")
+    odd_blinds = HEADS_UP.replace("blind 10", "blind 8").replace("(10/20)", "(8/20)")
+    truncated = SHOWDOWN.split("*** SUMMARY ***")[0]
+    omaha = "PokerStars Hand #1:  Omaha Pot Limit ($0.01/$0.02 USD)"
+    texts = [SHOWDOWN, ANTE, tampered, odd_blinds, truncated, omaha]
+    results = [result for _, result in map_batches(_import_batch, [HandText(0, t) for t in texts], 0)]
+    assert results[0][0] is not None
+    assert [reason for _, reason in results] == [None, "ante", "payoffs", "blinds", "malformed", "game"]
+
+
+def test_reading_resumes_at_the_next_hand():
+    data = ("\ufeffexported by the client\n\n" + "\n\n\n".join([SHOWDOWN, HEADS_UP, ANTE]) + "\n").encode()
+    texts = list(read_hand_texts(io.BytesIO(data)))
+    assert [t.text for t in texts] == [h.rstrip() for h in (SHOWDOWN, HEADS_UP, ANTE)]
+    assert texts[-1].end == len(data)
+
+    resumed = io.BytesIO(data)
+    resumed.seek(texts[0].end)
+    assert list(read_hand_texts(resumed, texts[0].end)) == texts[1:]
+
+
+@needs_database
+def test_import_checkpoints_and_resumes(scratch_schema, tmp_path):
+    dsn = scratch_schema()
+    path = tmp_path / "hands.txt"
+    path.write_text("\n\n".join([SHOWDOWN, ANTE]) + "\n\n")
+    conn = psycopg2.connect(dsn)
+    try:
+        first = import_file(conn, str(path), workers=0, chunk_hands=1)
+        assert (first["hands"], first["inserted"], first["skipped"]) == (2, 1, {"ante": 1})
+
+        # hands appended later are read from the checkpoint on
+        with open(path, "a") as f:
+            f.write(HEADS_UP + "\n")
+        second = import_file(conn, str(path), workers=0)
+        assert (second["hands"], second["inserted"]) == (3, 2)
+        assert json.loads((tmp_path / "hands.txt.checkpoint").read_text())["offset"] == path.stat().st_size
+    finally:
+        conn.close()
+    assert len(list(HandRepository(db_url=dsn).iter_all())) == 2
+
+
+@needs_database
+def test_imported_hands_are_not_archived_by_the_month_they_were_played(scratch_schema, tmp_path):
+    dsn = scratch_schema()
+    path = tmp_path / "hands.txt"
+    path.write_text("\n\n".join([SHOWDOWN, HEADS_UP]) + "\n\n")
+    conn = psycopg2.connect(dsn)
+    try:
+        before = [p.name for p in list_partitions(conn)]
+        assert import_file(conn, str(path), workers=0)["inserted"] == 2
+        # played in January 2025, stored in the current month's partition
+        assert [p.name for p in list_partitions(conn)] == before
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT payload->>'playedAt', created_at > NOW() - INTERVAL '1 hour' FROM hands")
+                assert sorted(cur.fetchall()) == [
+                    ("2025-01-02T17:34:56+00:00", True),
+                    ("2025-01-02T17:36:01+00:00", True),
+                ]
+
+        result = maintain(conn, months_ahead=0, keep_months=1, archive_dir=str(tmp_path / "archive"))
+        assert result["archived"] == []
+    finally:
+        conn.close()
+    assert len(list(HandRepository(db_url=dsn).iter_all())) == 2
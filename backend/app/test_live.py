@@ -0,0 +1,123 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from .benchmark import MemoryHandRepository
+from .handgen import generate_hands
+from .live import LiveHand, LiveHandError, LiveHandLimitError, LiveHandStore
+from .main import app, get_live_hands, get_repository
+from .parsing import format_cards, parse_hand
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning")
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def live_app():
+    repo, store = MemoryHandRepository(), LiveHandStore(max_hands=10)
+    previous = app.dependency_overrides.get(get_repository)
+    app.dependency_overrides[get_repository] = lambda: repo
+    app.dependency_overrides[get_live_hands] = lambda: store
+    try:
+        yield repo, store
+    finally:
+        del app.dependency_overrides[get_live_hands]
+        if previous is None:
+            del app.dependency_overrides[get_repository]
+        else:
+            app.dependency_overrides[get_repository] = previous
+
+
+def setup_of(payload: dict) -> dict:
+    setup = {k: v for k, v in payload.items() if k not in ("actions", "communityCards", "finalPot")}
+    setup["players"] = [{k: v for k, v in p.items() if k != "winnings"} for p in payload["players"]]
+    return setup
+
+
+def test_live_hands_are_played_and_stored_without_replay(live_app):
+    repo, store = live_app
+    for g in generate_hands(seed=20, count=15):
+        hand_id = g.payload["id"]
+        started = client.post("/live/hands", json=setup_of(g.payload))
+        assert started.status_code == 201
+        view = started.json()
+        assert view["status"] == "active" and view["pot"] == 60
+        # the small blind (or UTG) acts first and still owes chips to call
+        assert [a["action"] for a in view["legal_actions"]][:2] == ["f", "c"]
+
+        bad = client.post(f"/live/hands/{hand_id}/actions", json={"action": "F[2c3c4c]"})
+        assert bad.status_code == 400
+        for action in g.payload["actions"]:
+            view = client.post(f"/live/hands/{hand_id}/actions", json={"action": action}).json()
+
+        assert view["status"] == "complete" and view["saved"]
+        assert view["payoffs"] == g.payoffs
+        stored = repo.get(hand_id)
+        assert stored.payoffs_json == g.payoffs
+        assert parse_hand(stored.payload_json) == stored.parsed
+        assert client.get(f"/live/hands/{hand_id}").status_code == 404
+    assert store.stats()["started"] == 15
+
+
+def test_live_hand_over_websocket(live_app):
+    repo, _ = live_app
+    g = next(generate_hands(seed=21, count=1))
+    with client.websocket_connect("/live/ws") as ws:
+        ws.send_json({"action": "c"})
+        assert ws.receive_json()["status"] == 400
+        ws.send_json({"start": setup_of(g.payload)})
+        assert ws.receive_json()["actor"] is not None
+        ws.send_json({"action": "zz"})
+        assert "unknown action" in ws.receive_json()["error"]
+        for action in g.payload["actions"]:
+            ws.send_json({"action": action})
+            view = ws.receive_json()
+    assert view["payoffs"] == g.payoffs
+    assert repo.get(g.payload["id"]) is not None
+
+
+def test_idle_hands_are_evicted_and_the_store_is_capped():
+    g1, g2, g3 = generate_hands(seed=22, count=3)
+    store = LiveHandStore(max_hands=2, idle_timeout=60)
+    first = store.start(g1.payload["id"], setup_of(g1.payload))
+    store.start(g2.payload["id"], setup_of(g2.payload))
+    with pytest.raises(LiveHandLimitError):
+        store.start(g3.payload["id"], setup_of(g3.payload))
+
+    first.last_used -= 61
+    store.start(g3.payload["id"], setup_of(g3.payload))
+    assert store.get(g1.payload["id"]) is None
+    assert store.stats()["evicted"] == 1
+
+
+def test_actions_must_be_the_legal_ones():
+    g = next(generate_hands(seed=23, count=1))
+    hand = LiveHand(setup_of(g.payload))
+
+    def refused(action: str, message: str):
+        before = len(hand.actions)
+        with pytest.raises(LiveHandError, match=message):
+            hand.apply(action)
+        assert len(hand.actions) == before
+
+    # preflop, facing the big blind
+    legal = {a["action"]: a for a in hand.legal_actions()}
+    raise_to = legal["r"]
+    refused("x", f"cannot check: {legal['c']['amount']} to call")
+    refused("b80", "raise with 'rN'")
+    refused(f"r{raise_to['min'] - 1}", f"must be {raise_to['min']} to {raise_to['max']}")
+    refused(f"r{raise_to['max'] + 1}", f"must be {raise_to['min']} to {raise_to['max']}")
+
+    # everyone calls around to the big blind, who may check
+    while {"action": "x"} not in hand.legal_actions():
+        hand.apply("c")
+    refused("c", "nothing to call")
+    hand.apply("x")
+
+    spare = [c for c in range(52) if c not in hand._dealt]
+    hand.apply(f"F[{format_cards(spare[:3])}]")
+    (bet,) = [a for a in hand.legal_actions() if a["action"] == "b"]
+    refused(f"r{bet['min']}", "bet with 'bN'")
+    refused(f"b{bet['min'] - 1}", f"must be {bet['min']} to")
+    hand.apply(f"b{bet['min']}")
+    assert max(hand.state.bets) == bet["min"]
@@ -0,0 +1,36 @@
+import asyncio
+
+import httpx
+
+from .benchmark import MemoryHandRepository
+from .handgen import generate_hands
+from .loadgen import _request_bodies, run_load
+from .main import app, get_repository
+
+
+def test_run_load_reports_throughput_and_errors():
+    payloads = [g.payload for g in generate_hands(seed=8, count=20)]
+    bodies = _request_bodies(payloads, keep_ids=False)
+    bodies.append(b'{"id": "not-a-hand"}')
+
+    previous = app.dependency_overrides.get(get_repository)
+    app.dependency_overrides[get_repository] = MemoryHandRepository
+    try:
+        async def go():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await run_load(client, bodies, rate=200, concurrency=4)
+
+        report = asyncio.run(go())
+    finally:
+        if previous is None:
+            del app.dependency_overrides[get_repository]
+        else:
+            app.dependency_overrides[get_repository] = previous
+
+    assert report["sent"] == 21
+    assert report["statuses"] == {"200": 20, "400": 1}
+    assert report["error_rate"] == 1 / 21
+    assert report["p99_ms"] >= report["p50_ms"] > 0
+    # the ids were replaced, the hands themselves were not
+    assert payloads[0]["id"] not in bodies[0].decode()
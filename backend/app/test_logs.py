@@ -0,0 +1,100 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from .logs import (
+    LOG_RECORDS_DROPPED,
+    NonBlockingQueueHandler,
+    SamplingFilter,
+    configure_logging,
+    parse_sample_rates,
+    stop_logging,
+)
+
+
+@pytest.fixture
+def configure(capsys):
+    """configure_logging with the given settings; returns a function giving what was written."""
+
+    def configure_with(**settings):
+        configure_logging(**settings)
+
+        def written() -> list[str]:
+            stop_logging()
+            return capsys.readouterr().err.splitlines()
+
+        return written
+
+    yield configure_with
+    stop_logging()
+
+
+def test_records_are_written_as_capped_json_off_the_request_thread(configure):
+    written = configure(level="INFO", fmt="json", max_chars=50)
+    logger = logging.getLogger("app.test_logs")
+    payload = {"id": "h1", "actions": ["c"] * 100}
+
+    logger.debug("not written %s", payload)
+    logger.info("Hand %s saved", "h1", extra={"hand_id": "h1", "payload": payload})
+    payload["actions"].clear()  # queued containers are rendered already
+
+    [line] = written()
+    entry = json.loads(line)
+    assert entry["message"] == "Hand h1 saved" and entry["hand_id"] == "h1"
+    assert entry["logger"] == "app.test_logs" and entry["level"] == "INFO"
+    assert entry["payload"].startswith('{"id":"h1","actions":["c","c"')
+    assert entry["payload"].endswith("more chars)")
+
+
+def test_debug_records_are_sampled_per_logger(configure, monkeypatch):
+    monkeypatch.setattr("random.random", iter([0.5, 0.005] * 10).__next__)
+    written = configure(level="DEBUG", fmt="text", sample="app.noisy=0.01,app.noisy.quiet=0")
+    sampled = LOG_RECORDS_DROPPED.value(reason="sampled")
+
+    for i in range(4):
+        logging.getLogger("app.noisy.replay").debug("event %d", i)
+    logging.getLogger("app.noisy.quiet").info("never")
+    logging.getLogger("app.noisy").warning("always")
+    logging.getLogger("app.other").debug("kept")
+
+    lines = written()
+    assert [line.split(": ", 1)[1] for line in lines] == ["event 1", "event 3", "always", "kept"]
+    assert LOG_RECORDS_DROPPED.value(reason="sampled") - sampled == 3
+
+
+def test_configuration_replaces_the_root_handlers_until_stopped(capsys):
+    root = logging.getLogger()
+    previous = logging.StreamHandler()
+    root.addHandler(previous)
+    level, srcfile = root.level, logging._srcfile
+    try:
+        configure_logging(level="DEBUG", fmt="text")
+        assert [type(h) for h in root.handlers] == [NonBlockingQueueHandler]
+        assert root.level == logging.DEBUG and logging._srcfile is None
+        logging.getLogger("app.test_logs").info("once")
+        stop_logging()
+        assert capsys.readouterr().err.count("once") == 1
+        assert root.handlers == [] and root.level == level
+        assert logging._srcfile == srcfile and logging.logThreads
+    finally:
+        stop_logging()
+        root.removeHandler(previous)
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1), max_chars=100)
+    dropped = LOG_RECORDS_DROPPED.value(reason="queue_full")
+    for i in range(3):
+        handler.handle(logging.makeLogRecord({"msg": "event %d", "args": (i,)}))
+    assert handler.queue.qsize() == 1
+    assert LOG_RECORDS_DROPPED.value(reason="queue_full") - dropped == 2
+
+
+def test_sample_rates_are_validated():
+    assert parse_sample_rates(" app.main=0.1, app=1 ") == {"app.main": 0.1, "app": 1.0}
+    assert SamplingFilter({"app": 0.5})._rate("app.main.sub") == 0.5
+    for spec in ("app.main", "app=2", "=0.5"):
+        with pytest.raises(ValueError):
+            parse_sample_rates(spec)
@@ -1,14 +1,22 @@
+import json
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List
 
 # Import your FastAPI app and the dependency we need to override
-from .main import app, get_repository
+from .main import app, get_replay_service, get_repository, hand_cache, result_cache
 
 # Import the repository class and entity we need to mock
-from .repository import HandRepository
-from .models_entity import HandEntity
+from .repository import DuplicateHandError, HandRepository
+from .replay import ReplayService
+from .search import HandFilter
+from .pagination import encode_cursor
+from .codec import CONTENT_TYPE, decode_hand, encode_hand, iter_frames
+from .fastjson import hand_record_json
+from .poker_service import compute_payoffs
+from .models_entity import HandEntity, PlayerStatsEntity
 
 # --- Mock Data and Dependencies ---
 
@@ -33,23 +41,91 @@ mock_entity = HandEntity(
     created_at=datetime.utcnow(),
 )
 
+# the same hand under a UUID, which GET /hands/{id} and POST /hands require
+stored_entity = HandEntity(
+    id="0b7f4c1e-2f63-4a51-9a55-3f0d6f1c2a10",
+    payload_json=MOCK_PAYLOAD,
+    payoffs_json=MOCK_PAYOFFS,
+    created_at=datetime.utcnow(),
+)
+
+
+MOCK_PLAYER_STATS = [
+    PlayerStatsEntity("p1", "Alice", hands=10, net=-300, vpip_hands=4, pfr_hands=1,
+                      showdowns=0, showdowns_won=0, last_hand_at=datetime(2025, 1, 1)),
+    PlayerStatsEntity("p2", "Bob", hands=8, net=300, vpip_hands=2, pfr_hands=2,
+                      showdowns=4, showdowns_won=3, last_hand_at=datetime(2025, 1, 2)),
+]
+
 
 # 3. Create a Mock Repository class
 class MockHandRepository(HandRepository):
     """A mock repository that returns fake data instead of hitting the DB."""
 
-    def __init__(self):
+    def __init__(self, hands: List[HandEntity] | None = None):
         # We don't call super().__init__() so it never tries to read DATABASE_URL
-        pass
+        self.hands = hands if hands is not None else [mock_entity]
 
     def list_all(self) -> List[HandEntity]:
         # Return a list containing our single mock entity
-        return [mock_entity]
+        return list(self.hands)
+
+    def list_page(self, limit, after=None, filters=None) -> List[HandEntity]:
+        self.filters = filters
+        ordered = sorted(self.hands, key=lambda h: (h.created_at, h.id), reverse=True)
+        if after is not None:
+            ordered = [h for h in ordered if (h.created_at, h.id) < after]
+        return ordered[:limit]
+
+    def list_page_encoded(self, limit, after=None, filters=None):
+        return [
+            (h.id, h.created_at, encode_hand(h.payload_json, h.payoffs_json))
+            for h in self.list_page(limit, after, filters)
+        ]
+
+    def get_encoded(self, hand_id: str) -> bytes | None:
+        h = self.get(hand_id)
+        return encode_hand(h.payload_json, h.payoffs_json) if h is not None else None
+
+    def list_page_json(self, limit, after=None, filters=None):
+        return [
+            (h.id, h.created_at, hand_record_json(h))
+            for h in self.list_page(limit, after, filters)
+        ]
+
+    def get(self, hand_id: str) -> HandEntity | None:
+        return next((h for h in self.hands if h.id == hand_id), None)
+
+    def get_json(self, hand_id: str) -> bytes | None:
+        h = self.get(hand_id)
+        return hand_record_json(h) if h is not None else None
+
+    def iter_all(self, after=None, limit=None, filters=None):
+        yield from self.list_page(limit or len(self.hands), after, filters)
+
+    def iter_all_json(self, after=None, limit=None, filters=None):
+        for h in self.iter_all(after, limit, filters):
+            yield hand_record_json(h)
+
+    def find_existing(self, hand_ids) -> dict:
+        return {h.id: h for h in self.hands if h.id in hand_ids}
 
     def save(self, hand: HandEntity) -> HandEntity:
         # A simple mock save that just returns the hand
+        if any(h.id == hand.id for h in self.hands):
+            raise DuplicateHandError(hand.id)
         return hand
 
+    def save_many(self, hands: List[HandEntity]) -> List[HandEntity]:
+        # the hands already held are stored, so their ids conflict
+        return [h for h in hands if all(h.id != s.id for s in self.hands)]
+
+    def get_player_stats(self, player_id: str) -> PlayerStatsEntity | None:
+        return next((s for s in MOCK_PLAYER_STATS if s.player_id == player_id), None)
+
+    def list_player_stats(self, limit: int) -> List[PlayerStatsEntity]:
+        return sorted(MOCK_PLAYER_STATS, key=lambda s: -s.net)[:limit]
+
 
 # 4. Override the dependency
 # This tells FastAPI: "When get_repository is called, use MockHandRepository instead."
@@ -59,6 +135,16 @@ app.dependency_overrides[get_repository] = lambda: MockHandRepository()
 # --- Test Client ---
 client = TestClient(app)
 
+
+@pytest.fixture
+def stored():
+    """The repository holds stored_entity instead of mock_entity."""
+    app.dependency_overrides[get_repository] = lambda: MockHandRepository([stored_entity])
+    try:
+        yield stored_entity
+    finally:
+        app.dependency_overrides[get_repository] = lambda: MockHandRepository()
+
 # --- The Test ---
 
 
@@ -83,3 +169,398 @@ def test_get_hands_returns_list_of_hands():
     assert data[0]["payload"]["id"] == "test-payload-id"
     assert data[0]["payoffs"]["p1"] == 100
     assert "created_at" in data[0]
+
+
+def make_hand(hand_id: str, actions: List[str]) -> dict:
+    """A valid three-handed payload (SB Alice, BB Bob, Carol on the button)."""
+    return {
+        "id": hand_id,
+        "dealer": "Carol",
+        "smallBlind": "Alice",
+        "bigBlind": "Bob",
+        "players": [
+            {"id": "p1", "name": "Alice", "stack": 1000, "cards": "AsKd", "winnings": 0},
+            {"id": "p2", "name": "Bob", "stack": 1000, "cards": "7h2c", "winnings": 0},
+            {"id": "p3", "name": "Carol", "stack": 1000, "cards": "QsQd", "winnings": 0},
+        ],
+        "actions": actions,
+        "communityCards": [],
+        "finalPot": 0,
+    }
+
+
+def test_post_hands_batch_reports_each_hand(stored):
+    good = make_hand("7d3c2a0e-8a61-4f6b-9d0e-1c2b3a4d5e6f", ["f", "f"])
+    bad_action = make_hand("1a2b3c4d-0000-4000-8000-000000000001", ["r10"])
+    existing = make_hand(stored.id, ["f", "f"])
+    not_uuid = make_hand("not-a-uuid", ["f", "f"])
+
+    response = client.post("/hands/batch", json=[good, bad_action, existing, not_uuid, good])
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["saved"] == 1
+    assert data["failed"] == 4
+
+    statuses = [r["status"] for r in data["results"]]
+    assert statuses == ["saved", "error", "error", "error", "error"]
+    assert data["results"][0]["payoffs"] == {"p1": -20, "p2": 20, "p3": 0}
+    assert "pokerkit" in data["results"][1]["error"]
+    assert data["results"][2]["error"] == "hand id already exists"
+    assert "UUID" in data["results"][3]["error"]
+    assert "duplicate" in data["results"][4]["error"]
+
+
+def test_get_hands_paginates_with_keyset_cursor():
+    base = datetime(2025, 1, 1, 12, 0, 0)
+    hands = [
+        HandEntity(id=f"00000000-0000-4000-8000-00000000000{i}", payload_json={},
+                   payoffs_json=None, created_at=base + timedelta(minutes=i))
+        for i in range(3)
+    ]
+    app.dependency_overrides[get_repository] = lambda: MockHandRepository(hands)
+    try:
+        first = client.get("/hands", params={"limit": 2})
+        assert [h["id"] for h in first.json()] == [hands[2].id, hands[1].id]
+        cursor = first.headers["X-Next-Cursor"]
+
+        second = client.get("/hands", params={"limit": 2, "after": cursor})
+        assert [h["id"] for h in second.json()] == [hands[0].id]
+        assert "X-Next-Cursor" not in second.headers
+
+        assert client.get("/hands", params={"after": "garbage"}).status_code == 400
+        forged = encode_cursor(base, "x")
+        assert client.get("/hands", params={"after": forged}).status_code == 400
+    finally:
+        app.dependency_overrides[get_repository] = lambda: MockHandRepository()
+
+
+def test_get_hands_passes_filters_to_repository():
+    repo = MockHandRepository()
+    app.dependency_overrides[get_repository] = lambda: repo
+    try:
+        response = client.get(
+            "/hands",
+            params={"player": "Alice", "min_pot": 100, "since": "2025-01-01T00:00:00",
+                    "players": 3, "showdown": "true"},
+        )
+        assert response.status_code == 200
+        assert repo.filters == HandFilter(
+            player="Alice", min_pot=100, since=datetime(2025, 1, 1), players=3, showdown=True
+        )
+        assert client.get("/hands", params={"players": 9}).status_code == 422
+    finally:
+        app.dependency_overrides[get_repository] = lambda: MockHandRepository()
+
+
+def test_get_hands_in_binary(stored):
+    accept = {"Accept": CONTENT_TYPE}
+
+    listing = client.get("/hands", headers=accept)
+    assert listing.headers["content-type"] == CONTENT_TYPE
+    frames = list(iter_frames(listing.content))
+    assert len(frames) == 1
+    assert decode_hand(frames[0][1]) == (MOCK_PAYLOAD, MOCK_PAYOFFS)
+
+    single = client.get(f"/hands/{stored.id}", headers=accept)
+    assert decode_hand(single.content) == (MOCK_PAYLOAD, MOCK_PAYOFFS)
+    missing = client.get("/hands/4a1c6f0e-0000-4000-8000-000000000000", headers=accept)
+    assert missing.status_code == 404
+
+
+def test_get_hands_streams_ndjson(stored):
+    response = client.get("/hands", params={"format": "ndjson"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [h["id"] for h in lines] == [stored.id]
+
+
+def test_get_hand_by_id_uses_cache(stored):
+    hand_cache.clear()
+
+    response = client.get(f"/hands/{stored.id}")
+    assert response.status_code == 200
+    assert response.json()["payoffs"] == MOCK_PAYOFFS
+
+    # a second lookup is answered from the cache, even without the repository
+    app.dependency_overrides[get_repository] = lambda: MockHandRepository([])
+    try:
+        assert client.get(f"/hands/{stored.id}").json()["id"] == stored.id
+        assert client.get("/hands/4a1c6f0e-0000-4000-8000-000000000000").status_code == 404
+        assert client.get("/hands/not-a-uuid").status_code == 404
+    finally:
+        app.dependency_overrides[get_repository] = lambda: MockHandRepository()
+    assert hand_cache.stats()["hits"] == 1
+
+
+def test_saved_hands_are_cached_on_insert():
+    hand_cache.clear()
+    hand = make_hand("5e9d7c3b-1111-4222-8333-444455556666", ["f", "f"])
+
+    assert client.post("/hands", json=hand).status_code == 200
+
+    app.dependency_overrides[get_repository] = lambda: MockHandRepository([])
+    try:
+        response = client.get(f"/hands/{hand['id']}")
+    finally:
+        app.dependency_overrides[get_repository] = lambda: MockHandRepository()
+    assert response.status_code == 200
+    assert response.json()["payoffs"] == {"p1": -20, "p2": 20, "p3": 0}
+
+
+def count_replays():
+    calls = []
+
+    def replay(hand):
+        calls.append(hand.id)
+        return compute_payoffs(hand)
+
+    app.dependency_overrides[get_replay_service] = lambda: ReplayService(workers=0, fn=replay)
+    return calls
+
+
+def test_retried_submission_returns_stored_result_without_replay():
+    result_cache.clear()
+    calls = count_replays()
+    hand = make_hand("3c2b1a09-aaaa-4bbb-8ccc-ddddeeeeffff", ["f", "f"])
+    try:
+        first = client.post("/hands", json=hand)
+        # same hand, different key order and UUID spelling
+        retry = dict(reversed(list(hand.items())), id=hand["id"].upper())
+        second = client.post("/hands", json=retry)
+    finally:
+        del app.dependency_overrides[get_replay_service]
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["payoffs"] == first.json()["payoffs"]
+    assert second.headers["Idempotent-Replay"] == "true"
+    assert len(calls) == 1
+
+
+def test_different_payload_reusing_an_id_conflicts(stored):
+    result_cache.clear()
+    calls = count_replays()
+    try:
+        response = client.post("/hands", json=make_hand(stored.id, ["f", "f"]))
+    finally:
+        del app.dependency_overrides[get_replay_service]
+
+    assert response.status_code == 409
+    assert calls == []
+
+
+def test_malformed_cards_are_rejected_before_replay():
+    calls = count_replays()
+    hand = make_hand("3c2b1a09-aaaa-4bbb-8ccc-000000000019", ["f", "f"])
+    hand["players"][1]["cards"] = "7h2x"
+    try:
+        response = client.post("/hands", json=hand)
+    finally:
+        del app.dependency_overrides[get_replay_service]
+
+    assert response.status_code == 400
+    assert "player Bob cards invalid" in response.json()["detail"]
+    assert calls == []
+
+
+def test_concurrently_stored_hand_is_reported_as_saved():
+    # the hand is not visible at lookup time but wins the race to insert
+    hand = make_hand("9a8b7c6d-1234-4567-89ab-cdef01234567", ["f", "f"])
+    stored = HandEntity(id=hand["id"], payload_json=hand,
+                        payoffs_json={"p1": -20, "p2": 20, "p3": 0})
+
+    class RacingRepository(MockHandRepository):
+        def find_existing(self, hand_ids):
+            return {} if not self.hands else super().find_existing(hand_ids)
+
+        def save(self, h):
+            self.hands = [stored]
+            raise DuplicateHandError(h.id)
+
+    result_cache.clear()
+    app.dependency_overrides[get_repository] = lambda: RacingRepository([])
+    try:
+        response = client.post("/hands", json=hand)
+    finally:
+        app.dependency_overrides[get_repository] = lambda: MockHandRepository()
+
+    assert response.status_code == 200
+    assert response.json()["payoffs"] == stored.payoffs_json
+
+
+def test_batch_skips_replay_of_already_stored_hands():
+    result_cache.clear()
+    hand = make_hand("2b4d6f80-aaaa-4bbb-8ccc-000011112222", ["f", "f"])
+    assert client.post("/hands/batch", json=[hand]).json()["saved"] == 1
+
+    calls = count_replays()
+    try:
+        data = client.post("/hands/batch", json=[hand]).json()
+    finally:
+        del app.dependency_overrides[get_replay_service]
+    assert data["saved"] == 1
+    assert data["results"][0]["payoffs"] == {"p1": -20, "p2": 20, "p3": 0}
+    assert calls == []
+
+
+class StoringRepository(MockHandRepository):
+    """Keeps whatever is saved, like the real table."""
+
+    def save_many(self, hands):
+        new = [h for h in hands if all(h.id != s.id for s in self.hands)]
+        self.hands.extend(new)
+        return new
+
+
+def test_async_submission_is_queued_and_stored(monkeypatch):
+    from .ingest import IngestQueue
+    from .main import get_ingest_queue
+
+    monkeypatch.setenv("REPLAY_WORKERS", "0")
+    repo = StoringRepository([])
+    queue = IngestQueue(lambda: repo, ReplayService(workers=0),
+                         workers=1, batch_size=10, batch_wait=1.0)
+    app.dependency_overrides[get_ingest_queue] = lambda: queue
+    app.dependency_overrides[get_repository] = lambda: repo
+    result_cache.clear()
+    hands = [make_hand(f"6f1e2d3c-0000-4000-8000-00000000000{i}", ["f", "f"]) for i in range(5)]
+    try:
+        with TestClient(app) as async_client:
+            headers = {"Prefer": "respond-async"}
+            responses = [async_client.post("/hands", json=h, headers=headers) for h in hands]
+            assert [r.status_code for r in responses] == [202] * 5
+            location = responses[0].headers["Location"]
+            assert async_client.get(location).json()["status"] == "pending"
+
+            # same hand again while queued: still accepted, not queued twice
+            assert async_client.post("/hands", json=hands[0], headers=headers).status_code == 202
+            conflict = dict(hands[0], actions=["c", "f", "f"])
+            assert async_client.post("/hands", json=conflict, headers=headers).status_code == 409
+
+            # shutdown drains whatever was accepted
+            async_client.portal.call(queue.drain)
+            status = async_client.get(location).json()
+            assert status == {"id": hands[0]["id"], "status": "done",
+                              "payoffs": {"p1": -20, "p2": 20, "p3": 0}}
+            assert queue.stats()["accepted"] == 5
+            assert queue.stats()["batches"] == 1
+            assert async_client.post("/hands", json=make_hand(
+                "6f1e2d3c-0000-4000-8000-0000000000ff", ["f", "f"]), headers=headers
+            ).status_code == 503
+    finally:
+        del app.dependency_overrides[get_ingest_queue]
+        app.dependency_overrides[get_repository] = lambda: MockHandRepository()
+
+    assert len(repo.hands) == 5
+    assert client.get("/hands/6f1e2d3c-0000-4000-8000-0000000000aa/status").status_code == 404
+
+
+def test_storage_error_leaves_failed_replays_as_they_were():
+    from .ingest import IngestQueue
+    from .parsing import parse_hand
+
+    class FailingRepository(MockHandRepository):
+        def save_many(self, hands):
+            raise RuntimeError("disk full")
+
+    def replay(hand):
+        if hand.id.endswith("1"):
+            raise ValueError("bad hand")
+        return {}
+
+    queue = IngestQueue(lambda: FailingRepository(), ReplayService(workers=0, fn=replay),
+                        workers=1, batch_size=10, batch_wait=1.0)
+    hands = [make_hand(f"6f1e2d3c-0000-4000-8000-00000000010{i}", ["f", "f"]) for i in range(2)]
+
+    async def run():
+        for h in hands:
+            queue.submit(h["id"], parse_hand(h), h, "digest")
+        await queue.drain()
+
+    asyncio.run(run())
+    assert "pokerkit evaluation error: bad hand" in queue.status(hands[1]["id"])["error"]
+    assert "storage error: disk full" in queue.status(hands[0]["id"])["error"]
+    assert queue.stats()["failed"] == 2
+
+
+def test_post_equity():
+    response = client.post("/equity", json={"players": ["AsKs", "QdQc"], "board": ["Ts", "9h", "2s"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["method"] == "exact"
+    assert sum(p["equity"] for p in data["players"]) == pytest.approx(1.0)
+
+    duplicate = client.post("/equity", json={"players": ["AsKs", "AsQc"]})
+    assert duplicate.status_code == 400
+
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_get_hand_equity():
+    hand = make_hand("0e1f2a3b-0000-4000-8000-000000000002", ["c", "c", "x", "F[Ah9c4d]"])
+    stored = HandEntity(id=hand["id"], payload_json=hand, payoffs_json=None)
+    app.dependency_overrides[get_repository] = lambda: MockHandRepository([stored])
+    try:
+        response = client.get(f"/hands/{hand['id']}/equity", params={"samples": 2000, "seed": 3})
+        missing = client.get("/hands/0e1f2a3b-0000-4000-8000-0000000000ff/equity")
+    finally:
+        app.dependency_overrides[get_repository] = lambda: MockHandRepository()
+
+    assert response.status_code == 200
+    streets = response.json()["streets"]
+    assert [s["street"] for s in streets] == ["preflop", "flop"]
+    assert streets[0]["method"] == "monte_carlo" and streets[0]["samples"] == 2000
+    assert streets[1]["method"] == "exact"
+    assert missing.status_code == 404
+
+
+def test_get_preflop_equity(monkeypatch):
+    from . import preflop
+
+    class Tables:
+        samples = 1000
+
+        def versus_random(self, name, opponents):
+            preflop.class_index(name)
+            return {("AKo", 2): 0.5}.get((name, opponents))
+
+    monkeypatch.setattr(preflop, "_checked", True)
+    monkeypatch.setattr(preflop, "_tables", None)
+    assert client.get("/equity/preflop", params={"hand": "AKo"}).status_code == 503
+
+    monkeypatch.setattr(preflop, "_tables", Tables())
+    response = client.get("/equity/preflop", params={"hand": "Kd As", "opponents": 2})
+    assert response.json() == {"hand": "AKo", "opponents": 2, "equity": 0.5, "samples": 1000}
+    assert client.get("/equity/preflop", params={"hand": "AK"}).status_code == 400
+    assert client.get("/equity/preflop", params={"hand": "AKo", "opponents": 6}).status_code == 422
+
+
+def test_player_stats_endpoints():
+    bob = client.get("/players/p2/stats").json()
+    assert bob["hands"] == 8 and bob["net"] == 300
+    assert (bob["vpip"], bob["pfr"], bob["showdown_win_rate"]) == (0.25, 0.25, 0.75)
+    # no showdowns yet: the rate is undefined rather than zero
+    assert client.get("/players/p1/stats").json()["showdown_win_rate"] is None
+    assert client.get("/players/nobody/stats").status_code == 404
+
+    players = client.get("/players", params={"limit": 1}).json()
+    assert [p["id"] for p in players] == ["p2"]
+
+
+def test_metrics_endpoint():
+    hand = make_hand("6f1d2c3b-7777-4888-9999-aaaabbbbcccc", ["f", "f"])
+    assert client.post("/hands", json=hand).status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    counts = {
+        line.split(" ")[0]: float(line.split(" ")[1])
+        for line in response.text.splitlines()
+        if "_count" in line
+    }
+    for stage in ("validate", "replay", "serialize"):
+        assert counts[f'poker_stage_seconds_count{{stage="{stage}"}}'] >= 1
+    assert counts['poker_http_request_seconds_count{method="POST",route="/hands",status="200"}'] >= 1
+    assert client.get("/debug/profiles").status_code == 404
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from . import metrics
+from .metrics import Counter, Histogram
+from .profiling import ProfiledRoute, RequestProfiler, RequestTimingMiddleware
+
+LATENCY = Histogram("test_latency_seconds", "test", ("op",), buckets=(0.1, 1))
+EVENTS = Counter("test_events_total", "test")
+
+
+def test_histogram_renders_cumulative_buckets():
+    LATENCY.clear()
+    for value in (0.05, 0.1, 0.5, 3):
+        LATENCY.observe(value, op='say "hi"')
+
+    lines = [line for line in metrics.render().splitlines() if line.startswith("test_latency")]
+    assert lines == [
+        'test_latency_seconds_bucket{op="say \\"hi\\"",le="0.1"} 2',
+        'test_latency_seconds_bucket{op="say \\"hi\\"",le="1"} 3',
+        'test_latency_seconds_bucket{op="say \\"hi\\"",le="+Inf"} 4',
+        'test_latency_seconds_sum{op="say \\"hi\\""} 3.65',
+        'test_latency_seconds_count{op="say \\"hi\\""} 4',
+    ]
+    with pytest.raises(ValueError):
+        LATENCY.observe(1, stage="x")
+
+
+def test_collected_samples_are_merged_elsewhere():
+    LATENCY.clear()
+    EVENTS.clear()
+
+    def work():
+        LATENCY.observe(0.2, op="a")
+        EVENTS.inc(3)
+        return "done"
+
+    result, samples = metrics.collecting(work)
+    assert result == "done"
+    assert LATENCY.count(op="a") == 0 and EVENTS.value() == 0
+
+    metrics.merge(samples)
+    assert LATENCY.count(op="a") == 1 and EVENTS.value() == 3
+
+
+def slow_helper(seconds: float):
+    time.sleep(seconds)
+
+
+def test_profiler_keeps_the_slowest_requests():
+    profiler = RequestProfiler(keep=2, sample_rate=1.0)
+    app = FastAPI()
+    app.router.route_class = ProfiledRoute
+    app.add_middleware(RequestTimingMiddleware, profiler=profiler)
+
+    @app.get("/sleep/{ms}")
+    def sleep(ms: int):
+        slow_helper(ms / 1000)
+        return {"slept": ms}
+
+    client = TestClient(app)
+    for ms in (30, 1, 60):
+        assert client.get(f"/sleep/{ms}").json() == {"slept": ms}
+
+    slowest = profiler.slowest()
+    assert profiler.profiled == 3
+    assert [entry["route"] for entry in slowest] == ["/sleep/{ms}"] * 2
+    assert slowest[0]["seconds"] > slowest[1]["seconds"] >= 0.03
+    # the endpoint ran in a threadpool thread and is still in the profile
+    assert "slow_helper" in slowest[0]["stats"]
+    assert metrics.HTTP_REQUEST_SECONDS.count(method="GET", route="/sleep/{ms}", status=200) >= 3
@@ -0,0 +1,40 @@
+import pytest
+
+from .evaluator import parse_cards
+from .parsing import BET_OR_RAISE, CHECK_OR_CALL, FLOP, FOLD, UNKNOWN, HandParseError, parse_hand
+from .test_main import make_hand
+
+
+def test_parse_hand_decodes_seats_cards_and_actions():
+    payload = make_hand("5e4d3c2b-0000-4000-8000-000000000001", ["r100", "c", "F", "F[9hKs7c]", "zz"])
+    payload["smallBlind"] = "Bob"
+    payload["players"][0]["stack"] = 0  # Alice has no chips and is not seated
+
+    hand = parse_hand(payload)
+
+    assert [seat.name for seat in hand.seats] == ["Bob", "Carol"]
+    assert hand.seats[0].cards == tuple(parse_cards("7h2c"))
+    assert list(hand.ops) == [BET_OR_RAISE, CHECK_OR_CALL, FOLD, FLOP, UNKNOWN]
+    assert hand.args == (100, 0, 0, tuple(parse_cards("9hKs7c")), 0)
+
+
+@pytest.mark.parametrize(
+    "field, value, message",
+    [
+        ("cards", "AsXx", "player Alice cards invalid"),
+        ("cards", "AsKdQc", "player Alice cards invalid"),
+        ("actions", ["c", "F[9hKs]"], "action 1 invalid"),
+        ("actions", ["F[9hKs7c"], "action 0 invalid"),
+        ("communityCards", ["Zz"], "communityCards"),
+        ("smallBlind", "Nobody", "Small blind 'Nobody' not found"),
+    ],
+)
+def test_malformed_hands_are_rejected(field, value, message):
+    payload = make_hand("5e4d3c2b-0000-4000-8000-000000000002", ["f", "f"])
+    if field == "cards":
+        payload["players"][0]["cards"] = value
+    else:
+        payload[field] = value
+
+    with pytest.raises(HandParseError, match=message):
+        parse_hand(payload)
@@ -0,0 +1,211 @@
+import gzip
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from datetime import date, datetime, time, timezone
+
+import psycopg2
+import pytest
+
+from .bulk import import_hands
+from .conftest import needs_database
+from .handgen import generate_hand
+from .models_entity import HandEntity
+from .partitions import add_months, create_partitions, cutoff, list_partitions, maintain, prune_archives
+from .repository import DuplicateHandError, HandRepository, _page_query
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning")
+
+
+def test_retention_counts_whole_months_before_the_current_one(tmp_path):
+    today = date(2026, 3, 15)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert add_months(date(2025, 11, 1), 14) == date(2027, 1, 1)
+    assert cutoff(2, today) == date(2026, 1, 1)
+    assert cutoff(0, today) is None
+
+    for name in ("hands_p202511.ndjson.gz", "hands_p202512.ndjson.gz", "hands_p202601.ndjson.gz", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    assert prune_archives(str(tmp_path), 2, today) == [
+        str(tmp_path / "hands_p202511.ndjson.gz"),
+        str(tmp_path / "hands_p202512.ndjson.gz"),
+    ]
+    assert prune_archives(str(tmp_path), 0, today) == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["hands_p202601.ndjson.gz", "notes.txt"]
+
+
+@needs_database
+def test_old_months_are_archived_and_restored(scratch_schema, tmp_path):
+    dsn = scratch_schema()
+    rng = random.Random(21)
+    hands = [generate_hand(rng) for _ in range(30)]
+    repo = HandRepository(db_url=dsn)
+    repo.save_many(
+        [HandEntity(id=h.payload["id"], payload_json=h.payload, payoffs_json=h.payoffs)
+         for h in hands]
+    )
+    old = [h.payload["id"] for h in hands[:10]]
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT create_hands_partitions(0, '2025-01-01')")
+                # row movement into the January partition keeps the ids registered
+                cur.execute(
+                    "UPDATE hands SET created_at = '2025-01-15' WHERE id = ANY(%s::uuid[])", (old,)
+                )
+        before = player_totals(conn)
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        names = [p.name for p in list_partitions(conn)]
+        assert names[0] == "hands_p202501" and f"hands_p{this_month:%Y%m}" in names
+
+        result = maintain(conn, months_ahead=1, keep_months=1, archive_dir=str(tmp_path))
+        archived = {path: count for path, count in result["archived"]}
+        path = str(tmp_path / "hands_p202501.ndjson.gz")
+        assert archived[path] == 10
+        with gzip.open(path) as f:
+            assert sorted(json.loads(line)["id"] for line in f) == sorted(old)
+        assert len(list(repo.iter_all())) == 20
+        assert all(p.month >= add_months(this_month, -1) for p in list_partitions(conn))
+        # the totals only count the hands still stored
+        assert player_totals(conn) == recounted_totals(conn) != before
+
+        # a stored id is still refused while its month is kept
+        kept = hands[10]
+        with pytest.raises(DuplicateHandError):
+            repo.save(HandEntity(id=kept.payload["id"], payload_json=kept.payload, payoffs_json=kept.payoffs))
+
+        result = import_hands(conn, path)
+        assert result["inserted"] == 10
+        assert len(list(repo.iter_all())) == 30
+        assert repo.backfill_player_stats() == (10, sum(len(h.payload["players"]) for h in hands[:10]))
+        assert player_totals(conn) == before
+    finally:
+        conn.close()
+
+
+def player_totals(conn) -> dict:
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT player_id, hands, net, vpip_hands, pfr_hands, showdowns, showdowns_won"
+                " FROM player_stats"
+            )
+            return {row[0]: row[1:] for row in cur.fetchall()}
+
+
+def recounted_totals(conn) -> dict:
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT player_id, count(*)::int, sum(net),
+                       count(*) FILTER (WHERE vpip)::int, count(*) FILTER (WHERE pfr)::int,
+                       count(*) FILTER (WHERE showdown)::int, count(*) FILTER (WHERE won)::int
+                FROM hand_players GROUP BY player_id
+                """
+            )
+            return {row[0]: row[1:] for row in cur.fetchall()}
+
+
+def scanned_partitions(plan: dict) -> tuple[set[str], set[str]]:
+    """The partitions in an EXPLAIN ANALYZE plan, and those actually read."""
+    planned, read = set(), set()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        name = node.get("Relation Name", "")
+        if name.startswith("hands_p"):
+            planned.add(name)
+            if node.get("Actual Loops", 0) > 0:
+                read.add(name)
+        stack.extend(node.get("Plans", []))
+    return planned, read
+
+
+@needs_database
+def test_recent_pages_read_only_the_latest_partitions(scratch_schema):
+    dsn = scratch_schema()
+    rng = random.Random(24)
+    hands = [generate_hand(rng) for _ in range(120)]
+    HandRepository(db_url=dsn).save_many(
+        [HandEntity(id=h.payload["id"], payload_json=h.payload, payoffs_json=h.payoffs)
+         for h in hands]
+    )
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    months = [add_months(this_month, -k) for k in range(4)]  # newest first
+    conn = psycopg2.connect(dsn)
+    try:
+        create_partitions(conn, 1, since=months[-1])
+        with conn:
+            with conn.cursor() as cur:
+                # 30 hands on the second day of each of the last four months
+                for i, h in enumerate(hands):
+                    cur.execute(
+                        "UPDATE hands SET created_at = %s WHERE id = %s",
+                        (datetime.combine(months[i // 30].replace(day=2), time(0, i % 30), timezone.utc),
+                         h.payload["id"]),
+                    )
+                cur.execute("ANALYZE hands")
+
+        def explain(after=None):
+            sql, params = _page_query(after=after, limit=20, columns="id")
+            with conn:
+                with conn.cursor() as cur:
+                    # the plan of partitions too large to read whole
+                    cur.execute("SET LOCAL enable_seqscan = off")
+                    cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}", params)
+                    return scanned_partitions(cur.fetchone()[0][0]["Plan"])
+
+        names = [f"hands_p{m:%Y%m}" for m in months]
+
+        # first page: the ordered scan goes through the empty months ahead and
+        # stops in this one
+        planned, read = explain()
+        assert set(names) <= planned
+        assert names[0] in read and read.isdisjoint(names[1:])
+
+        # a page after a hand two months back leaves the newer months out of the plan
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT created_at, id::text FROM hands WHERE created_at < %s "
+                    "ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET 5",
+                    (months[1],),
+                )
+                cursor = cur.fetchone()
+        planned, read = explain(cursor)
+        assert planned == set(names[2:])
+        assert read == {names[2]}
+    finally:
+        conn.close()
+
+
+@needs_database
+def test_sessions_creating_the_same_partition_take_turns(scratch_schema):
+    dsn = scratch_schema()
+    first, second = psycopg2.connect(dsn), psycopg2.connect(dsn)
+    try:
+        with first.cursor() as cur:
+            # a month no worker has created yet, in a transaction left open
+            cur.execute("SELECT create_hands_partitions(0, '2024-06-01')")
+            assert len(cur.fetchall()) > 0
+        # other sessions still read and write hands meanwhile
+        reader = psycopg2.connect(dsn)
+        try:
+            with reader, reader.cursor() as cur:
+                cur.execute("SET LOCAL lock_timeout = '2s'")
+                cur.execute("SELECT count(*) FROM hands")
+                cur.execute("LOCK TABLE hands IN ROW EXCLUSIVE MODE")
+        finally:
+            reader.close()
+        with ThreadPoolExecutor(1) as pool:
+            waiting = pool.submit(create_partitions, second, 0, date(2024, 6, 1))
+            with pytest.raises(FuturesTimeout):
+                waiting.result(timeout=0.5)
+            first.commit()
+            assert waiting.result(timeout=10) == []
+        assert list_partitions(second)[0].name == "hands_p202406"
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,100 @@
+import random
+import psycopg2
+import pytest
+
+from .conftest import needs_database
+from .handgen import generate_hand
+from .models_entity import HandEntity
+from .player_stats import _pokerkit_trace, action_trace, hand_players
+from .parsing import parse_hand
+from .poker_service import compute_payoffs
+from .repository import HandRepository
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning")
+
+
+def make_hand(actions: list[str]) -> dict:
+    """Three-handed: Alice small blind, Bob big blind, Carol first to act."""
+    return {
+        "id": "5b0c9d1e-7a52-4c1f-8e3b-2d4f6a8c0e12",
+        "dealer": "Carol",
+        "smallBlind": "Alice",
+        "bigBlind": "Bob",
+        "players": [
+            {"id": "p1", "name": "Alice", "stack": 1000, "cards": "AsKd", "winnings": 0},
+            {"id": "p2", "name": "Bob", "stack": 1000, "cards": "7h2c", "winnings": 0},
+            {"id": "p3", "name": "Carol", "stack": 1000, "cards": "QsQd", "winnings": 0},
+        ],
+        "actions": actions,
+        "communityCards": [],
+        "finalPot": 0,
+    }
+
+
+def stored(payload: dict) -> HandEntity:
+    return HandEntity(id=payload["id"], payload_json=payload, payoffs_json=compute_payoffs(payload))
+
+
+def test_hand_players_counts_voluntary_chips_and_showdowns():
+    payload = make_hand(
+        ["c", "r120", "f", "c", "F[2c3d4h]", "x", "x", "T[9s]", "x", "x", "R[Jd]", "x", "x"]
+    )
+
+    players = {p.name: p for p in hand_players(stored(payload))}
+
+    assert [players[name].net for name in ("Alice", "Bob", "Carol")] == [-120, -40, 160]
+    assert (players["Alice"].vpip, players["Alice"].pfr) == (True, True)
+    assert (players["Bob"].vpip, players["Bob"].showdown) == (False, False)
+    assert (players["Carol"].vpip, players["Carol"].pfr) == (True, False)
+    assert players["Alice"].showdown and not players["Alice"].won
+    assert players["Carol"].showdown and players["Carol"].won
+
+
+def test_big_blind_check_is_not_voluntary():
+    payload = make_hand(["f", "c", "x", "F[2c3d4h]", "b40", "f"])
+
+    players = {p.name: p for p in hand_players(stored(payload))}
+
+    assert players["Alice"].vpip and not players["Bob"].vpip
+    assert not any(p.showdown or p.pfr for p in players.values())
+    assert hand_players(HandEntity(id="x", payload_json=payload, payoffs_json=None)) == []
+
+
+def test_trace_matches_pokerkit_on_generated_corpus():
+    rng = random.Random(4321)
+    for _ in range(500):
+        hand = generate_hand(rng, fold_p=0.4)
+        parsed = parse_hand(hand.payload)
+        assert action_trace(parsed) == _pokerkit_trace(parsed), hand.payload
+
+        entity = HandEntity(id=hand.payload["id"], payload_json=hand.payload, payoffs_json=hand.payoffs)
+        players = hand_players(entity)
+        assert sum(p.net for p in players) == 0
+        assert any(p.showdown for p in players) == hand.showdown
+
+
+@needs_database
+def test_backfill_restores_the_totals_of_saved_hands(scratch_schema):
+    dsn = scratch_schema()
+    rng = random.Random(12)
+    hands = [generate_hand(rng) for _ in range(20)]
+    repo = HandRepository(db_url=dsn)
+    repo.save_many(
+        [HandEntity(id=h.payload["id"], payload_json=h.payload, payoffs_json=h.payoffs)
+         for h in hands]
+    )
+    saved = {s.player_id: s for s in repo.list_player_stats(100)}
+    assert saved
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM hand_players")
+                cur.execute("DELETE FROM player_stats")
+    finally:
+        conn.close()
+    rows = sum(len(h.payload["players"]) for h in hands)
+    assert repo.backfill_player_stats(batch_size=7) == (20, rows)
+    assert {s.player_id: s for s in repo.list_player_stats(100)} == saved
+    assert repo.backfill_player_stats() == (0, 0)
@@ -0,0 +1,57 @@
+import pytest
+
+from . import preflop
+from .equity import calculate_equity
+from .evaluator import parse_cards
+
+
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("preflop") / "preflop.bin")
+    preflop.write_tables(path, samples=20000, matchups=[("AsKs", "QdQh"), ("7c7d", "8h9h")])
+    return preflop.PreflopTables(path)
+
+
+def test_starting_hand_classes():
+    assert preflop.hand_class(parse_cards("AsKs")) == "AKs"
+    assert preflop.hand_class(parse_cards("Kd As")) == "AKo"
+    assert preflop.hand_class(parse_cards("7c7h")) == "77"
+    indexes = {
+        preflop.class_index(a + b + kind)
+        for a in preflop.RANKS
+        for b in preflop.RANKS
+        for kind in ("s", "o")
+        if a != b
+    } | {preflop.class_index(r * 2) for r in preflop.RANKS}
+    assert indexes == set(range(169))
+    with pytest.raises(ValueError):
+        preflop.class_index("AK")
+
+
+def test_suit_isomorphic_matchups_share_one_entry(tables):
+    equity, tie = tables.heads_up(parse_cards("AsKs"), parse_cards("QdQh"))
+
+    # renamed suits
+    assert tables.heads_up(parse_cards("AhKh"), parse_cards("QcQs")) == (equity, tie)
+    # the other seat
+    swapped, swapped_tie = tables.heads_up(parse_cards("QdQh"), parse_cards("AsKs"))
+    assert swapped == pytest.approx(1 - equity, abs=1e-4)
+    assert swapped_tie == tie
+    # a different suit structure is a different matchup, not built here
+    assert tables.heads_up(parse_cards("AsKs"), parse_cards("QsQh")) is None
+    assert tables.versus_random("AKs", 1) is None
+
+
+def test_table_agrees_with_simulation(tables):
+    for hero, villain in (("AsKs", "QdQh"), ("7c7d", "8h9h")):
+        holes = [parse_cards(hero), parse_cards(villain)]
+        live = calculate_equity(holes, [], samples=100000, seed=11)
+        equity, _ = tables.heads_up(*holes)
+        assert equity == pytest.approx(live.equity[0], abs=0.015)
+
+
+def test_corrupt_table_is_rejected(tmp_path):
+    path = tmp_path / "preflop.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        preflop.PreflopTables(str(path))
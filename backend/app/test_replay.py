@@ -0,0 +1,97 @@
+import os
+import asyncio
+import pytest
+
+from . import metrics
+from .parsing import parse_hand
+from .replay import ReplayService, ReplayTimeoutError, ReplayWorkerCrashed
+from .test_main import make_hand
+
+
+def crash_once(payload: dict) -> dict:
+    # the first call kills its worker process; later calls succeed
+    flag = payload["flag"]
+    if not os.path.exists(flag):
+        open(flag, "w").close()
+        os._exit(1)
+    return {"ok": 1}
+
+
+def always_crash(payload: dict) -> dict:
+    os._exit(1)
+
+
+def sleepy(payload: dict) -> dict:
+    import time
+
+    time.sleep(payload["seconds"])
+    return {}
+
+
+def test_process_pool_replay_matches_inline():
+    hand = parse_hand(
+        make_hand("3f1e0d9c-0000-4000-8000-000000000001", ["r100", "c", "f", "F[9hKs7c]", "x", "b200", "f"])
+    )
+    service = ReplayService(workers=1)
+    service.start()
+    try:
+        pooled = asyncio.run(service.replay(hand))
+    finally:
+        service.shutdown()
+    inline = asyncio.run(ReplayService(workers=0).replay(hand))
+
+    assert pooled == inline == {"p1": -100, "p2": -40, "p3": 140}
+
+
+def test_replay_recovers_from_worker_crash(tmp_path):
+    service = ReplayService(workers=1, fn=crash_once)
+    service.start()
+    try:
+        assert asyncio.run(service.replay({"flag": str(tmp_path / "crashed")})) == {"ok": 1}
+        assert service.restarts == 1
+    finally:
+        service.shutdown()
+
+
+def test_replay_gives_up_when_the_hand_keeps_crashing():
+    service = ReplayService(workers=1, fn=always_crash)
+    service.start()
+    try:
+        with pytest.raises(ReplayWorkerCrashed):
+            asyncio.run(service.replay({"id": "boom"}))
+    finally:
+        service.shutdown()
+
+
+def test_replay_timeout():
+    service = ReplayService(workers=0, timeout=0.05, fn=sleepy)
+    with pytest.raises(ReplayTimeoutError):
+        asyncio.run(service.replay({"seconds": 0.5}))
+
+
+def test_timed_out_worker_is_replaced():
+    service = ReplayService(workers=1, timeout=3, fn=sleepy)
+    service.start()
+    try:
+        with pytest.raises(ReplayTimeoutError):
+            asyncio.run(service.replay({"seconds": 60}))
+        assert service.restarts == 1
+        # the only worker was stuck in the first replay: this one would time out too
+        assert asyncio.run(service.replay({"seconds": 0})) == {}
+    finally:
+        service.shutdown()
+
+
+def test_worker_metrics_reach_the_server_process():
+    hand = parse_hand(make_hand("3f1e0d9c-0000-4000-8000-000000000002", ["f", "zz", "f"]))
+    settled = metrics.REPLAY_SECONDS.count(path="settle")
+    unknown = metrics.UNKNOWN_ACTIONS.value()
+    service = ReplayService(workers=1)
+    service.start()
+    try:
+        assert asyncio.run(service.replay(hand)) == {"p1": -20, "p2": 20, "p3": 0}
+    finally:
+        service.shutdown()
+
+    assert metrics.REPLAY_SECONDS.count(path="settle") == settled + 1
+    assert metrics.UNKNOWN_ACTIONS.value() == unknown + 1
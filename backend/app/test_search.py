@@ -0,0 +1,186 @@
+import json
+import random
+import itertools
+from dataclasses import fields
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+import pytest
+
+from .conftest import needs_database
+from .fastjson import hand_record
+from .handgen import generate_hand
+from .models_entity import HandEntity
+from .partitions import create_partitions
+from .repository import HandRepository, _page_query
+from .search import HandFilter
+
+pytestmark = [needs_database, pytest.mark.filterwarnings("ignore::UserWarning")]
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def db(scratch_schema):
+    dsn = scratch_schema()
+    rng = random.Random(99)
+    generated = [generate_hand(rng) for _ in range(2000)]
+    repo = HandRepository(db_url=dsn)
+    repo.save_many(
+        [HandEntity(id=g.payload["id"], payload_json=g.payload, payoffs_json=g.payoffs)
+         for g in generated]
+    )
+    conn = psycopg2.connect(dsn)
+    create_partitions(conn, 0, since=START)
+    with conn:
+        with conn.cursor() as cur:
+            # one minute apart, so that created_at ranges select something
+            cur.execute(
+                """
+                UPDATE hands h SET created_at = %s + v.i * INTERVAL '1 minute'
+                FROM (SELECT id, row_number() OVER (ORDER BY id) AS i FROM hands) v
+                WHERE h.id = v.id
+                """,
+                (START,),
+            )
+            cur.execute("ANALYZE hands")
+    showdowns = {g.payload["id"]: g.showdown for g in generated}
+    try:
+        yield conn, repo, list(repo.iter_all()), showdowns
+    finally:
+        conn.close()
+
+
+def sample_filters(hands: list[HandEntity]) -> list[HandFilter]:
+    """Every single filter, every pair of them, and all of them at once."""
+    first = hands[0]
+    winner = next(pid for pid, payoff in first.payoffs_json.items() if payoff > 0)
+    values = {
+        "player": first.payload_json["players"][0]["name"],
+        "winner": winner,
+        "min_pot": 200,
+        "max_pot": 2000,
+        "since": START + timedelta(minutes=300),
+        "until": START + timedelta(minutes=1500),
+        "players": 3,
+        "showdown": True,
+    }
+    combos = [c for size in (1, 2, len(values)) for c in itertools.combinations(values, size)]
+    return [HandFilter(**{name: values[name] for name in combo}) for combo in combos]
+
+
+def matches(h: HandEntity, f: HandFilter, showdown: bool) -> bool:
+    players = h.payload_json["players"]
+    pot = h.payload_json["finalPot"]
+    return all(
+        [
+            f.player is None or any(f.player in (p["id"], p["name"]) for p in players),
+            f.winner is None or h.payoffs_json.get(f.winner, 0) > 0,
+            f.min_pot is None or pot >= f.min_pot,
+            f.max_pot is None or pot <= f.max_pot,
+            f.since is None or h.created_at >= f.since,
+            f.until is None or h.created_at < f.until,
+            f.players is None or len(players) == f.players,
+            f.showdown is None or showdown == f.showdown,
+        ]
+    )
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def test_every_filter_combination_uses_an_index(db):
+    conn, _, hands, _ = db
+    with conn:
+        with conn.cursor() as cur:
+            # asks whether an index can serve the query, whatever the table size
+            cur.execute("SET LOCAL enable_seqscan = off")
+            for f in sample_filters(hands):
+                query, params = _page_query(filters=f, limit=100)
+                cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+                nodes = list(plan_nodes(cur.fetchone()[0][0]["Plan"]))
+                # scans are of the monthly partitions (hands_pYYYYMM)
+                scans = [
+                    n["Node Type"] for n in nodes if n.get("Relation Name", "").startswith("hands_p")
+                ]
+                assert scans and "Seq Scan" not in scans, (f, scans)
+
+
+# the index each filter is meant to use (sql/migrations/004 and 006), and
+# what its condition refers to
+FILTER_INDEXES = {
+    "player": ("hands_players_idx", "payload -> 'players'"),
+    "winner": ("hands_winners_idx", "winners"),
+    "min_pot": ("hands_final_pot_idx", "final_pot"),
+    "max_pot": ("hands_final_pot_idx", "final_pot"),
+    "since": ("hands_created_at_id_idx", "created_at"),
+    "until": ("hands_created_at_id_idx", "created_at"),
+    "players": ("hands_player_count_created_at_id_idx", "player_count"),
+    "showdown": ("hands_showdown_created_at_id_idx", "showdown"),
+}
+
+
+def test_each_filter_uses_its_own_index(db):
+    conn, _, hands, _ = db
+    with conn:
+        with conn.cursor() as cur:
+            # the partitions' indexes are named after them: map them to hands'
+            cur.execute(
+                """
+                SELECT c.relname, p.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE c.relkind = 'i'
+                """
+            )
+            parents = dict(cur.fetchall())
+            cur.execute("SET LOCAL enable_seqscan = off")
+            for f in sample_filters(hands):
+                names = [field.name for field in fields(f) if getattr(f, field.name) is not None]
+                if len(names) != 1:
+                    continue
+                index, column = FILTER_INDEXES[names[0]]
+                # walking the created_at index and filtering is the best plan
+                # for a common value; with index scans off, only bitmap scans
+                # are left, and they use the index that serves the condition
+                cur.execute("SET LOCAL enable_indexscan = %s", (column == "created_at",))
+                query, params = _page_query(filters=f, limit=100)
+                cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+                used = [
+                    n["Index Cond"]
+                    for n in plan_nodes(cur.fetchone()[0][0]["Plan"])
+                    if n["Node Type"] in ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+                    and parents.get(n["Index Name"]) == index
+                    and "Index Cond" in n
+                ]
+                assert used and all(column in cond for cond in used), (f, used)
+
+
+def test_filters_match_payloads(db):
+    _, repo, hands, showdowns = db
+    for f in sample_filters(hands):
+        expected = [h.id for h in hands if matches(h, f, showdowns[str(h.id)])]
+        assert [h.id for h in repo.list_page(len(hands), filters=f)] == expected, f
+
+
+def test_json_records_match_decoded_hands(db):
+    _, repo, hands, _ = db
+    f = HandFilter(players=3)
+    decoded = repo.list_page(50, filters=f)
+    rows = repo.list_page_json(50, filters=f)
+    assert [(hand_id, created_at) for hand_id, created_at, _ in rows] == [
+        (h.id, h.created_at) for h in decoded
+    ]
+    for h, (_, _, record) in zip(decoded, rows):
+        assert isinstance(record, bytes)
+        parsed = json.loads(record)
+        assert datetime.fromisoformat(parsed.pop("created_at")) == h.created_at
+        expected = hand_record(h)
+        del expected["created_at"]
+        assert parsed == expected
+    assert repo.get_json(str(decoded[0].id)) == rows[0][2]
+    assert list(repo.iter_all_json(limit=50, filters=f)) == [record for _, _, record in rows]
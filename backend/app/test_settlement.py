@@ -0,0 +1,99 @@
+import random
+import pytest
+
+from .handgen import generate_hand
+from .poker_service import (
+    BIG_BLIND_AMOUNT,
+    SMALL_BLIND_AMOUNT,
+    compute_payoffs,
+    compute_payoffs_using_pokerkit,
+    seat_players,
+)
+from .settlement import settle_hand
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning")
+
+
+def fast_path(payload: dict) -> dict | None:
+    seats = seat_players(payload)
+    payoffs = settle_hand(
+        [s["stack"] for s in seats],
+        [s["cards"] for s in seats],
+        payload["actions"],
+        SMALL_BLIND_AMOUNT,
+        BIG_BLIND_AMOUNT,
+    )
+    if payoffs is None:
+        return None
+    return {s["id"]: p for s, p in zip(seats, payoffs)}
+
+
+def test_fast_path_matches_pokerkit_on_generated_corpus():
+    rng = random.Random(20240601)
+    fold_outs = settled = showdowns = settled_showdowns = 0
+
+    for _ in range(2000):
+        # hand.payoffs come from the pokerkit state that generated the hand
+        hand = generate_hand(rng, fold_p=0.6)
+        fast = fast_path(hand.payload)
+
+        if fast is not None:
+            assert fast == hand.payoffs, hand.payload
+        if hand.showdown:
+            showdowns += 1
+            settled_showdowns += fast is not None
+        else:
+            settled += fast is not None
+            fold_outs += 1
+            assert compute_payoffs_using_pokerkit(hand.payload) == hand.payoffs
+            assert compute_payoffs(hand.payload) == hand.payoffs
+
+    # only short-stacked blinds, short all-in raises and uneven splits fall
+    # back to pokerkit
+    assert settled >= 0.9 * fold_outs
+    assert settled_showdowns >= 0.8 * showdowns
+
+
+@pytest.mark.parametrize(
+    "actions",
+    [
+        ["x"],  # preflop is not over after one check
+        ["c", "c", "x", "F[2d3d4d]", "x", "x", "x", "T[5d]", "x", "x", "x"],  # no river yet
+        ["f", "f", "x"],  # action after the hand ended
+        ["c", "c", "f"],  # big blind folds with nothing to call
+        ["r60", "f", "f"],  # raise below the minimum
+        ["c", "c", "x", "T[2d]", "f", "f"],  # turn card dealt on the flop
+        ["c", "c", "x", "F[2d3d]", "f", "f"],  # short flop
+    ],
+)
+def test_fast_path_declines_hands_it_cannot_settle(actions):
+    assert settle_hand([1000] * 3, ["AsKd", "7h2c", "QsQd"], actions, 20, 40) is None
+
+
+def test_fast_path_settles_heads_up_fold_out():
+    # heads-up pokerkit seats the big blind first; the button folds its small blind
+    assert settle_hand([1000, 1000], ["AsKd", "7h2c"], ["f"], 20, 40) == [20, -20]
+
+
+def test_fast_path_awards_side_pots_at_showdown():
+    # seat 2 is all-in for 300 with the best hand and wins the main pot;
+    # seat 0 beats seat 1 for the side pot
+    actions = ["r300", "r1000", "c", "F[2c7d9h]", "T[Js]", "R[4c]"]
+    payoffs = settle_hand([1000, 1000, 300], ["KsKd", "QsQd", "AsAd"], actions, 20, 40)
+    assert payoffs == [400, -1000, 600]
+
+
+def check_down(players: int) -> list[str]:
+    checks = ["x"] * players
+    return ["F[AcKdQh]"] + checks + ["T[Js]"] + checks + ["R[Tc]"] + checks
+
+
+def test_fast_path_splits_pots_evenly_or_declines():
+    holes = ["2c3d", "4h5s", "6h7s", "8d9c"]  # everyone plays the broadway board
+    # everyone limps; 160 splits four ways
+    actions = ["c", "c", "c", "x"] + check_down(4)
+    assert settle_hand([1000] * 4, holes, actions, 20, 40) == [0, 0, 0, 0]
+    # the small blind folds and three players split 20 + 3 * 40 = 140; the
+    # odd chip follows pokerkit's own pot bookkeeping, so pokerkit settles it
+    actions = ["c", "c", "f", "x"] + check_down(3)
+    assert settle_hand([1000] * 4, holes, actions, 20, 40) is None
@@ -0,0 +1,122 @@
+import pickle
+
+import pytest
+from fastapi.testclient import TestClient
+
+from .benchmark import MemoryHandRepository
+from .main import app, get_repository, get_whatif_snapshots
+from .models_entity import HandEntity
+from .parsing import parse_hand
+from .poker_service import compute_payoffs_using_pokerkit
+from .test_main import make_hand
+from .whatif import SnapshotTrie
+
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning")
+
+client = TestClient(app)
+
+HAND_ID = "5e4d3c2b-0000-4000-8000-0000000000a1"
+FLOP = ["c", "c", "x", "F[9hKs7c]"]
+ORIGINAL = FLOP + ["x", "x", "x", "T[2d]", "x", "x", "x", "R[3s]", "x", "x", "x"]
+
+
+@pytest.fixture
+def whatif_app():
+    repo, trie = MemoryHandRepository(), SnapshotTrie()
+    payload = make_hand(HAND_ID, ORIGINAL)
+    repo.save(HandEntity(HAND_ID, payload, compute_payoffs_using_pokerkit(payload)))
+    previous = app.dependency_overrides.get(get_repository)
+    app.dependency_overrides[get_repository] = lambda: repo
+    app.dependency_overrides[get_whatif_snapshots] = lambda: trie
+    try:
+        yield trie
+    finally:
+        del app.dependency_overrides[get_whatif_snapshots]
+        if previous is None:
+            del app.dependency_overrides[get_repository]
+        else:
+            app.dependency_overrides[get_repository] = previous
+
+
+def test_variants_branch_off_the_flop_snapshot(whatif_app):
+    variants = [
+        ["b100", "f", "c", "T[2d]", "x", "x", "R[3s]", "x", "x"],
+        ["b100", "f", "f"],
+        ORIGINAL[len(FLOP) :],
+    ]
+    replies = []
+    for suffix in variants:
+        response = client.post(f"/hands/{HAND_ID}/whatif", json={"index": len(FLOP), "actions": suffix})
+        assert response.status_code == 200
+        reply = response.json()
+        assert reply["complete"]
+        assert reply["payoffs"] == compute_payoffs_using_pokerkit(make_hand(HAND_ID, FLOP + suffix))
+        replies.append(reply)
+
+    # the first variant replays from the dealt hole cards, the others from the flop
+    assert [r["restored"] for r in replies] == [0, len(FLOP), len(FLOP)]
+    assert replies[1]["replayed"] == 3
+    assert replies[2]["payoffs"] == replies[2]["original_payoffs"]
+
+    partial = client.post(f"/hands/{HAND_ID}/whatif", json={"index": 2, "actions": []}).json()
+    assert not partial["complete"] and partial["payoffs"] is None and partial["actor"] == "p2"
+
+    assert client.post(f"/hands/{HAND_ID}/whatif", json={"index": 99}).status_code == 400
+    assert client.post(f"/hands/{HAND_ID}/whatif", json={"index": 4, "actions": ["zz"]}).status_code == 400
+    assert client.post(f"/hands/{HAND_ID}/whatif", json={"index": 4, "actions": ["R[3s]"]}).status_code == 400
+    missing = "5e4d3c2b-0000-4000-8000-0000000000a2"
+    assert client.post(f"/hands/{missing}/whatif", json={"index": 0}).status_code == 404
+
+
+def test_later_variants_skip_the_database(whatif_app):
+    first = client.post(f"/hands/{HAND_ID}/whatif", json={"index": len(FLOP), "actions": ["b100", "f", "f"]})
+    hand, payoffs = whatif_app.hand(HAND_ID)
+    assert hand.actions == tuple(ORIGINAL) and payoffs == first.json()["original_payoffs"]
+
+    app.dependency_overrides[get_repository]()._hands.clear()
+    again = client.post(f"/hands/{HAND_ID}/whatif", json={"index": len(FLOP), "actions": ["x", "x", "x"]})
+    assert again.status_code == 200
+    assert again.json()["restored"] == len(FLOP) and again.json()["original_payoffs"] == payoffs
+
+
+def test_snapshot_trie_evicts_least_recently_used_and_prunes():
+    trie = SnapshotTrie(max_bytes=250)
+    trie.put("a", [], b"x" * 100)
+    trie.put("a", [(1, 0), (3, (1, 2, 3))], b"y" * 100)
+    assert trie.nearest("a", [(1, 0), (3, (1, 2, 3)), (2, 80)]) == (2, b"y" * 100)
+
+    trie.put("b", [], b"z" * 100)  # over budget: evicts the root of "a", used least recently
+    assert trie.nearest("a", [(1, 0)]) == (0, None)
+    assert trie.has("a", [(1, 0), (3, (1, 2, 3))])
+
+    trie.put("c", [], b"w" * 100)  # evicts the flop of "a", and with it all of "a"
+    assert trie.stats() == {
+        "hands": 2,
+        "snapshots": 2,
+        "bytes": 200,
+        "max_bytes": 250,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 2,
+    }
+
+
+def test_snapshot_trie_counts_the_hands_it_keeps():
+    payload = make_hand(HAND_ID, ORIGINAL)
+    hand = (parse_hand(payload), compute_payoffs_using_pokerkit(payload))
+    size = len(pickle.dumps(hand, pickle.HIGHEST_PROTOCOL))
+    trie = SnapshotTrie(max_bytes=size + 250)
+    trie.put("a", [], b"x" * 100, hand=hand)
+    assert trie.bytes == size + 100
+    trie.put("a", [], b"x" * 100, hand=hand)  # replaced, not counted twice
+    assert trie.bytes == size + 100
+
+    trie.put("b", [], b"y" * 100)
+    trie.put("c", [], b"z" * 100)  # over budget: evicts "a" along with its hand
+    assert trie.hand("a") is None
+    assert trie.bytes == 200
+
+    # a hand that cannot fit with its snapshot is not kept
+    small = SnapshotTrie(max_bytes=size)
+    small.put("a", [], b"x", hand=hand)
+    assert small.hand("a") is None and small.bytes == 0
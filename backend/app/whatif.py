@@ -0,0 +1,244 @@
+# app/whatif.py
+"""
+What-if replays of stored hands (POST /hands/{id}/whatif in app/main.py):
+keep the first ``index`` actions of a hand, replace the rest with a
+different suffix and see how the hand ends.
+
+Replaying a six-handed hand from the start costs about as much as a
+submission. Instead, pokerkit states are snapshotted (pickled) after the
+hole cards are dealt and after every board action, and kept in a trie
+keyed by hand id and then by action prefix. A variant restores the deepest
+snapshot on its own prefix and replays only what comes after it,
+snapshotting the streets it deals on the way. The first variant of a hand
+finds only the hole cards snapshot it takes itself, so it replays its whole
+line; later ones branch off the streets dealt by earlier variants, which
+costs the replayed suffix plus one unpickle (about 0.3 ms). The root of a
+hand also keeps its ParsedHand and stored payoffs, so later variants skip
+the database read and parse_hand as well.
+
+Snapshots are about 5 KB each. The trie holds at most WHATIF_CACHE_BYTES of
+them, together with the hands kept at the roots (counted at their pickled
+size), and evicts the least recently used snapshot first, pruning the
+branches left without snapshots; a hand whose last snapshot goes is
+forgotten entirely.
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from .parsing import BOARD_OPS, UNKNOWN, ParsedHand, tokenize_action
+from .poker_service import POKERKIT_CARDS, apply_op, new_pokerkit_state
+
+
+class WhatIfError(ValueError):
+    """Raised for a variant that cannot be played; the message is meant for the client."""
+
+
+class _Node:
+    __slots__ = ("parent", "token", "children", "snapshot", "hand", "hand_bytes")
+
+    def __init__(self, parent: "_Node | None", token):
+        self.parent = parent
+        self.token = token
+        self.children: dict = {}
+        self.snapshot: bytes | None = None
+        # roots only: the stored hand and its payoffs
+        self.hand: tuple[ParsedHand, dict | None] | None = None
+        self.hand_bytes = 0
+
+
+class SnapshotTrie:
+    """
+    Pickled pokerkit states by hand id and action prefix, sharing prefixes.
+
+    Args:
+        max_bytes: Most bytes of snapshots and root hands held at once.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._roots: dict[str, _Node] = {}
+        # nodes holding a snapshot, least recently used first
+        self._lru: OrderedDict[_Node, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "SnapshotTrie":
+        return cls(max_bytes=int(os.getenv("WHATIF_CACHE_BYTES", str(64 * 1024 * 1024))))
+
+    def nearest(self, key: str, tokens: list) -> tuple[int, bytes | None]:
+        """The length of the longest prefix of ``tokens`` with a snapshot, and that snapshot."""
+        with self._lock:
+            node = self._roots.get(key)
+            depth, found = 0, None
+            for i in range(len(tokens) + 1):
+                if node is None:
+                    break
+                if node.snapshot is not None:
+                    depth, found = i, node
+                if i < len(tokens):
+                    node = node.children.get(tokens[i])
+            if found is None:
+                self.misses += 1
+                return 0, None
+            self.hits += 1
+            self._lru.move_to_end(found)
+            return depth, found.snapshot
+
+    def hand(self, key: str) -> tuple[ParsedHand, dict | None] | None:
+        """The ParsedHand and stored payoffs kept with the snapshots of ``key``, if any."""
+        with self._lock:
+            root = self._roots.get(key)
+            return root.hand if root is not None else None
+
+    def has(self, key: str, prefix: list) -> bool:
+        with self._lock:
+            node = self._roots.get(key)
+            for token in prefix:
+                if node is None:
+                    return False
+                node = node.children.get(token)
+            return node is not None and node.snapshot is not None
+
+    def put(
+        self,
+        key: str,
+        prefix: list,
+        snapshot: bytes,
+        hand: tuple[ParsedHand, dict | None] | None = None,
+    ):
+        """Stores ``snapshot`` under ``prefix``, and ``hand`` (see hand()) at the root when given."""
+        hand_bytes = len(_snapshot(hand)) if hand is not None else 0
+        if len(snapshot) + hand_bytes > self.max_bytes:
+            return
+        with self._lock:
+            node = self._roots.get(key)
+            if node is None:
+                node = self._roots[key] = _Node(None, key)
+            if hand is not None:
+                self.bytes += hand_bytes - node.hand_bytes
+                node.hand, node.hand_bytes = hand, hand_bytes
+            for token in prefix:
+                child = node.children.get(token)
+                if child is None:
+                    child = node.children[token] = _Node(node, token)
+                node = child
+            if node.snapshot is not None:
+                self.bytes -= len(node.snapshot)
+            node.snapshot = snapshot
+            self.bytes += len(snapshot)
+            self._lru[node] = None
+            self._lru.move_to_end(node)
+            while self.bytes > self.max_bytes:
+                oldest, _ = self._lru.popitem(last=False)
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, node: _Node):
+        self.bytes -= len(node.snapshot)
+        node.snapshot = None
+        # prune the branch up to the nearest node still in use
+        while not node.children and node.snapshot is None:
+            parent = node.parent
+            if parent is None:
+                self.bytes -= node.hand_bytes
+                del self._roots[node.token]
+                break
+            del parent.children[node.token]
+            node = parent
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hands": len(self._roots),
+                "snapshots": len(self._lru),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _snapshot(state) -> bytes:
+    return pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+
+
+def what_if(
+    key: str,
+    hand: ParsedHand,
+    index: int,
+    suffix: list[str],
+    trie: SnapshotTrie,
+    payoffs: dict | None = None,
+) -> dict:
+    """
+    Plays the first ``index`` actions of a stored hand followed by ``suffix``.
+
+    Args:
+        key: The normalized hand id the trie is keyed by.
+        hand: The stored hand.
+        index: How many of its actions to keep.
+        suffix: Payload actions played instead of the rest.
+        payoffs: The stored payoffs, kept with ``hand`` in the trie (see
+            SnapshotTrie.hand) when it snapshots the hole cards.
+
+    Returns:
+        The variant actions, whether the hand is over and its payoffs (None
+        while it is not), how many actions came from a snapshot and how
+        many were replayed.
+
+    Raises:
+        WhatIfError: If ``index`` is out of range or an action is malformed
+            or illegal.
+    """
+    if not 0 <= index <= len(hand.ops):
+        raise WhatIfError(f"index must be between 0 and {len(hand.ops)}")
+    tokens = list(zip(hand.ops[:index], hand.args[:index]))
+    for i, action in enumerate(suffix, index):
+        try:
+            op, arg = tokenize_action(action)
+        except ValueError as e:
+            raise WhatIfError(f"action {i} invalid: {e}")
+        if op == UNKNOWN:
+            raise WhatIfError(f"action {i} invalid: unknown action {action!r}")
+        tokens.append((op, arg))
+    actions = list(hand.actions[:index]) + list(suffix)
+
+    depth, snapshot = trie.nearest(key, tokens)
+    if snapshot is not None:
+        state = pickle.loads(snapshot)
+    else:
+        state = new_pokerkit_state([seat.stack for seat in hand.seats])
+        for seat in hand.seats:
+            state.deal_hole([POKERKIT_CARDS[c] for c in seat.cards])
+        trie.put(key, [], _snapshot(state), hand=(hand, payoffs))
+
+    for i in range(depth, len(tokens)):
+        op, arg = tokens[i]
+        try:
+            apply_op(state, op, arg, actions[i], i)
+        except Exception as e:
+            raise WhatIfError(f"action {i} ({actions[i]!r}) cannot be played: {e}")
+        if op in BOARD_OPS and not trie.has(key, tokens[: i + 1]):
+            trie.put(key, tokens[: i + 1], _snapshot(state))
+
+    complete = not state.status
+    actor = state.actor_index
+    return {
+        "actions": actions,
+        "complete": complete,
+        "actor": hand.seats[actor].id if actor is not None else None,
+        "payoffs": (
+            {seat.id: payoff for seat, payoff in zip(hand.seats, state.payoffs)}
+            if complete
+            else None
+        ),
+        "restored": depth,
+        "replayed": len(tokens) - depth,
+    }
@@ -0,0 +1,4 @@
+-- sql/migrations/001_hands_created_at_id_idx.sql
+-- Backs keyset pagination of GET /hands: ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS hands_created_at_id_idx
+  ON hands (created_at DESC, id DESC);
@@ -0,0 +1,4 @@
+-- content hash of the submitted payload (app/idempotency.py), used to tell
+-- a client retry from a different hand reusing an id; NULL for hands saved
+-- before this column existed, whose hash is computed from payload instead
+ALTER TABLE hands ADD COLUMN IF NOT EXISTS content_hash TEXT;
@@ -0,0 +1,34 @@
+-- sql/migrations/003_player_stats.sql
+-- One row per seated player of every stored hand, written in the same
+-- transaction as the hand (app/player_stats.py); backs GET /players/{id}/stats
+CREATE TABLE IF NOT EXISTS hand_players (
+  hand_id UUID NOT NULL REFERENCES hands (id) ON DELETE CASCADE,
+  player_id TEXT NOT NULL,
+  name TEXT NOT NULL,
+  seat SMALLINT NOT NULL,
+  net INTEGER NOT NULL,
+  vpip BOOLEAN NOT NULL,
+  pfr BOOLEAN NOT NULL,
+  showdown BOOLEAN NOT NULL,
+  won BOOLEAN NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (hand_id, player_id)
+);
+CREATE INDEX IF NOT EXISTS hand_players_player_id_created_at_idx
+  ON hand_players (player_id, created_at DESC);
+
+-- running totals per player, incremented with every stored hand
+CREATE TABLE IF NOT EXISTS player_stats (
+  player_id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  hands INTEGER NOT NULL,
+  net BIGINT NOT NULL,
+  vpip_hands INTEGER NOT NULL,
+  pfr_hands INTEGER NOT NULL,
+  showdowns INTEGER NOT NULL,
+  showdowns_won INTEGER NOT NULL,
+  last_hand_at TIMESTAMPTZ NOT NULL
+);
+-- GET /players lists the biggest winners first
+CREATE INDEX IF NOT EXISTS player_stats_net_idx
+  ON player_stats (net DESC, player_id);
@@ -0,0 +1,33 @@
+-- sql/migrations/004_hands_search.sql
+-- Filters of GET /hands (app/search.py). The generated columns are derived
+-- from the stored JSON, so they can never disagree with it; adding them
+-- rewrites the table once.
+ALTER TABLE hands
+  ADD COLUMN IF NOT EXISTS final_pot BIGINT
+    GENERATED ALWAYS AS ((payload->>'finalPot')::numeric::bigint) STORED,
+  ADD COLUMN IF NOT EXISTS player_count SMALLINT
+    GENERATED ALWAYS AS (jsonb_array_length(payload->'players')) STORED,
+  -- two or more of the seated players (those with chips) never folded
+  ADD COLUMN IF NOT EXISTS showdown BOOLEAN
+    GENERATED ALWAYS AS (
+      jsonb_array_length(jsonb_path_query_array(payload, '$.players[*] ? (@.stack > 0)'))
+      - jsonb_array_length(jsonb_path_query_array(payload, '$.actions[*] ? (@ == "f" || @ == "F")'))
+      >= 2
+    ) STORED,
+  -- ids of the players who finished ahead, e.g. ["p1"]
+  ADD COLUMN IF NOT EXISTS winners JSONB
+    GENERATED ALWAYS AS (jsonb_path_query_array(payoffs, '$.keyvalue() ? (@.value > 0).key')) STORED;
+
+-- player=<id or name>: payload->'players' @> '[{"id": ...}]'
+CREATE INDEX IF NOT EXISTS hands_players_idx
+  ON hands USING GIN ((payload->'players') jsonb_path_ops);
+-- winner=<id>: winners @> '["..."]'
+CREATE INDEX IF NOT EXISTS hands_winners_idx
+  ON hands USING GIN (winners jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS hands_final_pot_idx
+  ON hands (final_pot);
+-- equality filters keep the keyset order, so a page is a single range scan
+CREATE INDEX IF NOT EXISTS hands_player_count_created_at_id_idx
+  ON hands (player_count, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS hands_showdown_created_at_id_idx
+  ON hands (showdown, created_at DESC, id DESC);
@@ -0,0 +1,5 @@
+-- sql/migrations/005_hands_payload_bin.sql
+-- payload and payoffs in the compact binary form of app/codec.py, written on
+-- insert and served as application/x-poker-hand without re-encoding; NULL
+-- for hands stored before this column existed, which are encoded on read
+ALTER TABLE hands ADD COLUMN IF NOT EXISTS payload_bin BYTEA;
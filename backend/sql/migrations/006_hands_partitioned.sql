@@ -0,0 +1,125 @@
+-- sql/migrations/006_hands_partitioned.sql
+-- hands becomes a table partitioned by month of created_at: hands_pYYYYMM
+-- holds the hands created in that month (UTC). Listings read newest first,
+-- so a page only scans the latest partitions, and old months are archived
+-- and dropped as a whole by python -m app.partitions, which also creates
+-- the partitions of the coming months ahead of time.
+--
+-- A partitioned table cannot enforce a unique id on its own (its primary key
+-- must include created_at), so hand_ids keeps every stored id. A trigger
+-- registers each new hand there and skips, as ON CONFLICT DO NOTHING would,
+-- a hand whose id is already stored; hand_players now references hand_ids
+-- and loses its rows when a month is archived.
+
+CREATE TABLE hand_ids (id UUID PRIMARY KEY);
+INSERT INTO hand_ids (id) SELECT id FROM hands;
+
+ALTER TABLE hand_players DROP CONSTRAINT IF EXISTS hand_players_hand_id_fkey;
+ALTER TABLE hand_players
+  ADD CONSTRAINT hand_players_hand_id_fkey
+  FOREIGN KEY (hand_id) REFERENCES hand_ids (id) ON DELETE CASCADE;
+
+ALTER TABLE hands RENAME TO hands_unpartitioned;
+ALTER TABLE hands_unpartitioned RENAME CONSTRAINT hands_pkey TO hands_unpartitioned_pkey;
+
+-- the columns of init.sql and migrations 002-005, in the same order
+CREATE TABLE hands (
+  id UUID NOT NULL,
+  payload JSONB NOT NULL,
+  payoffs JSONB,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  content_hash TEXT,
+  final_pot BIGINT
+    GENERATED ALWAYS AS ((payload->>'finalPot')::numeric::bigint) STORED,
+  player_count SMALLINT
+    GENERATED ALWAYS AS (jsonb_array_length(payload->'players')) STORED,
+  showdown BOOLEAN
+    GENERATED ALWAYS AS (
+      jsonb_array_length(jsonb_path_query_array(payload, '$.players[*] ? (@.stack > 0)'))
+      - jsonb_array_length(jsonb_path_query_array(payload, '$.actions[*] ? (@ == "f" || @ == "F")'))
+      >= 2
+    ) STORED,
+  winners JSONB
+    GENERATED ALWAYS AS (jsonb_path_query_array(payoffs, '$.keyvalue() ? (@.value > 0).key')) STORED,
+  payload_bin BYTEA,
+  CONSTRAINT hands_pkey PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Creates the missing monthly partitions from the month of ``since`` (this
+-- month when NULL) through ``months_ahead`` months after this one; returns
+-- the names of those created. A partition is created as a table of its own
+-- and then attached, which, unlike CREATE TABLE ... PARTITION OF, leaves
+-- inserts and reads of hands running (SHARE UPDATE EXCLUSIVE rather than
+-- ACCESS EXCLUSIVE). Sessions creating partitions take turns on that same
+-- lock, so uvicorn workers starting together after a month rollover do not
+-- both create the same one.
+CREATE FUNCTION create_hands_partitions(months_ahead INTEGER, since TIMESTAMPTZ DEFAULT NULL)
+RETURNS SETOF TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+  month_start TIMESTAMP := date_trunc('month', LEAST(COALESCE(since, NOW()), NOW()) AT TIME ZONE 'UTC');
+  last_month TIMESTAMP := date_trunc('month', NOW() AT TIME ZONE 'UTC')
+    + make_interval(months => months_ahead);
+  partition_name TEXT;
+BEGIN
+  WHILE month_start <= last_month LOOP
+    partition_name := 'hands_p' || to_char(month_start, 'YYYYMM');
+    IF to_regclass(quote_ident(partition_name)) IS NULL THEN
+      -- a relation lock, unlike an advisory one, also refreshes the catalog
+      -- lookups below once granted
+      LOCK TABLE hands IN SHARE UPDATE EXCLUSIVE MODE;
+    END IF;
+    -- looked up again: another session may have created it while this one waited
+    IF to_regclass(quote_ident(partition_name)) IS NULL THEN
+      -- the generated columns, primary key and indexes of hands; ATTACH
+      -- adopts the indexes and adds the trigger
+      EXECUTE format('CREATE TABLE %I (LIKE hands INCLUDING ALL)', partition_name);
+      EXECUTE format(
+        'ALTER TABLE hands ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        month_start AT TIME ZONE 'UTC',
+        (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'
+      );
+      RETURN NEXT partition_name;
+    END IF;
+    month_start := month_start + INTERVAL '1 month';
+  END LOOP;
+END
+$$;
+
+SELECT create_hands_partitions(3, (SELECT min(created_at) FROM hands_unpartitioned));
+
+INSERT INTO hands (id, payload, payoffs, created_at, content_hash, payload_bin)
+SELECT id, payload, payoffs, COALESCE(created_at, NOW()), content_hash, payload_bin
+FROM hands_unpartitioned;
+
+DROP TABLE hands_unpartitioned;
+
+-- the indexes of migrations 001 and 004, now built on every partition
+CREATE INDEX hands_created_at_id_idx ON hands (created_at DESC, id DESC);
+CREATE INDEX hands_players_idx ON hands USING GIN ((payload->'players') jsonb_path_ops);
+CREATE INDEX hands_winners_idx ON hands USING GIN (winners jsonb_path_ops);
+CREATE INDEX hands_final_pot_idx ON hands (final_pot);
+CREATE INDEX hands_player_count_created_at_id_idx ON hands (player_count, created_at DESC, id DESC);
+CREATE INDEX hands_showdown_created_at_id_idx ON hands (showdown, created_at DESC, id DESC);
+
+CREATE FUNCTION hands_register_id() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO hand_ids (id) VALUES (NEW.id) ON CONFLICT (id) DO NOTHING;
+  IF FOUND THEN
+    RETURN NEW;
+  END IF;
+  -- the id is registered: skip the hand if it is stored, but not when this
+  -- is the stored row itself moving to another partition (an UPDATE of
+  -- created_at), which has left its old partition already
+  IF EXISTS (SELECT 1 FROM hands WHERE id = NEW.id) THEN
+    RETURN NULL;
+  END IF;
+  RETURN NEW;
+END
+$$;
+
+CREATE TRIGGER hands_register_id
+  BEFORE INSERT ON hands
+  FOR EACH ROW EXECUTE FUNCTION hands_register_id();